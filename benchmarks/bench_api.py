@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+วัดเวลาและจำนวน query ของเส้นทางหลักของ API บนชุดข้อมูลจำลองใน SQLite แยกไฟล์
+
+ชุดข้อมูลถูกสร้างครั้งแรก (หรือเมื่อพารามิเตอร์เปลี่ยน / ข้อมูลเก่าเกิน --max-age-hours)
+แล้วใช้ซ้ำในรอบถัดไป ผลลัพธ์ถูกเทียบกับ baseline ที่บันทึกไว้:
+จำนวน query ที่เพิ่มขึ้น หรือเวลา (median) ที่ช้ากว่า baseline เกิน --time-tolerance
+ถือเป็น regression และจบด้วย exit code 1
+
+วิธีใช้:
+    python benchmarks/bench_api.py                          # เทียบกับ benchmarks/baseline.json
+    python benchmarks/bench_api.py --update-baseline        # บันทึกผลรอบนี้เป็น baseline
+    python benchmarks/bench_api.py --devices 1000 --readings 1000000 --output results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.bench_settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from asgiref.sync import async_to_sync  # noqa: E402
+from asgiref.testing import ApplicationCommunicator  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.core.signals import request_finished, request_started  # noqa: E402
+from django.db import close_old_connections, connection, reset_queries  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from sensors.models import Device, SensorType  # noqa: E402
+from sensors.synthetic import PROFILES  # noqa: E402
+
+BENCH_USER = 'bench'
+
+
+def meta_path():
+    return settings.DATABASES['default']['NAME'] + '.meta.json'
+
+
+def load_meta():
+    try:
+        with open(meta_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def seed(dataset):
+    """สร้างชุดข้อมูลจำลองด้วย seed_sensor_data: ทุกอุปกรณ์มีข้อมูลทุกประเภทเซ็นเซอร์
+    ห่างเท่า ๆ กันตลอด dataset['days'] วัน (ไม่มีช่วงขาดข้อมูล เพื่อให้จำนวนแถวคงที่)
+    """
+    per_series = max(1, dataset['readings'] // (dataset['devices'] * dataset['sensor_types']))
+    call_command(
+        'seed_sensor_data',
+        owner=BENCH_USER,
+        name_prefix='bench',
+        devices=dataset['devices'],
+        sensor_types=','.join(list(PROFILES)[:dataset['sensor_types']]),
+        days=dataset['days'],
+        interval=dataset['days'] * 86400 / per_series,
+        gap_rate=0,
+        seed=42,
+        stderr=sys.stderr,
+        stdout=sys.stderr,
+    )
+    return get_user_model().objects.get(username=BENCH_USER)
+
+
+def prepare(args):
+    """คืนผู้ใช้ของชุดข้อมูล สร้างฐานข้อมูลใหม่ถ้าจำเป็น"""
+    dataset = {
+        'devices': args.devices,
+        'sensor_types': args.sensor_types,
+        'readings': args.readings,
+        'days': args.days,
+    }
+    meta = load_meta()
+    fresh = (
+        not args.reseed and meta is not None and meta['dataset'] == dataset
+        and time.time() - meta['seeded_at'] < args.max_age_hours * 3600
+    )
+    if fresh:
+        return dataset, get_user_model().objects.get(username=BENCH_USER)
+
+    connection.close()
+    db_path = settings.DATABASES['default']['NAME']
+    for suffix in ('', '-wal', '-shm', '.meta.json'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    print(f'สร้างชุดข้อมูลใหม่ที่ {db_path}: {dataset}', file=sys.stderr)
+    call_command('migrate', verbosity=0)
+    user = seed(dataset)
+    with open(meta_path(), 'w') as f:
+        json.dump({'dataset': dataset, 'seeded_at': time.time()}, f)
+    return dataset, user
+
+
+def websocket_connect_snapshot(device_id=None, subscribe=None):
+    """เชื่อมต่อ WebSocket ผ่าน ASGI จนได้ข้อความ snapshot แล้วตัดการเชื่อมต่อ
+
+    ระบุ ``device_id`` สำหรับ SensorDataConsumer หรือ ``subscribe`` (รายการอุปกรณ์)
+    สำหรับ MultiplexSensorDataConsumer
+    """
+    from iotdjango.asgi import application
+
+    async def run():
+        communicator = ApplicationCommunicator(application, {
+            'type': 'websocket',
+            'path': f'/ws/sensor-data/{device_id}/' if device_id else '/ws/sensor-data/',
+            'headers': [(b'host', b'localhost')],
+            'query_string': b'',
+            'subprotocols': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        accepted = await communicator.receive_output(5)
+        assert accepted['type'] == 'websocket.accept', accepted
+        if subscribe:
+            await communicator.send_input({
+                'type': 'websocket.receive',
+                'text': json.dumps({'type': 'subscribe', 'devices': subscribe}),
+            })
+            subscribed = await communicator.receive_output(5)
+            assert '"subscribed"' in subscribed.get('text', ''), subscribed
+        snapshot = await communicator.receive_output(5)
+        assert 'latest_data' in snapshot.get('text', ''), snapshot
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    async_to_sync(run)()
+
+
+def build_cases(user):
+    # เหมือน test runner ของ Django: ไม่ล้าง query log และไม่ปิด connection ทุกคำขอ
+    # (ไม่เช่นนั้น CaptureQueriesContext นับ query ภายในคำขอไม่ได้)
+    request_started.disconnect(reset_queries)
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(user)
+    devices = list(Device.objects.filter(owner=user).values_list('id', flat=True))
+    sensor_type_ids = list(SensorType.objects.values_list('id', flat=True))
+    rng = random.Random(7)
+
+    def ok(response):
+        assert response.status_code == 200, (response.status_code, response.content[:200])
+        return response
+
+    def create_sensor_data():
+        ok(client.post('/api/sensor-data', json.dumps({
+            'device_id': str(rng.choice(devices)),
+            'sensor_type_id': rng.choice(sensor_type_ids),
+            'value': round(rng.uniform(0, 100), 2),
+        }), content_type='application/json'))
+
+    return {
+        'create_sensor_data': create_sensor_data,
+        'list_sensor_data': lambda: ok(client.get('/api/sensor-data', {'device_id': str(rng.choice(devices))})),
+        'list_sensor_data_all': lambda: ok(client.get('/api/sensor-data')),
+        'get_latest_sensor_data': lambda: ok(client.get('/api/sensor-data/latest')),
+        'api_stats': lambda: ok(client.get(f'/sensors/api/stats/{rng.choice(devices)}/')),
+        'dashboard': lambda: ok(client.get('/sensors/')),
+        'consumer_connect': lambda: websocket_connect_snapshot(rng.choice(devices)),
+        'consumer_multiplex_all': lambda: websocket_connect_snapshot(subscribe=[str(d) for d in devices]),
+    }
+
+
+def measure(func, repeat, warmup):
+    for _ in range(warmup):
+        func()
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    query_count = len(queries)
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return {
+        'queries': query_count,
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(times[0], 3),
+        'p95_ms': round(times[min(len(times) - 1, math.ceil(len(times) * 0.95) - 1)], 3),
+        'repeat': repeat,
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """รายการ regression เทียบกับ baseline"""
+    regressions = []
+    for name, base in baseline['cases'].items():
+        current = results['cases'].get(name)
+        if current is None:
+            continue
+        if current['queries'] > base['queries']:
+            regressions.append(f"{name}: query {base['queries']} -> {current['queries']}")
+        limit = base['median_ms'] * (1 + tolerance)
+        if current['median_ms'] > limit and current['median_ms'] - base['median_ms'] > min_delta_ms:
+            regressions.append(f"{name}: median {base['median_ms']:.3f} ms -> {current['median_ms']:.3f} ms "
+                               f"(เกิน {tolerance:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--sensor-types', type=int, default=5, choices=range(1, len(PROFILES) + 1))
+    parser.add_argument('--readings', type=int, default=200000, help='จำนวนข้อมูลดิบทั้งหมด')
+    parser.add_argument('--days', type=int, default=7, help='ช่วงเวลาของข้อมูลย้อนหลัง')
+    parser.add_argument('--reseed', action='store_true', help='สร้างชุดข้อมูลใหม่แม้มีอยู่แล้ว')
+    parser.add_argument('--max-age-hours', type=float, default=24,
+                        help='สร้างชุดข้อมูลใหม่เมื่อเก่ากว่านี้ (ข้อมูลอิงเวลาปัจจุบัน)')
+    parser.add_argument('--repeat', type=int, default=30, help='จำนวนรอบที่จับเวลาต่อกรณี')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--case', action='append', help='วัดเฉพาะกรณีนี้ (ระบุได้หลายครั้ง)')
+    parser.add_argument('--output', help='บันทึกผลเป็น JSON')
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'))
+    parser.add_argument('--update-baseline', action='store_true', help='บันทึกผลรอบนี้เป็น baseline')
+    parser.add_argument('--time-tolerance', type=float, default=0.5,
+                        help='ยอมให้ median ช้ากว่า baseline ได้กี่เท่า (0.5 คือ 50%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='ไม่นับ regression ด้านเวลาที่ต่างจาก baseline น้อยกว่านี้')
+    args = parser.parse_args()
+
+    dataset, user = prepare(args)
+    cases = build_cases(user)
+    selected = args.case or list(cases)
+
+    results = {
+        'dataset': dataset,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+        },
+        'cases': {},
+    }
+    print(f'{"case":<24} {"queries":>7} {"median ms":>10} {"min ms":>9} {"p95 ms":>9}')
+    for name in selected:
+        result = measure(cases[name], args.repeat, args.warmup)
+        results['cases'][name] = result
+        print(f"{name:<24} {result['queries']:>7} {result['median_ms']:>10.3f} "
+              f"{result['min_ms']:>9.3f} {result['p95_ms']:>9.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f'บันทึก baseline ที่ {args.baseline}')
+        return
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except OSError:
+        print('ไม่มี baseline (รันด้วย --update-baseline เพื่อสร้าง)')
+        return
+    if baseline['dataset'] != dataset:
+        print(f"ชุดข้อมูลไม่ตรงกับ baseline ({baseline['dataset']}) จึงไม่เปรียบเทียบ")
+        return
+
+    regressions = compare(results, baseline, args.time_tolerance, args.min_delta_ms)
+    if regressions:
+        print('\nREGRESSION:')
+        for line in regressions:
+            print(f'  {line}')
+        sys.exit(1)
+    print('\nไม่พบ regression เทียบกับ baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+วัดการส่งข้อความข้าม process ของ SQLiteChannelLayer (sensors.channel_layers)
+
+worker แต่ละ process สร้าง channel ตามจำนวน --channels และเข้าร่วม group ของอุปกรณ์
+(แบบ WebSocket ที่ติดตามอุปกรณ์เดียวกัน) จากนั้น process หลักส่งข้อความแบบ broadcast_readings
+(group_send_many ครั้งละ --batch ข้อความ) ผลลัพธ์คือจำนวนข้อความที่ส่งถึง channel ต่อวินาที
+รวมทุก worker และเวลาตั้งแต่ส่งจนถึง channel (median / p99) ซึ่งรวมระยะรอระหว่างการตรวจ inbox
+(poll_interval ถึง max_poll_interval เมื่อส่งเป็นช่วง ๆ ด้วย --rate) ด้วย
+
+วิธีใช้:
+    python benchmarks/bench_channel_layer.py [--workers 2] [--channels 100] [--messages 2000]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensors.channel_layers import SQLiteChannelLayer  # noqa: E402
+
+GROUP = 'sensor_data_bench'
+
+
+def worker(path, channels, messages, ready, results):
+    async def run():
+        layer = SQLiteChannelLayer(path, capacity=messages + 10)
+        names = [await layer.new_channel() for _ in range(channels)]
+        for name in names:
+            await layer.group_add(GROUP, name)
+        ready.put(True)
+
+        latencies = []
+
+        async def consume(name):
+            for _ in range(messages):
+                message = await layer.receive(name)
+                latencies.append(time.time() - message['sent'])
+
+        await asyncio.gather(*(consume(name) for name in names))
+        finished = time.time()
+        await layer.close()
+        # latency ของทุก channel ใกล้เคียงกัน ส่งกลับหนึ่งค่าต่อข้อความโดยเฉลี่ย
+        results.put((finished, latencies[::channels]))
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='จำนวน process ที่รับข้อความ')
+    parser.add_argument('--channels', type=int, default=100, help='จำนวน channel ต่อ worker')
+    parser.add_argument('--messages', type=int, default=2000, help='จำนวนข้อความที่ส่ง')
+    parser.add_argument('--batch', type=int, default=10, help='ข้อความต่อ group_send_many')
+    parser.add_argument('--rate', type=float, default=0, help='ข้อความต่อวินาทีที่ส่ง (0 คือเร็วที่สุด)')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'channels.sqlite3')
+    context = multiprocessing.get_context('spawn')
+    ready, results = context.Queue(), context.Queue()
+    processes = [
+        context.Process(target=worker, args=(path, args.channels, args.messages, ready, results))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=60)
+
+    async def publish():
+        # capacity ของผู้ส่งเป็นตัวกำหนดว่า group_send ข้าม channel ที่มีข้อความค้างครบแล้ว
+        layer = SQLiteChannelLayer(path, capacity=args.messages + 10)
+        payload = {'type': 'sensor_data', 'items': (('device', 1, '{"value": 1.0}', b'\xcb' + bytes(8)),)}
+        interval = args.batch / args.rate if args.rate else 0
+        for start in range(0, args.messages, args.batch):
+            count = min(args.batch, args.messages - start)
+            await layer.group_send_many([(GROUP, {**payload, 'sent': time.time()}) for _ in range(count)])
+            if interval:
+                await asyncio.sleep(interval)
+
+    started = time.time()
+    asyncio.run(publish())
+    published = time.time() - started
+    finished = []
+    latencies = []
+    for _ in processes:
+        done, worker_latencies = results.get(timeout=300)
+        finished.append(done)
+        latencies.extend(worker_latencies)
+    for process in processes:
+        process.join()
+
+    elapsed = max(finished) - started
+    delivered = args.messages * args.channels * args.workers
+    latencies.sort()
+    print(f'workers: {args.workers}  channels ต่อ worker: {args.channels}  ข้อความ: {args.messages}')
+    print(f'ส่ง: {args.messages / published:,.0f} ข้อความ/s  ส่งถึง channel: {delivered / elapsed:,.0f} ข้อความ/s')
+    print(f'latency: median {statistics.median(latencies) * 1000:.1f} ms  '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+วัดอัตราการกระจายข้อมูลเซ็นเซอร์ผ่าน WebSocket เทียบกับจำนวนผู้ติดตามอุปกรณ์เดียว
+
+- legacy: ส่ง dict ผ่าน channel layer แล้วทุก consumer json.dumps เอง (แบบเดิม)
+- shared: reading_messages แปลง JSON ครั้งเดียว แล้ว SensorDataConsumer ต่อข้อความจาก JSON นั้น
+- binary: SensorDataConsumer ผ่าน subprotocol sensor.msgpack.v1 (frame ละ [stream_id, epoch_ms, value, seq])
+
+ใช้ InMemoryChannelLayer (ซึ่งคัดลอกข้อความให้ทุกผู้ติดตาม) และ consumer จริงใน process เดียว โดยไม่ผ่านเครือข่าย
+(consumer ไม่อ่านฐานข้อมูลตอนเชื่อมต่อ) และปิดการจำกัดอัตราของ consumer
+ผลลัพธ์คือต้นทุน CPU ต่อผู้ติดตามต่อข้อความ (คัดลอก event + แปลงเป็นข้อความ WebSocket)
+จำนวน bytes ที่ส่งต่อข้อมูลหนึ่งรายการ และจำนวนข้อมูลที่ส่งถึง client ต่อวินาที
+(ข้อความ x ผู้ติดตาม / เวลา) ซึ่งรวมต้นทุนของ channels และ asyncio ต่อข้อความด้วย
+
+วิธีใช้:
+    python benchmarks/bench_fanout.py [--subscribers 1,10,100,500] [--messages 200]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+import struct
+import time
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iotdjango.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from channels.layers import InMemoryChannelLayer, channel_layers  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from sensors.consumers import BINARY_SUBPROTOCOL, SensorDataConsumer, group_name  # noqa: E402
+from sensors.ingest import reading_messages, serialize_sensor_data  # noqa: E402
+from sensors.models import Device, SensorData, SensorType  # noqa: E402
+
+
+class FanoutLayer(InMemoryChannelLayer):
+    """InMemoryChannelLayer ที่ไม่ล้างข้อความหมดอายุ
+
+    ตัวเดิมไล่ตรวจทุก channel ทุกครั้งที่ receive ซึ่งกินเวลาเกือบทั้งหมดเมื่อมีผู้ติดตามหลายร้อย
+    และไม่ใช่ต้นทุนของ channel layer ที่ใช้จริง (รอบวัดสั้นกว่า expiry อยู่แล้ว)
+    """
+
+    def _clean_expired(self):
+        pass
+
+
+class BenchConsumer(SensorDataConsumer):
+    """SensorDataConsumer ที่ไม่อ่านฐานข้อมูลตอนเชื่อมต่อ (วัดเฉพาะการกระจายข้อมูล)"""
+
+    async def get_device(self, device_id):
+        return Device(id=device_id)
+
+    async def get_latest_sensor_data(self, device_id):
+        return []
+
+
+class LegacyConsumer(BenchConsumer):
+    """แบบเดิม: channel layer คัดลอก dict ให้ทุก consumer แล้วแต่ละ consumer json.dumps เอง"""
+
+    async def sensor_data(self, event):
+        data = event['data']
+        self.throttle.add([(data['device_id'], data['sensor_type_id'], data)])
+
+    async def send_sensor_items(self, entries):
+        if len(entries) == 1:
+            await self.send(text_data=json.dumps({'type': 'sensor_data', 'data': entries[0][2]}))
+        else:
+            await self.send(text_data=json.dumps({'type': 'sensor_data_batch', 'data': [entry[2] for entry in entries]}))
+
+
+def legacy_encode(event):
+    return json.dumps({'type': 'sensor_data', 'data': event['data']})
+
+
+def shared_encode(event):
+    return '{"type": "sensor_data", "data": ' + event['items'][0][2] + '}'
+
+
+def binary_encode(event):
+    # เหมือน WireFormatMixin.encode_frame ของ stream ที่ประกาศแล้ว
+    return bytes([0x90 | len(event['items'])]) + b''.join(b'\x94\x01' + entry[3] for entry in event['items'])
+
+
+def legacy_messages(readings):
+    return [
+        (group_name(sensor_data.device_id), {'type': 'sensor_data', 'data': serialize_sensor_data(sensor_data)})
+        for sensor_data in readings
+    ]
+
+
+# mode -> (consumer, สร้างข้อความ channel layer, แปลงเป็นข้อความ WebSocket, subprotocols)
+MODES = {
+    'legacy': (LegacyConsumer, legacy_messages, legacy_encode, []),
+    'shared': (BenchConsumer, reading_messages, shared_encode, []),
+    'binary': (BenchConsumer, reading_messages, binary_encode, [BINARY_SUBPROTOCOL]),
+}
+
+
+def make_readings(count):
+    device = Device(id=uuid.uuid4(), name='fanout-device')
+    now = timezone.now()
+    return [
+        SensorData(device=device, sensor_type=SensorType(id=i + 1, name=f'Sensor {i + 1}', unit='u'),
+                   value=float(i), timestamp=now)
+        for i in range(count)
+    ]
+
+
+def subscriber_cost(mode, number=20000):
+    """ต้นทุน CPU ต่อผู้ติดตามต่อข้อความ (µs): คัดลอก event แบบ channel layer + แปลงเป็นข้อความ"""
+    _, build, encode, _ = MODES[mode]
+    _, event = build(make_readings(1))[0]
+
+    def deliver():
+        encode(copy.deepcopy(event))
+
+    return min(timeit.repeat(deliver, number=number, repeat=5)) / number * 1e6
+
+
+def frame_length(data):
+    """จำนวนแถวของ frame ข้อมูล msgpack จาก header ของ array (ข้อความควบคุมเป็น map คือ 0)"""
+    if 0x90 <= data[0] <= 0x9f:
+        return data[0] & 0x0f
+    if data[0] == 0xdc:
+        return struct.unpack_from('>H', data, 1)[0]
+    if data[0] == 0xdd:
+        return struct.unpack_from('>I', data, 1)[0]
+    return 0
+
+
+class Client:
+    """ฝั่ง ASGI server ของการเชื่อมต่อหนึ่ง: นับข้อมูลที่ได้รับจนครบ ``target``"""
+
+    def __init__(self, target):
+        self.target = target
+        self.items = 0
+        self.bytes = 0
+        self.inbox = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.done = asyncio.Event()
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send(self, message):
+        if message['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif message['type'] == 'websocket.send':
+            if message.get('text') is not None:
+                self.bytes += len(message['text'].encode())
+                self.items += message['text'].count('"sensor_type_id"')
+            else:
+                self.bytes += len(message['bytes'])
+                self.items += frame_length(message['bytes'])
+            if self.items >= self.target:
+                self.done.set()
+
+
+async def run(mode, subscribers, messages, timeout):
+    consumer_class, build, _, subprotocols = MODES[mode]
+    channel_layers.set('default', FanoutLayer(expiry=600, capacity=messages + 10))
+    app = consumer_class.as_asgi()
+
+    readings = make_readings(messages)
+    device_id = readings[0].device_id
+
+    scope = {
+        'type': 'websocket',
+        'path': f'/ws/sensor-data/{device_id}/',
+        'url_route': {'args': (), 'kwargs': {'device_id': str(device_id)}},
+        'headers': [],
+        'query_string': b'',
+        'subprotocols': subprotocols,
+    }
+    clients = [Client(messages) for _ in range(subscribers)]
+    tasks = []
+    for client in clients:
+        tasks.append(asyncio.create_task(app(dict(scope), client.receive, client.send)))
+        client.inbox.put_nowait({'type': 'websocket.connect'})
+    await asyncio.wait_for(asyncio.gather(*(client.accepted.wait() for client in clients)), timeout)
+    layer = channel_layers['default']
+
+    async def publish():
+        for sensor_data in readings:
+            # หนึ่งข้อความต่อค่า แบบ POST /api/sensor-data
+            for group, event in build([sensor_data]):
+                await layer.group_send(group, event)
+        await asyncio.wait_for(asyncio.gather(*(client.done.wait() for client in clients)), timeout)
+
+    # รอบแรกไม่จับเวลา: ให้ client ได้รับการประกาศ stream ของทุกเซ็นเซอร์ก่อน เหมือน dashboard ที่เปิดค้างไว้
+    await publish()
+    for client in clients:
+        client.items = client.bytes = 0
+        client.done.clear()
+
+    started = time.perf_counter()
+    await publish()
+    elapsed = time.perf_counter() - started
+
+    for client in clients:
+        client.inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+    return elapsed, sum(client.bytes for client in clients) / sum(client.items for client in clients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', default='1,10,100,500', help='จำนวนผู้ติดตาม คั่นด้วยจุลภาค')
+    parser.add_argument('--messages', type=int, default=200, help='จำนวนข้อความต่อรอบ')
+    parser.add_argument('--repeat', type=int, default=3, help='จำนวนรอบ (ใช้รอบที่เร็วที่สุด)')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    # วัดการกระจายอย่างเดียว: ไม่จำกัดอัตราและไม่ทิ้งข้อมูลที่รอส่ง
+    settings.SENSOR_WEBSOCKET = {**settings.SENSOR_WEBSOCKET, 'MAX_RATE': 0, 'MAX_PENDING': args.messages}
+
+    costs = {mode: subscriber_cost(mode) for mode in MODES}
+    print('ต้นทุนต่อผู้ติดตามต่อข้อความ: ' + ', '.join(f'{mode} {cost:.1f} µs' for mode, cost in costs.items()))
+    print(f'ข้อความต่อรอบ: {args.messages}  รอบวัด: {args.repeat}')
+    print(f'{"subscribers":>11} ' + ' '.join(f'{mode + " msg/s":>14}' for mode in MODES))
+    sizes = {}
+    for subscribers in [int(n) for n in args.subscribers.split(',')]:
+        rates = {}
+        for mode in MODES:
+            results = [asyncio.run(run(mode, subscribers, args.messages, args.timeout)) for _ in range(args.repeat)]
+            rates[mode] = args.messages * subscribers / min(elapsed for elapsed, _ in results)
+            sizes[mode] = results[-1][1]
+        print(f'{subscribers:>11} ' + ' '.join(f'{rates[mode]:>14,.0f}' for mode in MODES))
+    print('bytes ต่อข้อมูลหนึ่งรายการ: ' + ', '.join(f'{mode} {size:.1f}' for mode, size in sizes.items()))
+
+if __name__ == '__main__':
+    main()
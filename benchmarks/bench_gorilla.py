@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+วัดอัตราการบีบอัดและความเร็วของ cold storage แบบ Gorilla (sensors/gorilla.py)
+
+ใช้ข้อมูลจำลองของเซ็นเซอร์หนึ่งตัวในหนึ่งวัน แล้วเทียบขนาดกับ
+- 16 bytes/จุด (เวลา int64 + ค่า float64 แบบไม่บีบอัด)
+- แถว SensorData ในฐานข้อมูล (UUID + timestamp + float + raw_data ประมาณ 100+ bytes/จุด)
+
+วิธีใช้:
+    python benchmarks/bench_gorilla.py [--points 86400] [--interval 1.0] [--repeat 3]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensors import gorilla
+
+RAW_BYTES_PER_POINT = 16
+ROW_BYTES_PER_POINT = 110
+
+
+def make_series(points, interval, kind):
+    """สร้างข้อมูลจำลอง (เวลาไมโครวินาที, ค่า)"""
+    rng = random.Random(42)
+    start = 1_700_000_000_000_000
+    step = int(interval * 1_000_000)
+    timestamps = []
+    values = []
+    t = start
+    for i in range(points):
+        # เวลาส่งจริงของ ESP32 คลาดเคลื่อนเล็กน้อย
+        timestamps.append(t + rng.randint(-2000, 2000))
+        t += step
+        if kind == 'rounded':
+            # ค่าปัดทศนิยมแบบที่ ESP32 ส่งมา
+            values.append(round(25 + 3 * math.sin(i / 3600) + rng.gauss(0, 0.2), 1))
+        elif kind == 'constant':
+            values.append(1.0)
+        else:
+            values.append(25 + 3 * math.sin(i / 3600) + rng.gauss(0, 0.2))
+    return timestamps, values
+
+
+def bench(kind, timestamps, values, repeat):
+    encode_times = []
+    decode_times = []
+    payload = b''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = gorilla.encode(timestamps, values)
+        encode_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        decoded = gorilla.decode(payload)
+        decode_times.append(time.perf_counter() - started)
+
+    assert decoded == (timestamps, values), 'ข้อมูลที่แตกกลับมาไม่ตรงกับต้นฉบับ'
+
+    points = len(timestamps)
+    per_point = len(payload) / points
+    print(f'{kind:<10} {per_point:>8.2f} '
+          f'{RAW_BYTES_PER_POINT / per_point:>9.1f}x '
+          f'{ROW_BYTES_PER_POINT / per_point:>9.1f}x '
+          f'{points / min(encode_times):>12,.0f} '
+          f'{points / min(decode_times):>12,.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=86400, help='จำนวนจุดต่อก้อน (ค่าเริ่มต้นคือ 1 วันที่ 1 วินาที/จุด)')
+    parser.add_argument('--interval', type=float, default=1.0, help='ระยะห่างระหว่างจุด (วินาที)')
+    parser.add_argument('--repeat', type=int, default=3, help='จำนวนรอบ (ใช้รอบที่เร็วที่สุด)')
+    args = parser.parse_args()
+
+    print(f'จุดต่อก้อน: {args.points:,}  ระยะห่าง: {args.interval}s  รอบ: {args.repeat}')
+    print(f'{"data":<10} {"B/point":>8} {"vs 16B":>10} {"vs row":>10} {"encode pt/s":>12} {"scan pt/s":>12}')
+    for kind in ('rounded', 'noisy', 'constant'):
+        timestamps, values = make_series(args.points, args.interval, kind)
+        bench(kind, timestamps, values, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
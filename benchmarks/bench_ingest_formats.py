@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+เทียบขนาด payload และเวลาแปลงข้อมูลของการส่งข้อมูลแบบ JSON กับ frame ไบนารี (sensors/frames.py)
+
+- json/reading: หนึ่งคำขอต่อค่า แบบที่ run_esp32_auto.py ส่ง (รวม raw_data)
+- json/batch:   /api/sensor-data/batch หนึ่งคำขอ (ตรวจด้วย SensorDataBatchSchema)
+- msgpack:      /api/sensor-data/frame แบบ application/msgpack
+- struct f32/f64: /api/sensor-data/frame แบบ application/vnd.sensor-frame
+
+เวลาฝั่งเซิร์ฟเวอร์วัดเฉพาะการแปลง body เป็นข้อมูลพร้อมบันทึก (ไม่รวมฐานข้อมูล)
+
+วิธีใช้:
+    python benchmarks/bench_ingest_formats.py [--sensors 3] [--samples 20] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iotdjango.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from sensors import frames  # noqa: E402
+from sensors.api import SensorDataBatchSchema, SensorDataCreateSchema  # noqa: E402
+
+SENSOR_NAMES = ['Temperature', 'Humidity', 'Light', 'Pressure', 'CO2', 'Voltage']
+
+
+def make_readings(sensors, samples, interval_ms):
+    """ค่าจำลองของอุปกรณ์หนึ่งตัว: [(sensor_type_id, delta_ms, value)] เรียงตามเวลา"""
+    rng = random.Random(42)
+    entries = []
+    for sample in range(samples):
+        delta = (sample - samples + 1) * interval_ms
+        for sensor_type_id in range(1, sensors + 1):
+            entries.append((sensor_type_id, delta, round(rng.uniform(10, 90), 2)))
+    return entries
+
+
+def json_reading(device_id, sensor_type_id, value, timestamp, uptime):
+    return json.dumps({
+        'device_id': device_id,
+        'sensor_type_id': sensor_type_id,
+        'value': value,
+        'raw_data': {
+            'timestamp': timestamp.isoformat(),
+            'sensor': SENSOR_NAMES[(sensor_type_id - 1) % len(SENSOR_NAMES)],
+            'simulated': True,
+            'uptime': uptime,
+        },
+    }).encode()
+
+
+def build_payloads(device_id, entries):
+    now = datetime.now(timezone.utc)
+    per_reading = [
+        json_reading(str(device_id), sensor_type_id, value, now + timedelta(milliseconds=delta), 3600)
+        for sensor_type_id, delta, value in entries
+    ]
+    batch = json.dumps({'readings': [
+        {
+            'device_id': str(device_id),
+            'sensor_type_id': sensor_type_id,
+            'value': value,
+            'timestamp': (now + timedelta(milliseconds=delta)).isoformat(),
+            'raw_data': {'simulated': True, 'uptime': 3600},
+        }
+        for sensor_type_id, delta, value in entries
+    ]}).encode()
+    extras = {'simulated': True, 'uptime': 3600}
+    return {
+        'json/reading': per_reading,
+        'json/batch': [batch],
+        'msgpack': [frames.encode_msgpack(device_id, entries, extras=extras)],
+        'struct f32': [frames.encode_struct(device_id, entries, extras=extras)],
+        'struct f64': [frames.encode_struct(device_id, entries, extras=extras, float64=True)],
+    }
+
+
+def decode_json_reading(body):
+    return SensorDataCreateSchema.model_validate_json(body)
+
+
+def decode_json_batch(body):
+    return SensorDataBatchSchema.model_validate_json(body)
+
+
+def decode_msgpack(body):
+    frame = frames.decode(body, frames.MSGPACK_CONTENT_TYPES[0])
+    return frame.timestamps(datetime.now(timezone.utc))
+
+
+def decode_struct(body):
+    frame = frames.decode(body, frames.STRUCT_CONTENT_TYPE)
+    return frame.timestamps(datetime.now(timezone.utc))
+
+
+DECODERS = {
+    'json/reading': decode_json_reading,
+    'json/batch': decode_json_batch,
+    'msgpack': decode_msgpack,
+    'struct f32': decode_struct,
+    'struct f64': decode_struct,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sensors', type=int, default=3, help='จำนวนประเภทเซ็นเซอร์ต่ออุปกรณ์')
+    parser.add_argument('--samples', type=int, default=20, help='จำนวนรอบการวัดที่รวมส่งในคำขอเดียว')
+    parser.add_argument('--interval-ms', type=int, default=5000, help='ระยะห่างระหว่างรอบการวัด')
+    parser.add_argument('--repeat', type=int, default=200, help='จำนวนรอบ (ใช้รอบที่เร็วที่สุด)')
+    args = parser.parse_args()
+
+    entries = make_readings(args.sensors, args.samples, args.interval_ms)
+    payloads = build_payloads(uuid.uuid4(), entries)
+    readings = len(entries)
+
+    print(f'ค่าต่อคำขอ: {readings} ({args.sensors} เซ็นเซอร์ x {args.samples} รอบ)  รอบวัด: {args.repeat}')
+    print(f'{"format":<13} {"requests":>8} {"bytes":>8} {"B/reading":>10} {"vs json":>8} '
+          f'{"decode us":>10} {"readings/s":>12}')
+    baseline = None
+    for name, bodies in payloads.items():
+        size = sum(len(body) for body in bodies)
+        decoder = DECODERS[name]
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for body in bodies:
+                decoder(body)
+            best = min(best, time.perf_counter() - started)
+        baseline = baseline or size
+        print(f'{name:<13} {len(bodies):>8} {size:>8,} {size / readings:>10.1f} '
+              f'{baseline / size:>7.1f}x {best * 1e6:>10.1f} {readings / best:>12,.0f}')
+
+
+if __name__ == '__main__':
+    main()
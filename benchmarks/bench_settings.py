@@ -0,0 +1,26 @@
+"""
+settings สำหรับ benchmark: เหมือน iotdjango.settings แต่ใช้ฐานข้อมูล SQLite แยกไฟล์
+
+ตั้ง BENCH_DB เพื่อเปลี่ยนตำแหน่งไฟล์ (ค่าเริ่มต้น benchmarks/bench.sqlite3)
+ใช้กับคำสั่งอื่นได้ เช่น python manage.py runserver --settings benchmarks.bench_settings
+"""
+import os
+
+from iotdjango.settings import *  # noqa: F401,F403
+from iotdjango.settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCH_DB', str(BASE_DIR / 'benchmarks' / 'bench.sqlite3')),
+    }
+}
+
+# วัดเวลาแบบ production: ไม่เก็บ query log และ debug page
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+# ให้จำนวน query ต่อคำขอคงที่ระหว่างรอบ: บันทึก last_seen_at ทุกครั้ง
+# และไม่โหลดเกณฑ์แจ้งเตือนใหม่ระหว่างวัด
+SENSOR_HEARTBEAT = {**SENSOR_HEARTBEAT, 'TOUCH_SECONDS': 0}  # noqa: F405
+SENSOR_ALERT_RULES_TTL = 3600
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+จำลองอุปกรณ์จำนวนมากพร้อมกันด้วย asyncio เพื่อหาจุดที่เซิร์ฟเวอร์รับไม่ไหว
+
+ค่าที่ส่งสร้างด้วยฟังก์ชันเดียวกับ run_esp32_auto.py และใช้เฉพาะ standard library
+(HTTP/1.1 keep-alive และ WebSocket client แบบย่อบน asyncio streams)
+
+protocol
+    http   POST /api/sensor-data ครั้งละหนึ่งค่า
+    batch  POST /api/sensor-data/batch ครั้งละ --batch-size ค่า
+    ws     เปิด WebSocket /ws/sensor-data/<device>/ ต่ออุปกรณ์ วัดเวลาเชื่อมต่อจนได้ snapshot
+           แล้วส่ง ping ตามอัตราที่กำหนดเพื่อวัด round trip (นับข้อความที่ server push มาด้วย)
+
+--rate คือจำนวนคำขอต่อวินาทีรวมทุกอุปกรณ์ แต่ละอุปกรณ์ส่งตามตารางเวลาคงที่
+latency วัดจากเวลาที่ควรส่งตามตาราง (ไม่ใช่เวลาที่ส่งจริง) เมื่อ server ช้าจนส่งไม่ทัน
+เวลารอจึงถูกนับรวมด้วย ไม่ถูกซ่อน (coordinated omission)
+
+วิธีใช้:
+    python benchmarks/loadgen.py --devices 2000 --rate 500 --duration 60 --ramp-up 10
+    python benchmarks/loadgen.py --protocol batch --batch-size 50 --rate 100 --output result.json
+    python benchmarks/loadgen.py --protocol ws --devices 1000 --rate 200
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import resource
+import struct
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_esp32_auto import SENSORS, generate_sensor_value  # noqa: E402
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+
+
+class LatencyHistogram:
+    """histogram แบบ bucket ลอการิทึม (ความละเอียดประมาณ precision) ใช้หน่วยความจำคงที่"""
+
+    def __init__(self, lowest=1e-5, highest=300.0, precision=0.01):
+        self.lowest = lowest
+        self.factor = math.log1p(precision)
+        self.counts = [0] * (int(math.log(highest / lowest) / self.factor) + 2)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = 0 if seconds <= self.lowest else int(math.log(seconds / self.lowest) / self.factor) + 1
+        self.counts[min(index, len(self.counts) - 1)] += 1
+        self.total += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def upper_bound(self, index):
+        return self.lowest * math.exp(self.factor * index)
+
+    def percentile(self, p):
+        if not self.total:
+            return 0.0
+        target = math.ceil(self.total * p / 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def summary(self):
+        ms = 1000
+        return {
+            'count': self.total,
+            'mean': round(self.sum / self.total * ms, 3) if self.total else 0.0,
+            'p50': round(self.percentile(50) * ms, 3),
+            'p90': round(self.percentile(90) * ms, 3),
+            'p95': round(self.percentile(95) * ms, 3),
+            'p99': round(self.percentile(99) * ms, 3),
+            'p999': round(self.percentile(99.9) * ms, 3),
+            'max': round(self.max * ms, 3),
+        }
+
+    def buckets(self):
+        """[(ขอบบน ms, จำนวน)] เฉพาะ bucket ที่มีข้อมูล"""
+        return [(round(self.upper_bound(index) * 1000, 4), count)
+                for index, count in enumerate(self.counts) if count]
+
+
+class HTTPConnectionPool:
+    """pool ของการเชื่อมต่อ HTTP/1.1 keep-alive ไปยัง host เดียว"""
+
+    def __init__(self, host, port, size, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+        self.opened = 0
+
+    async def request(self, method, path, body=b'', headers=None):
+        async with self._slots:
+            while True:
+                reused = bool(self._idle)
+                conn = self._idle.pop() if reused else None
+                try:
+                    if conn is None:
+                        conn = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                        self.opened += 1
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self._exchange(conn, method, path, body, headers or {}), self.timeout
+                    )
+                except (ConnectionResetError, BrokenPipeError):
+                    conn[1].close()
+                    if reused:
+                        # server ปิดการเชื่อมต่อที่ว่างอยู่ไปแล้ว ลองใหม่ด้วยการเชื่อมต่อใหม่
+                        continue
+                    raise
+                except BaseException:
+                    if conn is not None:
+                        conn[1].close()
+                    raise
+                break
+            if keep_alive:
+                self._idle.append(conn)
+            else:
+                conn[1].close()
+        return status, data
+
+    async def _exchange(self, conn, method, path, body, headers):
+        reader, writer = conn
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}',
+                 f'Content-Length: {len(body)}', 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('server ปิดการเชื่อมต่อ')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await reader.read()
+            return status, data, False
+        return status, data, response_headers.get('connection', '').lower() != 'close'
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+class WebSocketClient:
+    """WebSocket client แบบย่อ (RFC 6455) ส่งข้อความ text และรับได้ทั้ง text และ binary"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port, path, headers=None):
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        lines = [f'GET {path} HTTP/1.1', f'Host: {host}:{port}', 'Upgrade: websocket',
+                 'Connection: Upgrade', f'Sec-WebSocket-Key: {key}', 'Sec-WebSocket-Version: 13']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        status = int(status_line.split()[1]) if status_line else 0
+        if status != 101:
+            writer.close()
+            raise HTTPError(status)
+        return cls(reader, writer)
+
+    async def send_text(self, text):
+        payload = text.encode()
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x81, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x81, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x81, 0x80 | 127, length)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.writer.write(header + mask + masked)
+        await self.writer.drain()
+
+    async def recv(self):
+        """ข้อความถัดไป (str หรือ bytes) หรือ None เมื่อถูกปิด"""
+        message = b''
+        message_opcode = None
+        while True:
+            first, second = await self.reader.readexactly(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('!H', await self.reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await self.reader.readexactly(8))
+            payload = await self.reader.readexactly(length)
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self.writer.write(struct.pack('!BB', 0x8A, 0x80) + b'\0\0\0\0')
+                continue
+            if opcode == 0xA:
+                continue
+            if opcode != 0x0:
+                message_opcode = opcode
+            message += payload
+            if first & 0x80:
+                return message.decode() if message_opcode == 0x1 else message
+
+    def close(self):
+        try:
+            self.writer.write(struct.pack('!BB', 0x88, 0x80) + b'\0\0\0\0')
+        finally:
+            self.writer.close()
+
+
+class LoadTest:
+    def __init__(self, args, devices, sensor_types):
+        self.args = args
+        self.devices = devices
+        self.sensor_types = sensor_types
+        url = urlsplit(args.url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.pool = HTTPConnectionPool(self.host, self.port, args.connections, args.timeout)
+
+        self.latency = LatencyHistogram()
+        self.connect_latency = LatencyHistogram()
+        self.ok = 0
+        self.failed = 0
+        self.readings = 0
+        self.late = 0
+        self.pushed = 0
+        self.active = 0
+        self.errors = Counter()
+
+    def _fail(self, error):
+        self.failed += 1
+        self.errors[str(error) if isinstance(error, HTTPError) else type(error).__name__] += 1
+
+    def _readings(self, device, rng, count):
+        now = time.time()
+        items = []
+        for i in range(count):
+            sensor_type_id, sensor = self.sensor_types[rng.randrange(len(self.sensor_types))]
+            items.append({
+                'device_id': device['id'],
+                'sensor_type_id': sensor_type_id,
+                'value': generate_sensor_value(sensor, now, rng),
+                'timestamp': datetime.fromtimestamp(now - (count - i - 1) * 0.01, timezone.utc).isoformat(),
+                'raw_data': {'simulated': True, 'loadgen': True},
+            })
+        return items
+
+    async def _post(self, device, rng):
+        headers = {'Content-Type': 'application/json'}
+        if device.get('key'):
+            headers['X-API-Key'] = device['key']
+        if self.args.protocol == 'batch':
+            readings = self._readings(device, rng, self.args.batch_size)
+            path = f'{self.prefix}/api/sensor-data/batch'
+            body = {'readings': readings}
+        else:
+            readings = self._readings(device, rng, 1)
+            path = f'{self.prefix}/api/sensor-data'
+            body = readings[0]
+            del body['timestamp']
+        status, _ = await self.pool.request('POST', path, json.dumps(body).encode(), headers)
+        if status != 200:
+            raise HTTPError(status)
+        return len(readings)
+
+    async def run_device(self, index, device, deadline):
+        loop = asyncio.get_running_loop()
+        rng = random.Random(self.args.seed + index)
+        interval = len(self.devices) / self.args.rate
+        # เริ่มทยอยตาม ramp-up แล้วกระจายเวลาภายในช่วง interval แรก
+        start = loop.time() + self.args.ramp_up * index / len(self.devices) + rng.uniform(0, interval)
+        await asyncio.sleep(max(0.0, start - loop.time()))
+
+        ws = None
+        pending = {}
+        reader_task = None
+        self.active += 1
+        try:
+            if self.args.protocol == 'ws':
+                ws, reader_task = await self._open_ws(device, pending)
+                if ws is None:
+                    return
+
+            scheduled = start
+            while scheduled < deadline:
+                delay = scheduled - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                elif -delay > interval:
+                    self.late += 1
+                try:
+                    if ws is not None:
+                        await self._ping(ws, pending)
+                    else:
+                        sent = await self._post(device, rng)
+                        self.readings += sent
+                    self.ok += 1
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError, ValueError) as e:
+                    self._fail(e)
+                    if ws is not None:
+                        break
+                self.latency.record(loop.time() - scheduled)
+                scheduled += interval
+        finally:
+            self.active -= 1
+            if reader_task is not None:
+                reader_task.cancel()
+            if ws is not None:
+                ws.close()
+
+    async def _open_ws(self, device, pending):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            ws = await asyncio.wait_for(
+                WebSocketClient.connect(self.host, self.port, f"{self.prefix}/ws/sensor-data/{device['id']}/"),
+                self.args.timeout,
+            )
+            # นับเวลาเชื่อมต่อจนได้ snapshot ข้อความแรก
+            await asyncio.wait_for(ws.recv(), self.args.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError) as e:
+            self._fail(e)
+            return None, None
+        self.connect_latency.record(loop.time() - started)
+
+        async def read():
+            while True:
+                message = await ws.recv()
+                if message is None:
+                    break
+                if '"pong"' in message[:40]:
+                    if pending:
+                        future = pending.pop(next(iter(pending)))
+                        if not future.done():
+                            future.set_result(None)
+                else:
+                    self.pushed += 1
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError('WebSocket ถูกปิด'))
+
+        return ws, asyncio.create_task(read())
+
+    async def _ping(self, ws, pending):
+        future = asyncio.get_running_loop().create_future()
+        pending[id(future)] = future
+        await ws.send_text('{"type": "ping"}')
+        await asyncio.wait_for(future, self.args.timeout)
+
+    async def report(self, started):
+        last_ok = 0
+        while True:
+            await asyncio.sleep(self.args.report_every)
+            elapsed = time.monotonic() - started
+            rate = (self.ok - last_ok) / self.args.report_every
+            last_ok = self.ok
+            print(f'[{elapsed:6.1f}s] active {self.active:5d}  {rate:8.1f} req/s  '
+                  f'ok {self.ok}  failed {self.failed}  p99 {self.latency.percentile(99) * 1000:.1f} ms',
+                  file=sys.stderr)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.args.ramp_up + self.args.duration
+        started = time.monotonic()
+        reporter = asyncio.create_task(self.report(started)) if self.args.report_every else None
+        try:
+            await asyncio.gather(*(
+                self.run_device(index, device, deadline) for index, device in enumerate(self.devices)
+            ))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            self.pool.close()
+        return self.summary(time.monotonic() - started)
+
+    def summary(self, elapsed):
+        total = self.ok + self.failed
+        result = {
+            'config': {
+                'url': self.args.url,
+                'protocol': self.args.protocol,
+                'devices': len(self.devices),
+                'rate': self.args.rate,
+                'batch_size': self.args.batch_size if self.args.protocol == 'batch' else 1,
+                'duration': self.args.duration,
+                'ramp_up': self.args.ramp_up,
+                'connections': self.args.connections,
+            },
+            'elapsed_s': round(elapsed, 3),
+            'requests': {
+                'ok': self.ok,
+                'failed': self.failed,
+                'error_rate': round(self.failed / total, 6) if total else 0.0,
+                'late': self.late,
+            },
+            'throughput': {
+                'requests_per_s': round(self.ok / elapsed, 2) if elapsed else 0.0,
+                'readings_per_s': round(self.readings / elapsed, 2) if elapsed else 0.0,
+            },
+            'errors': dict(self.errors.most_common()),
+            'latency_ms': self.latency.summary(),
+        }
+        if self.args.protocol == 'ws':
+            result['connect_latency_ms'] = self.connect_latency.summary()
+            result['pushed_messages'] = self.pushed
+        else:
+            result['http_connections_opened'] = self.pool.opened
+        if self.args.histogram:
+            result['histogram_ms'] = self.latency.buckets()
+        return result
+
+
+async def discover(args):
+    """อุปกรณ์และประเภทเซ็นเซอร์จาก API (หรือจากไฟล์คีย์)"""
+    url = urlsplit(args.url)
+    prefix = url.path.rstrip('/')
+    pool = HTTPConnectionPool(url.hostname, url.port or 80, 1, args.timeout)
+    try:
+        if args.keys_file:
+            with open(args.keys_file) as f:
+                devices = [dict(zip(('id', 'key'), line.split())) for line in f if line.strip()]
+        else:
+            status, body = await pool.request('GET', f'{prefix}/api/devices')
+            if status != 200:
+                raise HTTPError(status)
+            devices = [{'id': device['id']} for device in json.loads(body) if device['is_active']]
+
+        status, body = await pool.request('GET', f'{prefix}/api/sensor-types')
+        if status != 200:
+            raise HTTPError(status)
+        sensor_types = []
+        for sensor_type in json.loads(body):
+            # ช่วงค่าตาม simulator ถ้ามีชื่อตรงกัน
+            sensor = SENSORS.get(sensor_type['name'], {'min': 0, 'max': 100})
+            sensor_types.append((sensor_type['id'], sensor))
+    finally:
+        pool.close()
+    return devices, sensor_types
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def main_async(args):
+    devices, sensor_types = await discover(args)
+    if not devices or not sensor_types:
+        raise SystemExit('ไม่พบอุปกรณ์หรือประเภทเซ็นเซอร์ (สร้างจากหน้า admin ก่อน)')
+    # อุปกรณ์จำลองมากกว่าอุปกรณ์จริงได้ โดยวนใช้ id ซ้ำ
+    virtual = [devices[i % len(devices)] for i in range(args.devices or len(devices))]
+    print(f'จำลอง {len(virtual)} อุปกรณ์ (จริง {len(devices)}) protocol {args.protocol} '
+          f'{args.rate} req/s นาน {args.duration}s (ramp-up {args.ramp_up}s)', file=sys.stderr)
+    return await LoadTest(args, virtual, sensor_types).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='URL ของเซิร์ฟเวอร์')
+    parser.add_argument('--protocol', choices=('http', 'batch', 'ws'), default='http')
+    parser.add_argument('--devices', type=int, default=0, help='จำนวนอุปกรณ์จำลอง (0 คือเท่าที่มีในระบบ)')
+    parser.add_argument('--rate', type=float, default=100, help='คำขอต่อวินาทีรวมทุกอุปกรณ์')
+    parser.add_argument('--batch-size', type=int, default=20, help='จำนวนค่าต่อคำขอของ protocol batch')
+    parser.add_argument('--duration', type=float, default=30, help='ระยะเวลาทดสอบหลัง ramp-up (วินาที)')
+    parser.add_argument('--ramp-up', type=float, default=5, help='ทยอยเริ่มอุปกรณ์ภายในกี่วินาที')
+    parser.add_argument('--connections', type=int, default=100, help='จำนวนการเชื่อมต่อ HTTP สูงสุดใน pool')
+    parser.add_argument('--timeout', type=float, default=10, help='timeout ต่อคำขอ (วินาที)')
+    parser.add_argument('--keys-file', help='ไฟล์ "<device_id> <api_key>" บรรทัดละอุปกรณ์ (ใช้ X-API-Key)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--report-every', type=float, default=5, help='แสดงความคืบหน้าทุกกี่วินาที (0 คือไม่แสดง)')
+    parser.add_argument('--histogram', action='store_true', help='ใส่ bucket ของ histogram ในผลลัพธ์')
+    parser.add_argument('--output', help='บันทึกผลเป็น JSON (ไม่ระบุคือพิมพ์ออก stdout)')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    result = asyncio.run(main_async(args))
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
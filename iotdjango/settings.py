@@ -206,7 +206,7 @@ REST_FRAMEWORK = {
 
 # Channels settings
 # CHANNEL_LAYERS สำหรับ WebSocket
-# เลือก 1 ใน 3 แบบด้านล่าง:
+# เลือก 1 ใน 4 แบบด้านล่าง:
 
 # แบบที่ 1: ใช้ Redis (Production) - ต้องติดตั้ง Redis
 # CHANNEL_LAYERS = {
@@ -227,3 +227,103 @@ CHANNEL_LAYERS = {
 
 # แบบที่ 3: ปิด Channel Layer - WebSocket ไม่ทำงาน แต่ REST API ทำงานปกติ
 # CHANNEL_LAYERS = {}
+
+# แบบที่ 4: ใช้ไฟล์ SQLite ร่วมกัน (หลาย ASGI worker บนเครื่องเดียว) - ไม่ต้องติดตั้ง Redis
+# เลือกด้วย CHANNEL_LAYER=sqlite ทุก worker ต้องใช้ไฟล์เดียวกัน (CHANNEL_LAYER_PATH)
+if config('CHANNEL_LAYER', default='memory') == 'sqlite':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'sensors.channel_layers.SQLiteChannelLayer',
+            'CONFIG': {
+                'path': config('CHANNEL_LAYER_PATH', default=str(BASE_DIR / 'channels.sqlite3')),
+            },
+        },
+    }
+
+# Sensor ingest settings
+# จำนวนรายการสูงสุดต่อคำขอของ /api/sensor-data/batch
+SENSOR_BATCH_MAX_SIZE = config('SENSOR_BATCH_MAX_SIZE', default=1000, cast=int)
+
+# จำนวนจุดสูงสุดที่ /api/sensor-data/range ส่งกลับได้
+SENSOR_RANGE_MAX_POINTS = config('SENSOR_RANGE_MAX_POINTS', default=5000, cast=int)
+
+# โหมดบันทึกข้อมูล: direct (บันทึกทันที) หรือ buffered (รวมเป็นชุดด้วย writer thread)
+SENSOR_INGEST_MODE = config('SENSOR_INGEST_MODE', default='direct')
+
+SENSOR_INGEST_BUFFER = {
+    'MAX_SIZE': config('SENSOR_INGEST_MAX_SIZE', default=10000, cast=int),
+    'BATCH_SIZE': config('SENSOR_INGEST_BATCH_SIZE', default=500, cast=int),
+    'FLUSH_INTERVAL_MS': config('SENSOR_INGEST_FLUSH_INTERVAL_MS', default=200, cast=int),
+    # block (รอแล้วตอบ 503), reject (ตอบ 503 ทันที), drop_oldest (ทิ้งข้อมูลเก่าสุด)
+    'OVERFLOW': config('SENSOR_INGEST_OVERFLOW', default='block'),
+    'BLOCK_TIMEOUT_MS': config('SENSOR_INGEST_BLOCK_TIMEOUT_MS', default=500, cast=int),
+}
+
+# ข้อมูลที่เก่ากว่าจำนวนวันนี้จะถูกย้ายไป cold storage (คำสั่ง compact_sensor_data)
+SENSOR_COLD_AFTER_DAYS = config('SENSOR_COLD_AFTER_DAYS', default=30, cast=int)
+
+# ระยะเวลา (วินาที) ที่ใช้เกณฑ์แจ้งเตือนใน cache ก่อนโหลดใหม่
+# (process เดียวกันโหลดใหม่ทันทีเมื่อแก้ไขเกณฑ์)
+SENSOR_ALERT_RULES_TTL = config('SENSOR_ALERT_RULES_TTL', default=30, cast=int)
+
+# รวมการแจ้งเตือนซ้ำ: เปิดการแจ้งเตือนเดิมอีกครั้งถ้าเพิ่งปิดไปไม่เกิน COOLDOWN_SECONDS
+# และเขียนจำนวนครั้งที่เกิดซ้ำลงฐานข้อมูลทุก FLUSH_SECONDS
+SENSOR_ALERTS = {
+    'COOLDOWN_SECONDS': config('SENSOR_ALERT_COOLDOWN_SECONDS', default=300, cast=int),
+    'FLUSH_SECONDS': config('SENSOR_ALERT_FLUSH_SECONDS', default=5, cast=int),
+}
+
+# ตรวจจับอุปกรณ์ offline (คำสั่ง monitor_heartbeats)
+SENSOR_HEARTBEAT = {
+    # ช่วงเวลาส่งข้อมูลที่คาดไว้ (วินาที) ของอุปกรณ์ที่ไม่ได้กำหนด heartbeat_interval
+    'DEFAULT_INTERVAL': config('SENSOR_HEARTBEAT_INTERVAL', default=300, cast=int),
+    # ถือว่า offline เมื่อไม่ส่งข้อมูลนานกว่า interval * GRACE
+    'GRACE': config('SENSOR_HEARTBEAT_GRACE', default=2.0, cast=float),
+    # บันทึก last_seen_at ของอุปกรณ์เดียวกันไม่บ่อยกว่านี้ (วินาที)
+    'TOUCH_SECONDS': config('SENSOR_HEARTBEAT_TOUCH_SECONDS', default=10, cast=int),
+    'TICK_SECONDS': config('SENSOR_HEARTBEAT_TICK_SECONDS', default=5, cast=int),
+}
+
+# ตรวจจับค่าผิดปกติด้วย EWMA (แจ้งเตือนประเภท error เมื่อ |z| เกิน THRESHOLD)
+SENSOR_ANOMALY = {
+    'ENABLED': config('SENSOR_ANOMALY_ENABLED', default=True, cast=bool),
+    'ALPHA': config('SENSOR_ANOMALY_ALPHA', default=0.05, cast=float),
+    'THRESHOLD': config('SENSOR_ANOMALY_THRESHOLD', default=4.0, cast=float),
+    # จำนวนข้อมูลขั้นต่ำก่อนเริ่มให้คะแนน
+    'WARMUP': config('SENSOR_ANOMALY_WARMUP', default=30, cast=int),
+    'CHECKPOINT_SECONDS': config('SENSOR_ANOMALY_CHECKPOINT_SECONDS', default=30, cast=int),
+}
+
+# API key ของอุปกรณ์ (header X-API-Key) สำหรับ endpoint ที่รับข้อมูล
+SENSOR_API_KEYS = {
+    # True: คำขอที่ไม่มีคีย์ต้องเข้าสู่ระบบแล้ว / False: ยอมรับคำขอที่ไม่มีคีย์เหมือนเดิม
+    'REQUIRED': config('SENSOR_API_KEY_REQUIRED', default=False, cast=bool),
+    # อายุ (วินาที) และจำนวนคีย์สูงสุดใน cache ของแต่ละ process
+    'CACHE_TTL': config('SENSOR_API_KEY_CACHE_TTL', default=60, cast=int),
+    'CACHE_SIZE': config('SENSOR_API_KEY_CACHE_SIZE', default=10000, cast=int),
+}
+
+# WebSocket ข้อมูลเซ็นเซอร์ (ws/sensor-data/ ติดตามหลายอุปกรณ์ในการเชื่อมต่อเดียว)
+SENSOR_WEBSOCKET = {
+    # จำนวนอุปกรณ์สูงสุดต่อการเชื่อมต่อ
+    'MAX_DEVICES': config('SENSOR_WS_MAX_DEVICES', default=1000, cast=int),
+    # จำนวนข้อความข้อมูลเซ็นเซอร์สูงสุดต่อวินาทีต่อการเชื่อมต่อ (0 คือไม่จำกัด)
+    # ข้อมูลที่มาระหว่างรอจะถูกรวมเหลือค่าล่าสุดต่อ (อุปกรณ์, ประเภทเซ็นเซอร์)
+    'MAX_RATE': config('SENSOR_WS_MAX_RATE', default=10, cast=float),
+    # จำนวนเซ็นเซอร์ที่รอส่งได้สูงสุดต่อการเชื่อมต่อ (เกินแล้วทิ้งค่าที่รอนานที่สุด)
+    'MAX_PENDING': config('SENSOR_WS_MAX_PENDING', default=1000, cast=int),
+    # จำนวนข้อความล่าสุดต่ออุปกรณ์ที่เก็บไว้ให้ client ที่เชื่อมต่อใหม่ขอย้อนหลังด้วย last_seq
+    'REPLAY_BUFFER': config('SENSOR_WS_REPLAY_BUFFER', default=256, cast=int),
+}
+
+# รับข้อมูลเซ็นเซอร์ผ่าน MQTT (คำสั่ง mqtt_ingest)
+# topic ลงท้ายด้วย <device_id>/<sensor> โดย sensor เป็น id หรือชื่อประเภทเซ็นเซอร์
+MQTT = {
+    'HOST': config('MQTT_HOST', default='localhost'),
+    'PORT': config('MQTT_PORT', default=1883, cast=int),
+    'USERNAME': config('MQTT_USERNAME', default=''),
+    'PASSWORD': config('MQTT_PASSWORD', default=''),
+    'TOPIC': config('MQTT_TOPIC', default='devices/+/+'),
+    'QOS': config('MQTT_QOS', default=1, cast=int),
+    'KEEPALIVE': config('MQTT_KEEPALIVE', default=60, cast=int),
+}
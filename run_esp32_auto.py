@@ -7,23 +7,54 @@ ESP32 Simulator - Auto Mode
 
 import requests
 import json
+import os
 import time
 import random
 import math
 from datetime import datetime
 
+# ข้อมูล sensor
+SENSORS = {
+    "Temperature": {"id": 1, "min": 20, "max": 35, "unit": "C"},
+    "Humidity": {"id": 2, "min": 30, "max": 80, "unit": "%"},
+    "Light": {"id": 3, "min": 100, "max": 1000, "unit": "lux"}
+}
+
+
+def generate_sensor_value(sensor, now=None, rng=random):
+    """สุ่มค่า sensor แบบ realistic (ใช้ร่วมกับ benchmarks/loadgen.py)"""
+    now = time.time() if now is None else now
+    
+    # ค่าพื้นฐาน
+    base_value = (sensor["min"] + sensor["max"]) / 2
+    
+    # การเปลี่ยนแปลงตามเวลา (รูปคลื่น sine)
+    time_variation = math.sin(now / 10) * 5
+    
+    # การเปลี่ยนแปลงแบบสุ่ม
+    random_variation = rng.uniform(-3, 3)
+    
+    # รวมค่า
+    value = base_value + time_variation + random_variation
+    
+    # จำกัดค่าให้อยู่ในช่วง
+    value = max(sensor["min"], min(sensor["max"], value))
+    
+    return round(value, 2)
+
+
 class ESP32Simulator:
-    def __init__(self):
+    def __init__(self, api_key=None, device_id=None):
         self.session = requests.Session()
-        self.device_id = None
+        self.device_id = device_id
+        
+        # ใช้ API key ของอุปกรณ์แทนการ login (สร้างด้วย manage.py create_device_key)
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
         self.api_url = "http://127.0.0.1:8000/api"
         
         # ข้อมูล sensor
-        self.sensors = {
-            "Temperature": {"id": 1, "min": 20, "max": 35, "unit": "C"},
-            "Humidity": {"id": 2, "min": 30, "max": 80, "unit": "%"},
-            "Light": {"id": 3, "min": 100, "max": 1000, "unit": "lux"}
-        }
+        self.sensors = SENSORS
         
         # สถิติ
         self.sent_count = 0
@@ -102,24 +133,7 @@ class ESP32Simulator:
     
     def generate_sensor_value(self, sensor_name):
         """สุ่มค่า sensor แบบ realistic"""
-        sensor = self.sensors[sensor_name]
-        
-        # ค่าพื้นฐาน
-        base_value = (sensor["min"] + sensor["max"]) / 2
-        
-        # การเปลี่ยนแปลงตามเวลา (รูปคลื่น sine)
-        time_variation = math.sin(time.time() / 10) * 5
-        
-        # การเปลี่ยนแปลงแบบสุ่ม
-        random_variation = random.uniform(-3, 3)
-        
-        # รวมค่า
-        value = base_value + time_variation + random_variation
-        
-        # จำกัดค่าให้อยู่ในช่วง
-        value = max(sensor["min"], min(sensor["max"], value))
-        
-        return round(value, 2)
+        return generate_sensor_value(self.sensors[sensor_name])
     
     def send_sensor_data(self):
         """สร้างและส่งข้อมูล sensor"""
@@ -220,18 +234,23 @@ def main():
     print("ESP32 Simulator for Django IoT System (Auto Mode)")
     print("="*60)
     
-    # สร้าง simulator
-    simulator = ESP32Simulator()
+    # สร้าง simulator (ตั้ง ESP32_API_KEY และ ESP32_DEVICE_ID เพื่อไม่ต้อง login)
+    api_key = os.environ.get("ESP32_API_KEY")
+    device_id = os.environ.get("ESP32_DEVICE_ID")
+    simulator = ESP32Simulator(api_key=api_key, device_id=device_id)
     
-    # Login
-    if not simulator.login():
-        print("\nERROR: Cannot login to Django")
-        return
-    
-    # ดึงอุปกรณ์
-    if not simulator.get_device():
-        print("\nERROR: Cannot get device")
-        return
+    if api_key and device_id:
+        print(f"SUCCESS: Using API key for device {device_id}")
+    else:
+        # Login
+        if not simulator.login():
+            print("\nERROR: Cannot login to Django")
+            return
+        
+        # ดึงอุปกรณ์
+        if not simulator.get_device():
+            print("\nERROR: Cannot get device")
+            return
     
     # รันอัตโนมัติ: 5 นาที, ส่งทุก 5 วินาที
     simulator.run(duration_minutes=5, interval_seconds=5)
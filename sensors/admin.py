@@ -1,14 +1,15 @@
 from django.contrib import admin
-from .models import Device, SensorType, SensorData, SensorAlert
+from django.utils import timezone
+from .models import Device, SensorType, SensorData, SensorAlert, DeviceLatestReading, RetentionPolicy, AlertRule, AnomalyState, DeviceAPIKey
 
 
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'device_type', 'location', 'owner', 'is_active', 'created_at')
+    list_display = ('name', 'device_type', 'location', 'owner', 'is_active', 'last_seen_at', 'created_at')
     list_filter = ('device_type', 'is_active', 'created_at', 'owner')
     search_fields = ('name', 'location', 'description')
     list_editable = ('is_active',)
-    readonly_fields = ('id', 'created_at', 'updated_at')
+    readonly_fields = ('id', 'last_seen_at', 'created_at', 'updated_at')
 
 
 @admin.register(SensorType)
@@ -30,10 +31,59 @@ class SensorDataAdmin(admin.ModelAdmin):
     unit_display.short_description = 'หน่วย'
 
 
+@admin.register(DeviceLatestReading)
+class DeviceLatestReadingAdmin(admin.ModelAdmin):
+    list_display = ('device', 'sensor_type', 'value', 'timestamp')
+    list_filter = ('sensor_type', 'device')
+    search_fields = ('device__name', 'sensor_type__name')
+    readonly_fields = ('device', 'sensor_type', 'reading_id', 'value', 'timestamp')
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ('device', 'sensor_type', 'raw_days', 'minute_rollup_days',
+                    'hour_rollup_days', 'day_rollup_days')
+    list_filter = ('sensor_type', 'device')
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ('sensor_type', 'device', 'low_threshold', 'high_threshold', 'hysteresis', 'is_active')
+    list_filter = ('sensor_type', 'is_active', 'device')
+    list_editable = ('is_active',)
+
+
+@admin.register(AnomalyState)
+class AnomalyStateAdmin(admin.ModelAdmin):
+    list_display = ('device', 'sensor_type', 'count', 'mean', 'variance', 'updated_at')
+    list_filter = ('sensor_type', 'device')
+    readonly_fields = ('device', 'sensor_type', 'count', 'mean', 'variance', 'updated_at')
+
+
 @admin.register(SensorAlert)
 class SensorAlertAdmin(admin.ModelAdmin):
-    list_display = ('device', 'sensor_type', 'alert_type', 'message', 'is_resolved', 'created_at')
+    list_display = ('device', 'sensor_type', 'alert_type', 'message', 'score', 'occurrences',
+                    'last_triggered_at', 'is_resolved', 'created_at')
     list_filter = ('alert_type', 'is_resolved', 'created_at', 'device')
     search_fields = ('device__name', 'message')
     list_editable = ('is_resolved',)
-    readonly_fields = ('created_at', 'resolved_at')
\ No newline at end of file
+    readonly_fields = ('created_at', 'resolved_at')
+
+@admin.register(DeviceAPIKey)
+class DeviceAPIKeyAdmin(admin.ModelAdmin):
+    list_display = ('device', 'name', 'prefix', 'created_at', 'last_used_at', 'revoked_at')
+    list_filter = ('device',)
+    search_fields = ('device__name', 'name', 'prefix')
+    # สร้างคีย์ด้วยคำสั่ง create_device_key เพราะต้องแสดงตัวคีย์ให้ผู้ใช้
+    readonly_fields = ('device', 'prefix', 'key_hash', 'created_at', 'last_used_at', 'revoked_at')
+    actions = ['revoke']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='ยกเลิกคีย์ที่เลือก')
+    def revoke(self, request, queryset):
+        # save ทีละคีย์เพื่อให้ signal ล้าง cache
+        for api_key in queryset.filter(revoked_at__isnull=True):
+            api_key.revoked_at = timezone.now()
+            api_key.save(update_fields=['revoked_at'])
@@ -0,0 +1,334 @@
+"""
+ตรวจเกณฑ์แจ้งเตือน (AlertRule) กับข้อมูลเซ็นเซอร์ทุกรายการที่บันทึก
+
+เกณฑ์ทั้งหมดถูกโหลดเป็น index ในหน่วยความจำตาม (device_id, sensor_type_id)
+จึงตรวจได้ด้วยการค้น dict ไม่เกินสองครั้งต่อรายการ โดยไม่ต้อง query
+"""
+import atexit
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AlertRule, SensorAlert
+
+logger = logging.getLogger(__name__)
+
+
+class Threshold(NamedTuple):
+    high: Optional[float]
+    low: Optional[float]
+    hysteresis: float
+
+
+class ThresholdIndex:
+    """index ของเกณฑ์แจ้งเตือนและสถานะแจ้งเตือนที่ยังเปิดอยู่
+
+    โหลดใหม่เมื่อเกณฑ์ถูกแก้ไข (ผ่าน signal ใน process เดียวกัน)
+    หรือเมื่อครบ ``ttl`` วินาที (สำหรับ process อื่นที่ไม่ได้รับ signal)
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rules = None
+        self._firing = set()
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+    def _ensure_loaded(self):
+        # เรียกภายใต้ lock
+        if self._rules is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        self._rules = {
+            (rule.device_id, rule.sensor_type_id): Threshold(
+                rule.high_threshold, rule.low_threshold, rule.hysteresis
+            )
+            for rule in AlertRule.objects.filter(is_active=True)
+        }
+        # เริ่มจากการแจ้งเตือนที่ยังไม่ถูกแก้ไข เพื่อไม่ให้แจ้งซ้ำหลังรีสตาร์ท
+        self._firing = set(
+            SensorAlert.objects.filter(is_resolved=False, alert_type__in=('high', 'low'))
+            .values_list('device_id', 'sensor_type_id', 'alert_type')
+        )
+        self._loaded_at = time.monotonic()
+
+    def lookup(self, device_id, sensor_type_id):
+        """เกณฑ์ของอุปกรณ์นี้ ถ้าไม่มีใช้เกณฑ์ของประเภทเซ็นเซอร์"""
+        rules = self._rules
+        return rules.get((device_id, sensor_type_id)) or rules.get((None, sensor_type_id))
+
+    def evaluate(self, readings):
+        """ตรวจข้อมูลตามลำดับเวลา คืนค่า (การแจ้งเตือนใหม่ที่ยังไม่บันทึก, key ที่กลับสู่ปกติ)"""
+        triggered = []
+        cleared = []
+        # การแจ้งเตือนที่เกิดในชุดนี้ (ยังไม่บันทึก) ตาม key
+        pending = {}
+        with self._lock:
+            self._ensure_loaded()
+            if not self._rules:
+                return triggered, cleared
+
+            firing = self._firing
+            for sensor_data in sorted(readings, key=lambda r: r.timestamp):
+                threshold = self.lookup(sensor_data.device_id, sensor_data.sensor_type_id)
+                if threshold is None:
+                    continue
+                value = sensor_data.value
+
+                for alert_type, limit in (('high', threshold.high), ('low', threshold.low)):
+                    if limit is None:
+                        continue
+                    key = (sensor_data.device_id, sensor_data.sensor_type_id, alert_type)
+                    if alert_type == 'high':
+                        breached = value > limit
+                        recovered = value < limit - threshold.hysteresis
+                    else:
+                        breached = value < limit
+                        recovered = value > limit + threshold.hysteresis
+
+                    if key in firing:
+                        if recovered:
+                            firing.discard(key)
+                            alert = pending.pop(key, None)
+                            if alert is None:
+                                cleared.append(key)
+                            else:
+                                # เกิดและกลับสู่ปกติในชุดเดียวกัน บันทึกเป็นแก้ไขแล้วเลย
+                                alert.is_resolved = True
+                                alert.resolved_at = sensor_data.timestamp
+                    elif breached:
+                        firing.add(key)
+                        alert = pending[key] = _build_alert(sensor_data, alert_type, limit)
+                        triggered.append(alert)
+        return triggered, cleared
+
+
+def _build_alert(sensor_data, alert_type, limit):
+    sensor_type = sensor_data.sensor_type
+    label = 'สูงกว่า' if alert_type == 'high' else 'ต่ำกว่า'
+    return SensorAlert(
+        device=sensor_data.device,
+        sensor_type=sensor_type,
+        alert_type=alert_type,
+        message=f"{sensor_type.name} {label}เกณฑ์: {sensor_data.value} {sensor_type.unit} (เกณฑ์ {limit})",
+        threshold_value=limit,
+        actual_value=sensor_data.value,
+    )
+
+
+def alert_key(alert):
+    return alert.device_id, alert.sensor_type_id, alert.alert_type
+
+
+class AlertStore:
+    """ผู้บันทึกการแจ้งเตือนทั้งหมด พร้อมรวมการแจ้งเตือนซ้ำ
+
+    - ถ้ามีการแจ้งเตือนของ (อุปกรณ์, ประเภทเซ็นเซอร์, ประเภทการแจ้งเตือน) เปิดอยู่
+      จะเพิ่มจำนวนครั้งและค่าล่าสุดแทนการสร้างแถวใหม่
+    - ถ้าเพิ่งปิดไปไม่เกิน ``cooldown`` วินาที จะเปิดการแจ้งเตือนเดิมอีกครั้ง
+    - การเพิ่มจำนวนครั้งถูกเก็บไว้แล้วเขียนเป็นชุดทุก ``flush_seconds`` วินาที
+      ส่วนการสร้าง เปิดใหม่ และปิด บันทึกทันที
+    """
+
+    UPDATE_FIELDS = ['occurrences', 'actual_value', 'score', 'last_triggered_at',
+                     'is_resolved', 'resolved_at']
+
+    def __init__(self, cooldown=300, flush_seconds=5, ttl=30):
+        self.cooldown = cooldown
+        self.flush_seconds = flush_seconds
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._open = None
+        self._recent = {}
+        self._dirty = {}
+        self._loaded_at = 0.0
+        self._flushed_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        # เรียกภายใต้ lock
+        if self._open is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        self._write_dirty()
+        self._open = {
+            alert_key(alert): alert
+            for alert in SensorAlert.objects.filter(is_resolved=False).order_by('created_at')
+        }
+        self._loaded_at = time.monotonic()
+
+    def _write_dirty(self):
+        if self._dirty:
+            SensorAlert.objects.bulk_update(list(self._dirty.values()), self.UPDATE_FIELDS, batch_size=500)
+            self._dirty = {}
+        self._flushed_at = time.monotonic()
+
+    def submit(self, candidates, now=None):
+        """รับการแจ้งเตือนที่ยังไม่บันทึก คืนการแจ้งเตือนที่ควรส่งต่อ (สร้างใหม่หรือเปิดอีกครั้ง)"""
+        now = now or timezone.now()
+        created = []
+        changed = []
+        with self._lock:
+            self._ensure_loaded()
+            for candidate in candidates:
+                key = alert_key(candidate)
+                current = self._open.get(key)
+                if current is None:
+                    recent = self._recent.pop(key, None)
+                    if recent is not None and (now - recent.resolved_at).total_seconds() < self.cooldown:
+                        # ยังอยู่ในช่วง cooldown เปิดการแจ้งเตือนเดิมอีกครั้ง
+                        current = recent
+                        current.is_resolved = False
+                        current.resolved_at = None
+                        changed.append(current)
+                    else:
+                        candidate.last_triggered_at = now
+                        created.append(candidate)
+                        if candidate.is_resolved:
+                            self._recent[key] = candidate
+                        else:
+                            self._open[key] = candidate
+                        continue
+                    self._open[key] = current
+
+                # ยังเกิดต่อเนื่อง: อัปเดตการแจ้งเตือนที่เปิดอยู่
+                current.occurrences += 1
+                current.actual_value = candidate.actual_value
+                current.score = candidate.score
+                current.last_triggered_at = now
+                if candidate.is_resolved:
+                    self._close(key, candidate.resolved_at or now)
+                    if current not in changed:
+                        changed.append(current)
+                elif current.pk and current not in changed:
+                    self._dirty[current.pk] = current
+
+            with transaction.atomic():
+                if created:
+                    SensorAlert.objects.bulk_create(created)
+                saved = [alert for alert in changed if alert.pk]
+                if saved:
+                    SensorAlert.objects.bulk_update(saved, self.UPDATE_FIELDS)
+                    for alert in saved:
+                        self._dirty.pop(alert.pk, None)
+            if time.monotonic() - self._flushed_at >= self.flush_seconds:
+                self._write_dirty()
+        return created + [alert for alert in changed if not alert.is_resolved]
+
+    def _close(self, key, resolved_at):
+        alert = self._open.pop(key, None)
+        if alert is not None:
+            alert.is_resolved = True
+            alert.resolved_at = resolved_at
+            self._recent[key] = alert
+        return alert
+
+    def resolve(self, keys, now=None):
+        """ปิดการแจ้งเตือนของ key ที่กลับสู่ปกติ"""
+        if not keys:
+            return
+        now = now or timezone.now()
+        with self._lock:
+            self._ensure_loaded()
+            closed = []
+            unknown = []
+            for key in keys:
+                alert = self._close(key, now)
+                if alert is None:
+                    unknown.append(key)
+                elif alert.pk:
+                    closed.append(alert)
+                    self._dirty.pop(alert.pk, None)
+
+            with transaction.atomic():
+                if closed:
+                    SensorAlert.objects.bulk_update(closed, self.UPDATE_FIELDS)
+                if unknown:
+                    # เปิดโดย process อื่นหลังจากโหลดครั้งล่าสุด
+                    condition = Q()
+                    for device_id, sensor_type_id, alert_type in unknown:
+                        condition |= Q(device_id=device_id, sensor_type_id=sensor_type_id, alert_type=alert_type)
+                    SensorAlert.objects.filter(condition, is_resolved=False).update(
+                        is_resolved=True, resolved_at=now
+                    )
+
+    def forget(self, alert):
+        """เลิกติดตามการแจ้งเตือนที่ถูกปิดจากภายนอก (เช่น ผู้ใช้กดแก้ไข)"""
+        with self._lock:
+            if self._open is None:
+                return
+            key = alert_key(alert)
+            current = self._open.get(key)
+            if current is not None and current.pk == alert.pk:
+                del self._open[key]
+            self._dirty.pop(alert.pk, None)
+
+    def flush(self, force=False):
+        """เขียนการอัปเดตที่ค้างอยู่ถ้าถึงเวลา (หรือทันทีเมื่อ force)"""
+        with self._lock:
+            if force or time.monotonic() - self._flushed_at >= self.flush_seconds:
+                self._write_dirty()
+                # ทิ้งการแจ้งเตือนที่พ้นช่วง cooldown แล้ว
+                horizon = timezone.now()
+                self._recent = {
+                    key: alert for key, alert in self._recent.items()
+                    if (horizon - alert.resolved_at).total_seconds() < self.cooldown
+                }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_threshold_index():
+    """index ของ process นี้ (สร้างเมื่อเรียกครั้งแรก)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ThresholdIndex(ttl=settings.SENSOR_ALERT_RULES_TTL)
+        return _index
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_alert_store():
+    """ผู้บันทึกการแจ้งเตือนของ process นี้ (สร้างเมื่อเรียกครั้งแรก)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            options = settings.SENSOR_ALERTS
+            _store = AlertStore(
+                cooldown=options['COOLDOWN_SECONDS'],
+                flush_seconds=options['FLUSH_SECONDS'],
+                ttl=settings.SENSOR_ALERT_RULES_TTL,
+            )
+            atexit.register(_flush_at_exit)
+        return _store
+
+
+def _flush_at_exit():
+    # ตอนปิด process ฐานข้อมูลอาจใช้ไม่ได้แล้ว (เช่น ฐานข้อมูลทดสอบที่ถูกลบไปแล้ว)
+    store = _store
+    if store is None:
+        return
+    try:
+        store.flush(force=True)
+    except DatabaseError as e:
+        logger.info("บันทึกจำนวนครั้งของการแจ้งเตือนตอนปิด process ไม่สำเร็จ: %s", e)
+
+
+def check_readings(readings):
+    """ตรวจเกณฑ์แจ้งเตือนของข้อมูลที่บันทึกแล้ว บันทึกผล และคืนการแจ้งเตือนที่ควรส่งต่อ"""
+    triggered, cleared = get_threshold_index().evaluate(readings)
+    store = get_alert_store()
+    store.resolve(cleared)
+    return store.submit(triggered)
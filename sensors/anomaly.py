@@ -0,0 +1,207 @@
+"""
+ตรวจจับค่าผิดปกติแบบ online ด้วย EWMA ของค่าเฉลี่ยและความแปรปรวน
+
+แต่ละ (device_id, sensor_type_id) เก็บสถานะเพียง [จำนวน, ค่าเฉลี่ย, ความแปรปรวน]
+คะแนนคือ z = (ค่า - ค่าเฉลี่ยก่อนหน้า) / ส่วนเบี่ยงเบนมาตรฐานก่อนหน้า
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .alerts import get_alert_store
+from .models import AnomalyState, SensorAlert
+from .upsert import bulk_upsert
+
+logger = logging.getLogger(__name__)
+
+
+class AnomalyDetector:
+    """สถานะ EWMA ของทุกเซ็นเซอร์ในหน่วยความจำ พร้อม checkpoint ลงฐานข้อมูลเป็นระยะ"""
+
+    def __init__(self, alpha=0.05, threshold=4.0, warmup=30, checkpoint_seconds=30):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.checkpoint_seconds = checkpoint_seconds
+        self._lock = threading.Lock()
+        self._states = None
+        self._dirty = set()
+        self._checkpointed_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        # เรียกภายใต้ lock
+        if self._states is None:
+            self._states = {
+                (device_id, sensor_type_id): [count, mean, variance]
+                for device_id, sensor_type_id, count, mean, variance in AnomalyState.objects.values_list(
+                    'device_id', 'sensor_type_id', 'count', 'mean', 'variance'
+                )
+            }
+
+    def update(self, key, value):
+        """อัปเดตสถานะด้วยค่าใหม่ คืนคะแนน z (None ถ้ายังเก็บข้อมูลไม่พอ)
+
+        ต้องเรียกภายใต้ lock
+        """
+        state = self._states.get(key)
+        self._dirty.add(key)
+        if state is None:
+            self._states[key] = [1, value, 0.0]
+            return None
+
+        count, mean, variance = state
+        score = None
+        if count >= self.warmup and variance > 0:
+            score = (value - mean) / math.sqrt(variance)
+
+        diff = value - mean
+        increment = self.alpha * diff
+        state[0] = count + 1
+        state[1] = mean + increment
+        state[2] = (1 - self.alpha) * (variance + diff * increment)
+        return score
+
+    def evaluate(self, readings):
+        """อัปเดตสถานะตามลำดับเวลา คืนรายการ (ข้อมูล, คะแนน) ที่ผิดปกติ"""
+        anomalies = []
+        with self._lock:
+            self._ensure_loaded()
+            for sensor_data in sorted(readings, key=lambda r: r.timestamp):
+                score = self.update((sensor_data.device_id, sensor_data.sensor_type_id), sensor_data.value)
+                if score is not None and abs(score) > self.threshold:
+                    anomalies.append((sensor_data, score))
+            due = time.monotonic() - self._checkpointed_at >= self.checkpoint_seconds
+        if due:
+            self.checkpoint()
+        return anomalies
+
+    def checkpoint(self):
+        """บันทึกสถานะที่เปลี่ยนไปตั้งแต่ checkpoint ก่อนหน้าด้วย upsert เดียว"""
+        with self._lock:
+            if not self._dirty:
+                return
+            now = timezone.now()
+            rows = [
+                (device_id, sensor_type_id, *self._states[(device_id, sensor_type_id)], now)
+                for device_id, sensor_type_id in self._dirty
+            ]
+            self._dirty = set()
+            self._checkpointed_at = time.monotonic()
+
+        bulk_upsert(
+            AnomalyState,
+            ['device', 'sensor_type', 'count', 'mean', 'variance', 'updated_at'],
+            rows,
+            conflict_fields=['device', 'sensor_type'],
+            updates={
+                'count': 'excluded."count"',
+                'mean': 'excluded."mean"',
+                'variance': 'excluded."variance"',
+                'updated_at': 'excluded."updated_at"',
+            }
+        )
+
+
+def build_anomaly_alert(sensor_data, score):
+    sensor_type = sensor_data.sensor_type
+    return SensorAlert(
+        device=sensor_data.device,
+        sensor_type=sensor_type,
+        alert_type='error',
+        message=f"{sensor_type.name} ผิดปกติ: {sensor_data.value} {sensor_type.unit} (z = {score:.1f})",
+        actual_value=sensor_data.value,
+        score=score,
+    )
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_anomaly_detector():
+    """ตัวตรวจจับของ process นี้ (สร้างเมื่อเรียกครั้งแรก)"""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            options = settings.SENSOR_ANOMALY
+            _detector = AnomalyDetector(
+                alpha=options['ALPHA'],
+                threshold=options['THRESHOLD'],
+                warmup=options['WARMUP'],
+                checkpoint_seconds=options['CHECKPOINT_SECONDS'],
+            )
+            atexit.register(_checkpoint_at_exit)
+        return _detector
+
+
+def _checkpoint_at_exit():
+    # ตอนปิด process ฐานข้อมูลอาจใช้ไม่ได้แล้ว (เช่น ฐานข้อมูลทดสอบที่ถูกลบไปแล้ว)
+    # สถานะที่ไม่ได้บันทึกมีผลเพียงต้องเริ่มเก็บค่าใหม่ จึงไม่ต้องแสดง error
+    detector = _detector
+    if detector is None:
+        return
+    try:
+        detector.checkpoint()
+    except DatabaseError as e:
+        logger.info("บันทึกสถานะตรวจจับค่าผิดปกติตอนปิด process ไม่สำเร็จ: %s", e)
+
+
+def check_anomalies(readings):
+    """ตรวจค่าผิดปกติของข้อมูลที่บันทึกแล้ว บันทึกการแจ้งเตือน และคืนการแจ้งเตือนที่ควรส่งต่อ"""
+    if not settings.SENSOR_ANOMALY['ENABLED']:
+        return []
+    anomalies = get_anomaly_detector().evaluate(readings)
+    if not anomalies:
+        return []
+    return get_alert_store().submit(
+        [build_anomaly_alert(sensor_data, score) for sensor_data, score in anomalies]
+    )
+
+
+def _linear_recurrence(inputs, decay, initial):
+    """y[i] = decay * y[i-1] + inputs[i] โดย y[-1] = initial แบบ vectorized
+
+    คำนวณเป็นช่วง ๆ เพื่อไม่ให้ decay ** -k ล้นช่วงของ float64
+    """
+    out = np.empty_like(inputs)
+    block = max(1, int(500 / -math.log(decay))) if decay < 1 else len(inputs)
+    previous = initial
+    for start in range(0, len(inputs), block):
+        chunk = inputs[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        # y[j] = decay^(j+1) * (previous + sum_k x[k] / decay^(k+1))
+        out[start:start + len(chunk)] = powers * (previous + np.cumsum(chunk / powers))
+        previous = out[start + len(chunk) - 1]
+    return out
+
+
+def ewma_scores(values, alpha=0.05, warmup=30):
+    """คะแนน z ของทุกจุดแบบเดียวกับ AnomalyDetector (เริ่มจากสถานะว่าง)
+
+    คืน array ขนาดเท่า values โดยจุดที่ยังไม่มีคะแนนเป็น NaN
+    """
+    values = np.asarray(values, dtype=float)
+    scores = np.full(len(values), np.nan)
+    if len(values) < 2:
+        return scores
+
+    decay = 1 - alpha
+    x = values[1:]
+    # ค่าเฉลี่ยหลังแต่ละจุด: m[i] = decay * m[i-1] + alpha * x[i], m[0] = ค่าแรก
+    means = np.concatenate(([values[0]], _linear_recurrence(alpha * x, decay, values[0])))
+    diff = x - means[:-1]
+    # ความแปรปรวนหลังแต่ละจุด: v[i] = decay * v[i-1] + decay * alpha * diff[i]^2
+    variances = np.concatenate(([0.0], _linear_recurrence(decay * alpha * diff * diff, decay, 0.0)))
+
+    previous_variance = variances[:-1]
+    counts = np.arange(1, len(values))
+    valid = (counts >= warmup) & (previous_variance > 0)
+    scores[1:][valid] = diff[valid] / np.sqrt(previous_variance[valid])
+    return scores
@@ -1,11 +1,26 @@
 from ninja import NinjaAPI, Schema
+from ninja.errors import HttpError
+from ninja.pagination import paginate
 from ninja.security import django_auth
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from .models import Device, SensorType, SensorData, SensorAlert
+from django.utils import timezone
+from .models import Device, SensorType, SensorData, SensorAlert, DeviceLatestReading
+from .buffer import BufferFull
+from .ingest import submit_readings, save_readings, get_ingest_buffer
+from .rollups import range_stats
+from .history import load_series, iter_rows
+from .export import iter_export, streaming_export_response, FORMATS as EXPORT_FORMATS
+from .downsample import downsample, METHODS as DOWNSAMPLE_METHODS
+from . import frames
+from .synthetic import PROFILES as MOCK_PROFILES, get_or_create_sensor_types, sample_values
+from .pagination import KeysetPagination, SensorDataPagination
+from .auth import ingest_auth
 from typing import List, Optional
-from datetime import datetime, timedelta
-import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+import uuid
+import numpy as np
 
 User = get_user_model()
 
@@ -24,6 +39,8 @@ class DeviceSchema(Schema):
     location: str
     description: str
     is_active: bool
+    heartbeat_interval: Optional[int]
+    last_seen_at: Optional[datetime]
     created_at: datetime
     
     @staticmethod
@@ -63,6 +80,12 @@ class SensorDataSchema(Schema):
         return obj.sensor_type.unit
 
 
+class LatestSensorDataSchema(SensorDataSchema):
+    @staticmethod
+    def resolve_id(obj):
+        return str(obj.reading_id)
+
+
 class SensorDataCreateSchema(Schema):
     device_id: str
     sensor_type_id: int
@@ -70,16 +93,78 @@ class SensorDataCreateSchema(Schema):
     raw_data: Optional[dict] = None
 
 
+class SensorDataBatchItemSchema(SensorDataCreateSchema):
+    timestamp: Optional[datetime] = None
+
+
+class SensorDataBatchSchema(Schema):
+    readings: List[SensorDataBatchItemSchema]
+
+
+class BatchAcceptedSchema(Schema):
+    index: int
+    id: str
+
+
+class BatchRejectedSchema(Schema):
+    index: int
+    error: str
+
+
+class SensorDataBatchResultSchema(Schema):
+    accepted: List[BatchAcceptedSchema]
+    rejected: List[BatchRejectedSchema]
+
+
+class SensorDataFrameResultSchema(Schema):
+    accepted: int
+    rejected: List[BatchRejectedSchema]
+
+
+class SensorStatsSchema(Schema):
+    sensor_type_id: int
+    sensor_type: str
+    unit: str
+    count: int
+    min: float
+    max: float
+    avg: float
+    stddev: float
+
+
+class SensorSeriesSchema(Schema):
+    device_id: str
+    sensor_type_id: int
+    sensor_type: str
+    unit: str
+    start: datetime
+    end: datetime
+    method: str
+    raw_count: int
+    points: List[List[float]]
+
+
 class SensorAlertSchema(Schema):
     id: int
     device: str
-    sensor_type: str
+    sensor_type: Optional[str]
     alert_type: str
     message: str
     threshold_value: Optional[float]
     actual_value: Optional[float]
+    score: Optional[float]
+    occurrences: int
+    last_triggered_at: Optional[datetime]
     is_resolved: bool
     created_at: datetime
+    
+    @staticmethod
+    def resolve_device(obj):
+        return obj.device.name
+    
+    @staticmethod
+    def resolve_sensor_type(obj):
+        return obj.sensor_type.name if obj.sensor_type else None
 
 
 # Device endpoints
@@ -121,47 +206,170 @@ def list_sensor_types(request):
 
 
 # Sensor Data endpoints
-@api.post("/sensor-data", response=SensorDataSchema)
+@api.post("/sensor-data", response=SensorDataSchema, auth=ingest_auth)
 def create_sensor_data(request, data: SensorDataCreateSchema):
     """บันทึกข้อมูลเซ็นเซอร์"""
-    device = get_object_or_404(Device, id=data.device_id)
+    device = _get_ingest_device(request, data.device_id)
     sensor_type = get_object_or_404(SensorType, id=data.sensor_type_id)
     
-    sensor_data = SensorData.objects.create(
+    sensor_data = SensorData(
         device=device,
         sensor_type=sensor_type,
         value=data.value,
         raw_data=data.raw_data
     )
     
-    # ส่งข้อมูลผ่าน WebSocket
-    from channels.layers import get_channel_layer
-    from asgiref.sync import async_to_sync
-    
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"sensor_data_{device.id}",
-        {
-            "type": "sensor_data",
-            "data": {
-                "id": str(sensor_data.id),
-                "device": device.name,
-                "sensor_type": sensor_type.name,
-                "value": sensor_data.value,
-                "unit": sensor_type.unit,
-                "timestamp": sensor_data.timestamp.isoformat()
-            }
-        }
-    )
+    # บันทึกและส่งข้อมูลผ่าน WebSocket
+    _submit_or_503([sensor_data])
     
     return sensor_data
 
 
+@api.post("/sensor-data/batch", response=SensorDataBatchResultSchema, auth=ingest_auth)
+def create_sensor_data_batch(request, data: SensorDataBatchSchema):
+    """บันทึกข้อมูลเซ็นเซอร์หลายรายการในคำขอเดียว"""
+    if len(data.readings) > settings.SENSOR_BATCH_MAX_SIZE:
+        raise HttpError(413, f"ส่งได้สูงสุด {settings.SENSOR_BATCH_MAX_SIZE} รายการต่อครั้ง")
+    
+    # ตรวจสอบ device_id ที่ไม่ใช่ UUID ก่อน query
+    device_ids = set()
+    for item in data.readings:
+        try:
+            device_ids.add(uuid.UUID(item.device_id))
+        except ValueError:
+            pass
+    
+    # ดึงอุปกรณ์และประเภทเซ็นเซอร์ทั้งหมดด้วย query เดียวต่อโมเดล
+    # (คำขอที่ใช้ API key ส่งได้เฉพาะอุปกรณ์ของคีย์ ซึ่งโหลดไว้แล้ว)
+    if request.device is not None:
+        devices = {request.device.id: request.device}
+    else:
+        devices = {d.id: d for d in Device.objects.filter(id__in=device_ids)}
+    sensor_types = SensorType.objects.in_bulk({item.sensor_type_id for item in data.readings})
+    
+    readings = []
+    accepted = []
+    rejected = []
+    for index, item in enumerate(data.readings):
+        try:
+            device = devices.get(uuid.UUID(item.device_id))
+        except ValueError:
+            device = None
+        if device is None:
+            if request.device is not None:
+                error = f"API key นี้ใช้ได้เฉพาะอุปกรณ์ {request.device.id}"
+            else:
+                error = f"ไม่พบอุปกรณ์ {item.device_id}"
+            rejected.append({"index": index, "error": error})
+            continue
+        
+        sensor_type = sensor_types.get(item.sensor_type_id)
+        if sensor_type is None:
+            rejected.append({"index": index, "error": f"ไม่พบประเภทเซ็นเซอร์ {item.sensor_type_id}"})
+            continue
+        
+        timestamp = item.timestamp or timezone.now()
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        
+        sensor_data = SensorData(
+            device=device,
+            sensor_type=sensor_type,
+            value=item.value,
+            timestamp=timestamp,
+            raw_data=item.raw_data
+        )
+        readings.append(sensor_data)
+        accepted.append({"index": index, "id": str(sensor_data.id)})
+    
+    # บันทึกและส่งข้อมูลผ่าน WebSocket หนึ่งข้อความต่ออุปกรณ์
+    _submit_or_503(readings)
+    
+    return {"accepted": accepted, "rejected": rejected}
+
+
+@api.post(
+    "/sensor-data/frame",
+    response=SensorDataFrameResultSchema,
+    auth=ingest_auth,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                content_type: {"schema": {"type": "string", "format": "binary"}}
+                for content_type in frames.CONTENT_TYPES
+            },
+        }
+    },
+)
+def create_sensor_data_frame(request):
+    """บันทึกข้อมูลเซ็นเซอร์จาก frame แบบไบนารี (msgpack หรือ struct ดู sensors/frames.py)"""
+    if request.content_type not in frames.CONTENT_TYPES:
+        raise HttpError(415, f"รองรับ Content-Type: {', '.join(frames.CONTENT_TYPES)}")
+    try:
+        frame = frames.decode(request.body, request.content_type)
+    except frames.FrameError as e:
+        raise HttpError(400, str(e))
+    if len(frame) > settings.SENSOR_BATCH_MAX_SIZE:
+        raise HttpError(413, f"ส่งได้สูงสุด {settings.SENSOR_BATCH_MAX_SIZE} รายการต่อครั้ง")
+
+    device = _get_ingest_device(request, frame.device_id)
+    sensor_types = SensorType.objects.in_bulk(set(frame.sensor_type_ids))
+    timestamps = frame.timestamps(timezone.now())
+
+    readings = []
+    rejected = []
+    for index, sensor_type_id in enumerate(frame.sensor_type_ids):
+        sensor_type = sensor_types.get(sensor_type_id)
+        if sensor_type is None:
+            rejected.append({"index": index, "error": f"ไม่พบประเภทเซ็นเซอร์ {sensor_type_id}"})
+            continue
+        readings.append(SensorData(
+            device=device,
+            sensor_type=sensor_type,
+            value=frame.values[index],
+            timestamp=timestamps[index],
+            raw_data=frame.extras
+        ))
+
+    _submit_or_503(readings)
+
+    return {"accepted": len(readings), "rejected": rejected}
+
+
+def _get_ingest_device(request, device_id):
+    """อุปกรณ์ที่ส่งข้อมูล: ใช้อุปกรณ์ของ API key โดยไม่ query หรือค้นจาก device_id"""
+    if request.device is None:
+        return get_object_or_404(Device, id=device_id)
+    try:
+        same_device = uuid.UUID(str(device_id)) == request.device.id
+    except ValueError:
+        same_device = False
+    if not same_device:
+        raise HttpError(403, f"API key นี้ใช้ได้เฉพาะอุปกรณ์ {request.device.id}")
+    return request.device
+
+
+def _submit_or_503(readings):
+    try:
+        submit_readings(readings)
+    except BufferFull:
+        raise HttpError(503, "ระบบบันทึกข้อมูลไม่ว่าง กรุณาลองใหม่อีกครั้ง")
+
+
+@api.get("/ingest/stats")
+def ingest_stats(request):
+    """สถิติของคิวบันทึกข้อมูล (โหมด buffered)"""
+    if settings.SENSOR_INGEST_MODE != 'buffered':
+        return {"mode": settings.SENSOR_INGEST_MODE}
+    return {"mode": "buffered", **get_ingest_buffer().get_stats()}
+
+
 @api.get("/sensor-data", response=List[SensorDataSchema])
+@paginate(SensorDataPagination, ordering_field='timestamp')
 def list_sensor_data(request, device_id: Optional[str] = None, 
-                    sensor_type_id: Optional[int] = None,
-                    limit: int = 100):
-    """รายการข้อมูลเซ็นเซอร์"""
+                    sensor_type_id: Optional[int] = None):
+    """รายการข้อมูลเซ็นเซอร์ (แบ่งหน้าด้วย cursor ใน next/prev)"""
     queryset = SensorData.objects.select_related('device', 'sensor_type')
     
     if device_id:
@@ -172,77 +380,152 @@ def list_sensor_data(request, device_id: Optional[str] = None,
     if sensor_type_id:
         queryset = queryset.filter(sensor_type_id=sensor_type_id)
     
-    return queryset[:limit]
+    return queryset
 
 
-@api.get("/sensor-data/latest", response=List[SensorDataSchema])
+@api.get("/sensor-data/latest", response=List[LatestSensorDataSchema])
 def get_latest_sensor_data(request, device_id: Optional[str] = None):
     """ข้อมูลเซ็นเซอร์ล่าสุด"""
-    queryset = SensorData.objects.select_related('device', 'sensor_type')
+    queryset = DeviceLatestReading.objects.select_related('device', 'sensor_type')
     
     if device_id:
         queryset = queryset.filter(device_id=device_id, device__owner=request.user)
     else:
         queryset = queryset.filter(device__owner=request.user)
     
-    # เอาเฉพาะข้อมูลล่าสุดของแต่ละเซ็นเซอร์
-    latest_data = {}
-    for data in queryset.order_by('-timestamp'):
-        key = f"{data.device.id}_{data.sensor_type.id}"
-        if key not in latest_data:
-            latest_data[key] = data
+    # ตารางค่าล่าสุดมีหนึ่งแถวต่อเซ็นเซอร์ จึงไม่ต้องไล่ประวัติทั้งหมด
+    return queryset
+
+
+@api.get("/sensor-data/stats", response=List[SensorStatsSchema])
+def get_sensor_stats(request, device_id: str, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None, sensor_type_id: Optional[int] = None):
+    """สถิติของช่วงเวลา (ค่าเริ่มต้น 24 ชั่วโมงล่าสุด) จากตาราง rollup"""
+    device = get_object_or_404(Device, id=device_id, owner=request.user)
+    
+    end = end or timezone.now()
+    start = start or end - timedelta(days=1)
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
     
-    return list(latest_data.values())
+    return range_stats(device, start, end, sensor_type_id=sensor_type_id)
 
 
-# Mock data for testing
-@api.post("/mock-data")
-def generate_mock_data(request, device_id: str, count: int = 10):
-    """สร้างข้อมูลจำลองสำหรับทดสอบ"""
+@api.get("/sensor-data/range", response=SensorSeriesSchema)
+def get_sensor_data_range(request, device_id: str, sensor_type_id: int,
+                          start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          points: int = 500, method: str = "lttb"):
+    """ข้อมูลช่วงเวลาสำหรับวาดกราฟ ลดจำนวนจุดให้เหลือไม่เกิน points"""
     device = get_object_or_404(Device, id=device_id, owner=request.user)
+    sensor_type = get_object_or_404(SensorType, id=sensor_type_id)
     
-    # สร้างประเภทเซ็นเซอร์ถ้ายังไม่มี
-    temp_type, _ = SensorType.objects.get_or_create(
-        name="Temperature",
-        defaults={'unit': '°C', 'description': 'อุณหภูมิ'}
-    )
-    humidity_type, _ = SensorType.objects.get_or_create(
-        name="Humidity",
-        defaults={'unit': '%', 'description': 'ความชื้น'}
-    )
-    light_type, _ = SensorType.objects.get_or_create(
-        name="Light",
-        defaults={'unit': 'lux', 'description': 'ความเข้มแสง'}
-    )
+    if method not in DOWNSAMPLE_METHODS:
+        raise HttpError(400, f"method ต้องเป็น {' หรือ '.join(DOWNSAMPLE_METHODS)}")
+    if not 3 <= points <= settings.SENSOR_RANGE_MAX_POINTS:
+        raise HttpError(400, f"points ต้องอยู่ระหว่าง 3 ถึง {settings.SENSOR_RANGE_MAX_POINTS}")
+    
+    end = end or timezone.now()
+    start = start or end - timedelta(days=1)
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+    
+    series = load_series(device.id, sensor_type.id, start, end)
+    sampled = downsample(series, points, method)
+    
+    return {
+        "device_id": str(device.id),
+        "sensor_type_id": sensor_type.id,
+        "sensor_type": sensor_type.name,
+        "unit": sensor_type.unit,
+        "start": start,
+        "end": end,
+        "method": method,
+        "raw_count": len(series),
+        # [epoch มิลลิวินาที, ค่า]
+        "points": np.column_stack((sampled['t'] * 1000, sampled['v'])).tolist(),
+    }
+
+
+@api.get("/sensor-data/export")
+def export_sensor_data(request, device_id: Optional[str] = None,
+                       sensor_type_id: Optional[int] = None,
+                       start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       format: str = "csv", gzip: bool = False):
+    """ส่งออกข้อมูลเซ็นเซอร์เป็น CSV หรือ NDJSON แบบ stream"""
+    if format not in EXPORT_FORMATS:
+        raise HttpError(400, f"format ต้องเป็น {' หรือ '.join(EXPORT_FORMATS)}")
+    
+    devices = Device.objects.filter(owner=request.user)
+    if device_id:
+        devices = devices.filter(id=get_object_or_404(devices, id=device_id).id)
+    device_names = dict(devices.values_list('id', 'name'))
+    sensor_types = {
+        sensor_type_id: (name, unit)
+        for sensor_type_id, name, unit in SensorType.objects.values_list('id', 'name', 'unit')
+    }
+    
+    if start and timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if end and timezone.is_naive(end):
+        end = timezone.make_aware(end)
     
-    sensor_types = [temp_type, humidity_type, light_type]
-    created_data = []
-    
-    for i in range(count):
-        for sensor_type in sensor_types:
-            if sensor_type.name == "Temperature":
-                value = round(random.uniform(20, 35), 2)
-            elif sensor_type.name == "Humidity":
-                value = round(random.uniform(30, 80), 2)
-            else:  # Light
-                value = round(random.uniform(100, 1000), 2)
-            
-            sensor_data = SensorData.objects.create(
-                device=device,
-                sensor_type=sensor_type,
-                value=value,
-                raw_data={"mock": True, "iteration": i}
-            )
-            created_data.append(sensor_data)
-    
-    return {"message": f"สร้างข้อมูลจำลอง {len(created_data)} รายการสำเร็จ"}
+    rows = iter_rows(list(device_names), start=start, end=end, sensor_type_id=sensor_type_id)
+    chunks = iter_export(rows, format, device_names, sensor_types, compress=gzip)
+    filename = f"sensor-data-{device_id or 'all'}.{format}"
+    return streaming_export_response(request, chunks, format, filename, compress=gzip)
+
+
+# Mock data for testing
+MOCK_SENSOR_TYPES = ["Temperature", "Humidity", "Light"]
+
+
+@api.post("/mock-data")
+def generate_mock_data(request, device_id: str, count: int = 10, interval: int = 0):
+    """สร้างข้อมูลจำลองสำหรับทดสอบ
+
+    สร้าง ``count`` จุดต่อประเภทเซ็นเซอร์ ห่างกัน ``interval`` วินาทีย้อนหลังจากปัจจุบัน
+    (0 คือทุกจุดเป็นเวลาปัจจุบัน) แล้วบันทึกด้วย INSERT เดียว
+    """
+    device = get_object_or_404(Device, id=device_id, owner=request.user)
+    sensor_types = get_or_create_sensor_types(MOCK_SENSOR_TYPES)
+    if not 1 <= count * len(sensor_types) <= settings.SENSOR_BATCH_MAX_SIZE or interval < 0:
+        raise HttpError(400, f"สร้างได้ 1 ถึง {settings.SENSOR_BATCH_MAX_SIZE} รายการต่อครั้ง และ interval ต้องไม่ติดลบ")
+
+    rng = np.random.default_rng()
+    times = timezone.now().timestamp() - interval * np.arange(count - 1, -1, -1, dtype=np.float64)
+    stamps = [datetime.fromtimestamp(t, tz=dt_timezone.utc) for t in times.tolist()]
+    columns = [
+        (sensor_type, sample_values(MOCK_PROFILES[sensor_type.name], times, rng).tolist())
+        for sensor_type in sensor_types
+    ]
+    readings = [
+        SensorData(
+            device=device,
+            sensor_type=sensor_type,
+            value=values[i],
+            timestamp=stamps[i],
+            raw_data={"mock": True, "iteration": i}
+        )
+        for i in range(count)
+        for sensor_type, values in columns
+    ]
+    save_readings(readings)
+
+    return {"message": f"สร้างข้อมูลจำลอง {len(readings)} รายการสำเร็จ"}
 
 
 # Alert endpoints
 @api.get("/alerts", response=List[SensorAlertSchema])
+@paginate(KeysetPagination, ordering_field='created_at')
 def list_alerts(request, is_resolved: Optional[bool] = None):
-    """รายการการแจ้งเตือน"""
-    queryset = SensorAlert.objects.filter(device__owner=request.user)
+    """รายการการแจ้งเตือน (แบ่งหน้าด้วย cursor ใน next/prev)"""
+    queryset = SensorAlert.objects.select_related('device', 'sensor_type').filter(
+        device__owner=request.user
+    )
     
     if is_resolved is not None:
         queryset = queryset.filter(is_resolved=is_resolved)
@@ -0,0 +1,125 @@
+"""
+ยืนยันตัวตนอุปกรณ์ด้วย API key (header ``X-API-Key``)
+
+คีย์ที่ตรวจแล้วถูกเก็บใน cache แบบ LRU พร้อมอายุ ``ttl`` วินาที
+คำขอส่วนใหญ่จึงตรวจคีย์ได้ด้วยการคำนวณ SHA-256 และค้น dict โดยไม่ query
+การยกเลิกคีย์มีผลทันทีใน process เดียวกัน (ผ่าน signal) และภายใน ``ttl`` สำหรับ process อื่น
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from ninja.errors import AuthenticationError
+from ninja.security import APIKeyHeader
+
+from .models import DeviceAPIKey
+
+KEY_PREFIX = 'dk_'
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_api_key(device, name=''):
+    """สร้างคีย์ใหม่ของอุปกรณ์ คืนค่า (DeviceAPIKey, คีย์ที่ต้องส่งให้อุปกรณ์)"""
+    key = KEY_PREFIX + secrets.token_urlsafe(32)
+    api_key = DeviceAPIKey.objects.create(
+        device=device,
+        name=name,
+        prefix=key[:len(KEY_PREFIX) + 8],
+        key_hash=hash_key(key),
+    )
+    return api_key, key
+
+
+class APIKeyCache:
+    """cache ของ key_hash -> อุปกรณ์ (None คือคีย์ที่ไม่ถูกต้อง)"""
+
+    def __init__(self, ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def lookup(self, key_hash):
+        """อุปกรณ์ของคีย์ (query เฉพาะเมื่อไม่มีใน cache หรือหมดอายุ)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key_hash)
+                return entry[0]
+
+        api_key = (
+            DeviceAPIKey.objects.select_related('device')
+            .filter(key_hash=key_hash, revoked_at__isnull=True, device__is_active=True)
+            .first()
+        )
+        device = api_key.device if api_key else None
+        if api_key is not None:
+            # บันทึกการใช้งานไม่เกินหนึ่งครั้งต่อ ttl ต่อ process
+            DeviceAPIKey.objects.filter(pk=api_key.pk).update(last_used_at=timezone.now())
+
+        with self._lock:
+            self._entries[key_hash] = (device, now)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return device
+
+    def invalidate(self, key_hash=None):
+        """ลบคีย์ออกจาก cache (ไม่ระบุคือลบทั้งหมด)"""
+        with self._lock:
+            if key_hash is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key_hash, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_api_key_cache():
+    """cache ของ process นี้ (สร้างเมื่อเรียกครั้งแรก)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            options = settings.SENSOR_API_KEYS
+            _cache = APIKeyCache(ttl=options['CACHE_TTL'], max_size=options['CACHE_SIZE'])
+        return _cache
+
+
+class DeviceKeyAuth(APIKeyHeader):
+    """ยืนยันตัวตนด้วย X-API-Key แล้วตั้ง ``request.device`` เป็นอุปกรณ์เจ้าของคีย์"""
+
+    param_name = 'X-API-Key'
+
+    def authenticate(self, request, key):
+        if not key:
+            return None
+        device = get_api_key_cache().lookup(hash_key(key))
+        if device is None:
+            # ส่งคีย์มาแต่ไม่ถูกต้อง ไม่ให้ไปใช้วิธียืนยันตัวตนอื่นต่อ
+            raise AuthenticationError()
+        request.device = device
+        return device
+
+
+def legacy_auth(request):
+    """คำขอที่ไม่มี API key: ยอมรับเหมือนเดิมจนกว่าจะตั้ง SENSOR_API_KEYS['REQUIRED']
+    จากนั้นยอมรับเฉพาะผู้ใช้ที่เข้าสู่ระบบแล้ว
+    """
+    request.device = None
+    if not settings.SENSOR_API_KEYS['REQUIRED']:
+        return True
+    return request.user if request.user.is_authenticated else None
+
+
+# สำหรับ endpoint ที่รับข้อมูลจากอุปกรณ์
+ingest_auth = [DeviceKeyAuth(), legacy_auth]
@@ -0,0 +1,196 @@
+"""
+บัฟเฟอร์แบบ write-behind สำหรับรวมข้อมูลเซ็นเซอร์เป็นชุดก่อนบันทึก
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_REJECT = 'reject'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+
+
+class BufferFull(Exception):
+    """คิวเต็มและนโยบายกำหนดให้ปฏิเสธข้อมูลใหม่"""
+
+
+class IngestBuffer:
+    """คิวขนาดจำกัดที่มี writer thread เดียวคอยบันทึกข้อมูลเป็นชุด
+
+    writer จะ flush เมื่อมีข้อมูลครบ ``batch_size`` รายการ หรือเมื่อข้อมูลแรกใน
+    ชุดรอครบ ``flush_interval_ms`` มิลลิวินาที แล้วแต่อย่างใดถึงก่อน
+    """
+
+    def __init__(self, flush_func, max_size=10000, batch_size=500,
+                 flush_interval_ms=200, overflow=OVERFLOW_BLOCK, block_timeout_ms=500):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_REJECT, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f"ไม่รู้จักนโยบาย overflow: {overflow}")
+
+        self.flush_func = flush_func
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow = overflow
+        self.block_timeout = block_timeout_ms / 1000
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # สถิติ
+        self.enqueued = 0
+        self.flushed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        """เริ่ม writer thread (เรียกซ้ำได้)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sensor-ingest-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """หยุด writer thread หลังจาก flush ข้อมูลที่ค้างอยู่"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def put(self, item):
+        """ใส่ข้อมูลหนึ่งรายการลงคิวตามนโยบาย overflow"""
+        self.put_many([item])
+
+    def put_many(self, items):
+        """ใส่ข้อมูลหลายรายการลงคิวตามนโยบาย overflow แบบทั้งหมดหรือไม่เลย
+
+        ถ้าที่ว่างไม่พอสำหรับทุกรายการ (block: ภายใน ``block_timeout``) จะ raise BufferFull
+        โดยไม่มีรายการใดเข้าคิว client ที่ส่งซ้ำหลังได้ 503 จึงไม่สร้างข้อมูลซ้ำ
+        ส่วน drop_oldest ทิ้งข้อมูลเก่าที่สุดในคิว (และในชุดเอง ถ้าชุดใหญ่กว่าคิว)
+        """
+        items = list(items)
+        if not items:
+            return
+        self.start()
+        q = self._queue
+        dropped = 0
+        with q.not_full:
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                if len(items) > self.max_size:
+                    dropped += len(items) - self.max_size
+                    items = items[-self.max_size:]
+                while self.max_size - q._qsize() < len(items):
+                    q._get()
+                    self._task_done_locked()
+                    dropped += 1
+            else:
+                deadline = time.monotonic() + self.block_timeout
+                while self.max_size - q._qsize() < len(items):
+                    remaining = deadline - time.monotonic()
+                    if (self.overflow == OVERFLOW_REJECT or remaining <= 0
+                            or len(items) > self.max_size):
+                        self._count('rejected', len(items))
+                        raise BufferFull("คิวบันทึกข้อมูลเต็ม")
+                    q.not_full.wait(remaining)
+            for item in items:
+                q._put(item)
+            q.unfinished_tasks += len(items)
+            q.not_empty.notify(len(items))
+        if dropped:
+            self._count('dropped', dropped)
+        self._count('enqueued', len(items))
+
+    def _task_done_locked(self):
+        # queue.Queue.task_done ที่ถือ mutex ของคิวอยู่แล้ว (mutex ไม่ใช่ RLock)
+        q = self._queue
+        q.unfinished_tasks -= 1
+        if q.unfinished_tasks == 0:
+            q.all_tasks_done.notify_all()
+
+    def join(self):
+        """รอจนข้อมูลทั้งหมดในคิวถูก flush แล้ว"""
+        self._queue.join()
+
+    def get_stats(self):
+        """สถิติของคิวและเวลาที่ใช้ flush"""
+        with self._lock:
+            return {
+                'depth': self._queue.qsize(),
+                'max_size': self.max_size,
+                'overflow': self.overflow,
+                'enqueued': self.enqueued,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'rejected': self.rejected,
+                'flush_count': self.flush_count,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.flush_count, 3) if self.flush_count else 0.0,
+            }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            elif self._stop.is_set():
+                break
+        close_old_connections()
+
+    def _collect(self):
+        # รอข้อมูลแรก แล้วเก็บต่อจนครบชุดหรือหมดเวลา
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                # หมดเวลาแล้ว เก็บเฉพาะข้อมูลที่อยู่ในคิวอยู่แล้ว
+                remaining = 0
+            try:
+                if remaining:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            self.flush_func(batch)
+            self._count('flushed', len(batch))
+        except Exception:
+            logger.exception("บันทึกข้อมูลเซ็นเซอร์ %d รายการไม่สำเร็จ", len(batch))
+            self._count('failed', len(batch))
+        finally:
+            close_old_connections()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.flush_count += 1
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self.total_flush_ms += elapsed_ms
+            for _ in batch:
+                self._queue.task_done()
@@ -0,0 +1,418 @@
+"""
+channel layer สำหรับหลาย process บนเครื่องเดียว โดยใช้ไฟล์ SQLite (WAL) แทน Redis
+
+ทุก worker (daphne/uvicorn หนึ่ง process ต่อ core) เปิดไฟล์เดียวกัน group_send จาก
+process ใดก็ถึง WebSocket ของทุก process
+
+- ข้อความถูก serialize ด้วย msgpack เก็บครั้งเดียวในตาราง ``payloads`` ส่วน ``deliveries``
+  มีหนึ่งแถวต่อปลายทาง
+- channel ของ process (``new_channel``) มี ``inbox`` ร่วมกันต่อ process ซึ่ง task เดียวต่อ process
+  ดึงเป็นชุดแล้วกระจายเข้า queue ในหน่วยความจำ จึงมี query หนึ่งครั้งต่อรอบไม่ว่ามีกี่การเชื่อมต่อ
+- group_send เขียนหนึ่งแถวต่อ process ที่มีสมาชิกใน group (ไม่ใช่ต่อ channel) แล้ว process นั้น
+  ส่งให้ channel ของตัวเองที่อยู่ใน group ตามที่บันทึกไว้ตอน group_add ข้อความหนึ่งจึงถูก
+  deserialize ครั้งเดียวต่อ process และส่งให้ทุก channel โดยไม่คัดลอก ดังนั้น group_add ของ
+  channel จาก new_channel ต้องเรียกใน process ที่สร้าง channel นั้น (แบบที่ consumer ทำ)
+- ข้อความหมดอายุหลัง ``expiry`` วินาที (channel หรือ process ที่มีข้อความหมดอายุถูกนำออกจาก
+  ทุก group เหมือน InMemoryChannelLayer ซึ่งเก็บกวาด channel ที่ไม่มีใครรับแล้ว) และ channel หนึ่ง
+  มีข้อความรอได้ไม่เกิน ``capacity`` (send จะ raise ChannelFull ส่วน group_send ข้าม channel นั้น)
+  send นับเฉพาะข้อความที่ยังอยู่ในไฟล์ ข้อความที่ process ดึงเข้า queue แล้วจึงตรวจอีกครั้งตอนกระจาย
+  ถ้า queue ของ channel มีข้อความครบ capacity ข้อความนั้นถูกทิ้ง (ผู้ส่งไม่ได้รับ ChannelFull)
+
+การเข้าถึงไฟล์ทำใน thread แยกหนึ่ง thread ต่อ process เพื่อไม่ block event loop
+"""
+import asyncio
+import random
+import sqlite3
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer, InMemoryChannelLayer, get_channel_layer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payloads (
+    id INTEGER PRIMARY KEY,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY,
+    inbox TEXT NOT NULL,
+    channel TEXT,           -- ส่งถึง channel เดียว
+    group_name TEXT,        -- หรือถึงทุก channel ของ inbox ที่อยู่ใน group
+    payload_id INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deliveries_inbox ON deliveries (inbox, id);
+CREATE INDEX IF NOT EXISTS deliveries_channel ON deliveries (channel, expires);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    inbox TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+) WITHOUT ROWID;
+"""
+
+# channel ของ process (inbox ต่างจากชื่อ channel): หนึ่งแถวต่อ process ที่มีสมาชิกใน group
+# (process ตรวจ capacity ของ channel เองตอนกระจาย)
+GROUP_INBOX_DELIVERY_SQL = """
+INSERT INTO deliveries (inbox, group_name, payload_id, expires)
+SELECT DISTINCT g.inbox, g.group_name, ?, ?
+FROM group_members g
+WHERE g.group_name = ? AND g.expires > ? AND g.inbox != g.channel
+"""
+
+# channel ทั่วไป: หนึ่งแถวต่อ channel ที่ยังรับข้อความได้
+GROUP_CHANNEL_DELIVERY_SQL = """
+INSERT INTO deliveries (inbox, channel, payload_id, expires)
+SELECT g.inbox, g.channel, ?, ?
+FROM group_members g
+WHERE g.group_name = ? AND g.expires > ? AND g.inbox = g.channel
+  AND (SELECT COUNT(*) FROM deliveries d WHERE d.channel = g.channel AND d.expires > ?) < ?
+"""
+
+
+def connect(path, timeout=5.0):
+    """เปิดไฟล์ SQLite ในโหมด WAL (autocommit เปิด transaction เองด้วย BEGIN)"""
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # WAL + NORMAL ไม่ fsync ทุก commit (ข้อความอายุไม่กี่วินาที ไม่ต้องทนไฟดับ)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def local_layer_warning():
+    """ข้อความเตือนถ้า channel layer ของ process นี้ส่งข้อความถึง process อื่นไม่ได้ (None ถ้าใช้ร่วมกันได้)
+
+    ใช้ใน command ที่ทำงานเป็น process แยกแต่กระจายข้อมูลไปยัง WebSocket ของ web server
+    """
+    layer = get_channel_layer()
+    if layer is None:
+        return 'ไม่ได้ตั้งค่า CHANNEL_LAYERS ข้อมูลจะถูกบันทึกแต่ไม่ถูกส่งไปยัง WebSocket'
+    if isinstance(layer, InMemoryChannelLayer):
+        return ('channel layer เป็น InMemoryChannelLayer ซึ่งใช้ได้เฉพาะใน process เดียว '
+                'ข้อมูลจะถูกบันทึกแต่ไม่ถึง WebSocket ของ web server '
+                'ตั้ง CHANNEL_LAYER=sqlite (หรือใช้ Redis) ให้ทุก process ใช้ channel layer เดียวกัน')
+    return None
+
+
+@contextmanager
+def write_transaction(conn):
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK เมื่อเกิด exception)"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+class _LocalChannel:
+    __slots__ = ('queue', 'receivers', 'last_used', 'groups')
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.receivers = 0
+        self.last_used = time.monotonic()
+        self.groups = set()
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    """channel layer ที่ใช้ไฟล์ SQLite ร่วมกันระหว่าง process (ดูคำอธิบายของโมดูล)
+
+    การตรวจ inbox รอ ``poll_interval`` วินาทีหลังรอบที่มีข้อความ ถ้าไม่มีข้อความระยะรอเพิ่มเป็นสองเท่า
+    จนถึง ``max_poll_interval`` และกลับเป็น ``poll_interval`` เมื่อได้รับข้อความอีก ข้อความที่มาต่อเนื่อง
+    จึงหน่วงเพิ่มไม่เกิน ``poll_interval`` ส่วนข้อความแรกหลังว่างนานหน่วงได้ถึง ``max_poll_interval``
+    แลกกับการที่ process ที่ว่างไม่ต้องตรวจไฟล์ 200 ครั้งต่อวินาที
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path='channels.sqlite3', expiry=60, group_expiry=86400, capacity=100,
+                 poll_interval=0.005, max_poll_interval=0.1, batch_size=1000, cleanup_interval=1.0, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(max_poll_interval, poll_interval)
+        self.batch_size = batch_size
+        self.cleanup_interval = cleanup_interval
+        self.client_prefix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._thread = threading.local()
+        self._channels = {}    # channel ของ process นี้ -> _LocalChannel
+        self._groups = {}      # group -> set ของ channel ของ process นี้ใน group
+        self._inboxes = set()
+        self._poller = None
+        self._next_cleanup = 0.0
+        self._setup_lock = threading.Lock()
+        self._ready = False
+
+    # การเข้าถึงไฟล์ (ทำใน executor thread เท่านั้น)
+
+    def _conn(self):
+        conn = getattr(self._thread, 'conn', None)
+        if conn is None:
+            conn = self._thread.conn = connect(self.path)
+            with self._setup_lock:
+                if not self._ready:
+                    conn.executescript(SCHEMA)
+                    self._ready = True
+        return conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _insert_payload(self, conn, message):
+        return conn.execute(
+            'INSERT INTO payloads (body) VALUES (?)', (msgpack.packb(message, use_bin_type=True),)
+        ).lastrowid
+
+    def _send(self, channel, message, capacity):
+        now = time.time()
+        with write_transaction(self._conn()) as conn:
+            (pending,) = conn.execute(
+                'SELECT COUNT(*) FROM deliveries WHERE channel = ? AND expires > ?', (channel, now)
+            ).fetchone()
+            if pending >= capacity:
+                raise ChannelFull(channel)
+            conn.execute(
+                'INSERT INTO deliveries (inbox, channel, payload_id, expires) VALUES (?, ?, ?, ?)',
+                (self.non_local_name(channel), channel, self._insert_payload(conn, message), now + self.expiry),
+            )
+
+    def _group_send(self, messages):
+        now = time.time()
+        with write_transaction(self._conn()) as conn:
+            for group, message in messages:
+                payload_id = self._insert_payload(conn, message)
+                conn.execute(GROUP_INBOX_DELIVERY_SQL, (payload_id, now + self.expiry, group, now))
+                conn.execute(GROUP_CHANNEL_DELIVERY_SQL, (
+                    payload_id, now + self.expiry, group, now, now, self.get_capacity(group),
+                ))
+
+    def _group_add(self, group, channel):
+        with write_transaction(self._conn()) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO group_members (group_name, channel, inbox, expires) VALUES (?, ?, ?, ?)',
+                (group, channel, self.non_local_name(channel), time.time() + self.group_expiry),
+            )
+
+    def _group_discard(self, group, channel):
+        with write_transaction(self._conn()) as conn:
+            conn.execute('DELETE FROM group_members WHERE group_name = ? AND channel = ?', (group, channel))
+
+    def _claim(self, inboxes, channel=None, limit=None):
+        """นำข้อความที่ยังไม่หมดอายุของ inbox ออกจากคิว: [(channel, group, expires, message), ...] ตามลำดับ
+
+        ข้อความเดียวกัน (payload เดียวกัน) ถูก deserialize ครั้งเดียวและใช้ object เดียวกัน
+        """
+        now = time.time()
+        placeholders = ', '.join('?' * len(inboxes))
+        sql = f'SELECT id FROM deliveries WHERE inbox IN ({placeholders})'
+        params = list(inboxes)
+        if channel is not None:
+            sql += ' AND channel = ?'
+            params.append(channel)
+        conn = self._conn()
+        # ตรวจแบบอ่านอย่างเดียวก่อน เพื่อไม่ถือ write lock ของไฟล์ทุกรอบที่ไม่มีข้อความ
+        if conn.execute(sql + ' LIMIT 1', params).fetchone() is None:
+            return []
+        sql += ' ORDER BY id LIMIT ?'
+        params.append(limit or self.batch_size)
+
+        with write_transaction(conn):
+            rows = conn.execute(
+                f'DELETE FROM deliveries WHERE id IN ({sql}) RETURNING id, channel, group_name, payload_id, expires',
+                params,
+            ).fetchall()
+            if not rows:
+                return []
+            payload_ids = {row[3] for row in rows}
+            bodies = dict(conn.execute(
+                f'SELECT id, body FROM payloads WHERE id IN ({", ".join("?" * len(payload_ids))})',
+                list(payload_ids),
+            ))
+
+        rows.sort()
+        messages = {}
+        result = []
+        for _, channel_name, group, payload_id, expires in rows:
+            if expires <= now or payload_id not in bodies:
+                continue
+            message = messages.get(payload_id)
+            if message is None:
+                message = messages[payload_id] = msgpack.unpackb(bodies[payload_id], raw=False, use_list=False)
+            result.append((channel_name, group, expires, message))
+        return result
+
+    def _cleanup(self):
+        now = time.time()
+        with write_transaction(self._conn()) as conn:
+            # ข้อความของ process ที่หมดอายุแปลว่า process นั้นไม่ได้รับข้อความแล้ว
+            conn.execute(
+                'DELETE FROM group_members WHERE expires <= ? '
+                'OR channel IN (SELECT channel FROM deliveries WHERE expires <= ? AND channel IS NOT NULL) '
+                'OR inbox IN (SELECT inbox FROM deliveries WHERE expires <= ? AND group_name IS NOT NULL)',
+                (now, now, now),
+            )
+            conn.execute('DELETE FROM deliveries WHERE expires <= ?', (now,))
+            # payload ที่เก่ากว่าข้อความที่ยังรอส่งทั้งหมดไม่มีใครอ้างถึงแล้ว (id เพิ่มขึ้นเสมอ)
+            conn.execute(
+                'DELETE FROM payloads WHERE id < COALESCE('
+                '(SELECT MIN(payload_id) FROM deliveries), (SELECT MAX(id) + 1 FROM payloads))'
+            )
+
+    def _flush(self):
+        with write_transaction(self._conn()) as conn:
+            conn.execute('DELETE FROM deliveries')
+            conn.execute('DELETE FROM payloads')
+            conn.execute('DELETE FROM group_members')
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        await self._run(self._send, channel, message, self.get_capacity(channel))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        local = self._channels.get(channel)
+        if local is None:
+            return await self._receive_direct(channel)
+
+        self._ensure_poller()
+        local.receivers += 1
+        try:
+            while True:
+                expires, message = await local.queue.get()
+                if expires > time.time():
+                    return message
+        finally:
+            local.receivers -= 1
+            local.last_used = time.monotonic()
+
+    async def _receive_direct(self, channel):
+        # channel ทั่วไป (ไม่ได้สร้างด้วย new_channel ของ process นี้) ตรวจไฟล์โดยตรง
+        delay = self.poll_interval
+        while True:
+            messages = await self._run(self._claim, [self.non_local_name(channel)], channel, 1)
+            if messages:
+                return messages[0][3]
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def new_channel(self, prefix='specific'):
+        inbox = f'{prefix}.{self.client_prefix}!'
+        channel = inbox + ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        self._inboxes.add(inbox)
+        self._channels[channel] = _LocalChannel()
+        self._ensure_poller()
+        return channel
+
+    async def flush(self):
+        await self._run(self._flush)
+        self._groups.clear()
+        for local in self._channels.values():
+            local.groups.clear()
+            while not local.queue.empty():
+                local.queue.get_nowait()
+
+    def stream_buffer(self, size):
+        """StreamBuffer ในไฟล์เดียวกัน (ดู sensors.streams.get_stream_buffer)"""
+        from .streams import SQLiteStreamBuffer
+
+        return SQLiteStreamBuffer(self.path, size)
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._group_add, group, channel)
+        local = self._channels.get(channel)
+        if local is not None:
+            local.groups.add(group)
+            self._groups.setdefault(group, set()).add(channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        await self._run(self._group_discard, group, channel)
+        local = self._channels.get(channel)
+        if local is not None:
+            local.groups.discard(group)
+            self._discard_local(group, channel)
+
+    async def group_send(self, group, message):
+        await self.group_send_many([(group, message)])
+
+    async def group_send_many(self, messages):
+        """group_send หลายข้อความใน transaction เดียว: [(group, message), ...]"""
+        for group, message in messages:
+            assert isinstance(message, dict), 'Message is not a dict'
+            self.require_valid_group_name(group)
+        if messages:
+            await self._run(self._group_send, messages)
+
+    # รับข้อความของ channel ใน process นี้
+
+    def _ensure_poller(self):
+        loop = asyncio.get_running_loop()
+        if self._poller is None or self._poller.done() or self._poller.get_loop() is not loop:
+            self._poller = loop.create_task(self._poll())
+
+    async def _poll(self):
+        delay = self.poll_interval
+        while self._channels:
+            now = time.monotonic()
+            if now >= self._next_cleanup:
+                self._next_cleanup = now + self.cleanup_interval
+                await self._run(self._cleanup)
+                for group, channel in self._forget_idle_channels(now):
+                    await self._run(self._group_discard, group, channel)
+
+            messages = await self._run(self._claim, sorted(self._inboxes))
+            for channel, group, expires, message in messages:
+                for channel in (channel,) if channel is not None else self._groups.get(group, ()):
+                    local = self._channels.get(channel)
+                    # เหมือน group_send ของ channel ทั่วไป: ข้าม channel ที่มีข้อความรอครบ capacity
+                    if local is not None and local.queue.qsize() < self.get_capacity(channel):
+                        local.queue.put_nowait((expires, message))
+            if messages:
+                delay = self.poll_interval
+                if len(messages) >= self.batch_size:
+                    continue
+            await asyncio.sleep(delay)
+            if not messages:
+                delay = min(delay * 2, self.max_poll_interval)
+
+    def _forget_idle_channels(self, now):
+        """ลืม channel ที่ไม่มีใครรอรับนานกว่า expiry (consumer ปิดไปแล้ว) คืน (group, channel) ที่ต้องนำออก"""
+        memberships = []
+        for channel, local in list(self._channels.items()):
+            if local.receivers == 0 and now - local.last_used > self.expiry:
+                del self._channels[channel]
+                for group in local.groups:
+                    self._discard_local(group, channel)
+                    memberships.append((group, channel))
+        return memberships
+
+    def _discard_local(self, group, channel):
+        members = self._groups.get(group)
+        if members is not None:
+            members.discard(channel)
+            if not members:
+                del self._groups[group]
@@ -0,0 +1,214 @@
+"""
+cold storage: ย้ายข้อมูลเซ็นเซอร์เก่าไปเก็บเป็นก้อนบีบอัดรายวัน และอ่านกลับมารวมกับข้อมูลปกติ
+
+ก้อนข้อมูลเก็บเฉพาะเวลาและค่า (ไม่เก็บ raw_data) และ id ของแต่ละจุดเป็น
+UUID ที่สร้างจาก (อุปกรณ์, ประเภทเซ็นเซอร์, เวลา) id และ cursor ที่ client ถืออยู่
+จึงยังชี้จุดเดิมแม้ก้อนถูกรวมข้อมูลที่มาช้าเข้าไปใหม่
+"""
+import heapq
+import uuid
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+
+from . import gorilla
+from .models import SensorData, SensorDataSegment
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# namespace สำหรับสร้าง id ของข้อมูลใน cold storage
+COLD_NAMESPACE = uuid.UUID('6a0f6e53-51c9-4c4e-9d8e-3f3c2a7b9e10')
+
+
+def _to_micros(timestamp):
+    return (timestamp - EPOCH) // ONE_MICROSECOND
+
+
+def _from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def day_range(day):
+    """ช่วงเวลา [เริ่มวัน, เริ่มวันถัดไป) ของวันที่ (UTC)"""
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def encode_points(points):
+    """บีบอัดรายการ (timestamp, value) ที่เรียงตามเวลาแล้ว"""
+    return gorilla.encode([_to_micros(t) for t, _ in points], [v for _, v in points])
+
+
+def decode_points(payload):
+    """แตกก้อนข้อมูลกลับเป็นรายการ (timestamp, value)"""
+    timestamps, values = gorilla.decode(bytes(payload))
+    return [(_from_micros(t), v) for t, v in zip(timestamps, values)]
+
+
+def compact_day(device_id, sensor_type_id, day):
+    """ย้ายข้อมูลดิบของหนึ่งวันไปเป็นก้อนบีบอัด (รวมกับก้อนเดิมถ้ามี)
+
+    คืนค่า (จำนวนแถวที่ย้าย, ขนาดก้อนข้อมูลเป็น bytes)
+    """
+    day_start, day_end = day_range(day)
+    with transaction.atomic():
+        hot = SensorData.objects.filter(
+            device_id=device_id,
+            sensor_type_id=sensor_type_id,
+            timestamp__gte=day_start,
+            timestamp__lt=day_end
+        )
+        points = list(hot.order_by('timestamp').values_list('timestamp', 'value'))
+        if not points:
+            return 0, 0
+
+        existing = SensorDataSegment.objects.filter(
+            device_id=device_id, sensor_type_id=sensor_type_id, day=day
+        ).first()
+        moved = len(points)
+        if existing:
+            points = list(heapq.merge(decode_points(existing.payload), points, key=lambda p: p[0]))
+
+        values = [v for _, v in points]
+        payload = encode_points(points)
+        SensorDataSegment.objects.update_or_create(
+            device_id=device_id,
+            sensor_type_id=sensor_type_id,
+            day=day,
+            defaults={
+                'start_time': points[0][0],
+                'end_time': points[-1][0],
+                'count': len(points),
+                'min_value': min(values),
+                'max_value': max(values),
+                'payload': payload,
+            }
+        )
+        hot.delete()
+    return moved, len(payload)
+
+
+def cold_reading_id(device_id, sensor_type_id, micros, occurrence=0):
+    """id ของจุดใน cold storage
+
+    ``occurrence`` คือลำดับของจุดที่เวลาซ้ำกันในเซ็นเซอร์เดียวกัน (compact_day รวมจุดใหม่
+    ไว้หลังจุดเดิมที่เวลาเท่ากัน id ของจุดเดิมจึงไม่เปลี่ยน)
+    """
+    name = f'{device_id}:{sensor_type_id}:{micros}'
+    if occurrence:
+        name += f':{occurrence}'
+    return uuid.uuid5(COLD_NAMESPACE, name)
+
+
+def segment_readings(segment):
+    """แตกก้อนข้อมูลเป็น SensorData ที่ไม่ได้บันทึก (ต้อง select_related device, sensor_type มาแล้ว)"""
+    timestamps, values = gorilla.decode(bytes(segment.payload))
+    readings = []
+    previous, occurrence = None, 0
+    for micros, value in zip(timestamps, values):
+        occurrence = occurrence + 1 if micros == previous else 0
+        previous = micros
+        readings.append(SensorData(
+            id=cold_reading_id(segment.device_id, segment.sensor_type_id, micros, occurrence),
+            device=segment.device,
+            sensor_type=segment.sensor_type,
+            value=value,
+            timestamp=_from_micros(micros)
+        ))
+    return readings
+
+
+def reading_sort_key(sensor_data):
+    """ลำดับ (timestamp, id) แบบเดียวกับที่ฐานข้อมูลเรียง UUID"""
+    return sensor_data.timestamp, sensor_data.pk.hex
+
+
+def cold_page(segments, direction, value, pk, size, bound=None):
+    """ข้อมูลจาก cold storage ไม่เกิน size รายการ ถัดจากตำแหน่ง (value, pk)
+
+    ``direction`` เป็น ``next`` (เก่ากว่า เรียงใหม่ไปเก่า) หรือ ``prev``
+    (ใหม่กว่า เรียงเก่าไปใหม่) ส่วน ``bound`` คือเวลาที่ข้อมูลฝั่งปกติเต็มหน้าแล้ว
+    ก้อนที่อยู่เลยเวลานี้ไปจึงไม่ต้องแตกออกมา
+    """
+    newest_first = direction == 'next'
+    if newest_first:
+        if value is not None:
+            segments = segments.filter(start_time__lte=value)
+        if bound is not None:
+            segments = segments.filter(end_time__gte=bound)
+        segments = segments.order_by('-end_time')
+    else:
+        segments = segments.filter(end_time__gte=value)
+        if bound is not None:
+            segments = segments.filter(start_time__lte=bound)
+        segments = segments.order_by('start_time')
+
+    position = (value, uuid.UUID(str(pk)).hex) if value is not None else None
+    candidates = []
+    for segment in segments.select_related('device', 'sensor_type').iterator(chunk_size=20):
+        if len(candidates) >= size:
+            # ก้อนที่เหลืออยู่ไกลกว่ารายการสุดท้ายที่เก็บไว้แล้ว
+            worst = candidates[-1].timestamp
+            if newest_first and segment.end_time < worst:
+                break
+            if not newest_first and segment.start_time > worst:
+                break
+
+        for reading in segment_readings(segment):
+            if position is not None:
+                key = reading_sort_key(reading)
+                if newest_first and not key < position:
+                    continue
+                if not newest_first and not key > position:
+                    continue
+            candidates.append(reading)
+        candidates.sort(key=reading_sort_key, reverse=newest_first)
+        del candidates[size:]
+    return candidates
+
+
+def iter_cold_series(device_id, sensor_type_id, start, end):
+    """(epoch วินาที, ค่า) จาก cold storage ในช่วง [start, end) เรียงจากเก่าไปใหม่"""
+    segments = SensorDataSegment.objects.filter(
+        device_id=device_id,
+        sensor_type_id=sensor_type_id,
+        end_time__gte=start,
+        start_time__lt=end
+    ).order_by('day').only('payload')
+
+    for segment in segments.iterator(chunk_size=20):
+        for timestamp, value in decode_points(segment.payload):
+            if start <= timestamp < end:
+                yield timestamp.timestamp(), value
+
+
+def iter_cold_rows(device_ids, start=None, end=None, sensor_type_id=None):
+    """(timestamp, device_id, sensor_type_id, value) จาก cold storage เรียงจากเก่าไปใหม่"""
+    segments = SensorDataSegment.objects.filter(device_id__in=device_ids)
+    if sensor_type_id:
+        segments = segments.filter(sensor_type_id=sensor_type_id)
+    if start:
+        segments = segments.filter(end_time__gte=start)
+    if end:
+        segments = segments.filter(start_time__lt=end)
+    segments = segments.order_by('day').values_list('day', 'device_id', 'sensor_type_id', 'payload')
+
+    # ก้อนของวันเดียวกันเวลาซ้อนกันได้ จึงรวมทีละวัน ส่วนต่างวันเรียงกันอยู่แล้ว
+    current_day = None
+    day_rows = []
+    for day, device_id, sensor_type_id, payload in segments.iterator(chunk_size=20):
+        if day != current_day:
+            yield from _merge_day(day_rows, start, end)
+            current_day, day_rows = day, []
+        day_rows.append([
+            (timestamp, device_id, sensor_type_id, value)
+            for timestamp, value in decode_points(payload)
+        ])
+    yield from _merge_day(day_rows, start, end)
+
+
+def _merge_day(day_rows, start, end):
+    for row in heapq.merge(*day_rows, key=lambda r: r[0]):
+        if (start is None or row[0] >= start) and (end is None or row[0] < end):
+            yield row
@@ -1,13 +1,206 @@
+import asyncio
 import json
+import uuid
+from urllib.parse import parse_qs
+import msgpack
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Device, SensorData
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from .models import Device, DeviceLatestReading
+from .streams import get_stream_buffer
+from .throttle import LatestValueThrottle
 
+BINARY_SUBPROTOCOL = 'sensor.msgpack.v1'
+
+_packer = msgpack.Packer()
+
+
+def group_name(device_id):
+    return f'sensor_data_{device_id}'
+
+
+def serialize_latest_reading(latest):
+    """แปลงค่าล่าสุดเป็น dict รูปแบบเดียวกับ serialize_sensor_data"""
+    return {
+        'id': str(latest.reading_id),
+        'device_id': str(latest.device_id),
+        'device': latest.device.name,
+        'sensor_type_id': latest.sensor_type_id,
+        'sensor_type': latest.sensor_type.name,
+        'value': latest.value,
+        'unit': latest.sensor_type.unit,
+        'timestamp': latest.timestamp.isoformat()
+    }
+
+
+class WireFormatMixin:
+    """เลือกรูปแบบข้อความของการเชื่อมต่อ: JSON (ค่าเริ่มต้น) หรือ msgpack แบบไบนารี
+
+    client ที่ขอ subprotocol ``sensor.msgpack.v1`` ได้ทุกข้อความเป็น msgpack
+    ข้อความควบคุม (latest_data, subscribed, alert, pong, ...) เป็น map เหมือนฉบับ JSON
+    ส่วนข้อมูลเซ็นเซอร์เป็น array ของ ``[stream_id, epoch_ms, value, seq]`` โดย stream_id
+    คือหมายเลขของ (อุปกรณ์, ประเภทเซ็นเซอร์) ในการเชื่อมต่อนี้ ซึ่งประกาศครั้งเดียวก่อนใช้ครั้งแรกด้วย
+    ``{"type": "streams", "data": [[stream_id, device_id, device, sensor_type_id, sensor_type, unit], ...]}``
+    client ส่งข้อความมาเป็น JSON หรือ msgpack ก็ได้
+    """
+
+    def select_wire_format(self):
+        """subprotocol ที่ต้องตอบใน accept() (None คือ JSON)"""
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', ())
+        # (device_id, sensor_type_id) -> stream_id ที่ประกาศให้ client แล้ว
+        self.stream_ids = {}
+        return BINARY_SUBPROTOCOL if self.binary else None
+
+    async def send_message(self, message):
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(message))
+        else:
+            await self.send(text_data=json.dumps(message))
+
+    async def send_error(self, message):
+        await self.send_message({'type': 'error', 'message': message})
+
+    @staticmethod
+    def decode_message(text_data=None, bytes_data=None):
+        """ข้อความจาก client (raise ValueError ถ้าไม่ใช่ JSON หรือ msgpack ที่ถูกต้อง)"""
+        if bytes_data is not None:
+            try:
+                return msgpack.unpackb(bytes_data, raw=False)
+            except (ValueError, msgpack.UnpackException) as e:
+                raise ValueError(f'msgpack ไม่ถูกต้อง: {e}') from e
+        if text_data is None:
+            raise ValueError('ข้อความว่าง')
+        return json.loads(text_data)
+
+    async def encode_frame(self, entries):
+        """array msgpack ของแถว ``[stream_id, epoch_ms, value, seq]`` (ประกาศ stream ใหม่ก่อน)
+
+        แต่ละแถวคือ header ของ stream ต่อกับส่วนที่ reading_messages แปลงไว้แล้ว
+        """
+        rows, declared = [], []
+        stream_ids = self.stream_ids
+        for entry in entries:
+            key = (entry[0], entry[1])
+            prefix = stream_ids.get(key)
+            if prefix is None:
+                stream_id = len(stream_ids) + 1
+                prefix = stream_ids[key] = b'\x94' + msgpack.packb(stream_id)
+                data = json.loads(entry[2])
+                declared.append([stream_id, data['device_id'], data['device'],
+                                 data['sensor_type_id'], data['sensor_type'], data['unit']])
+            rows.append(prefix)
+            rows.append(entry[3])
+        if declared:
+            await self.send_message({'type': 'streams', 'data': declared})
+        return _packer.pack_array_header(len(entries)) + b''.join(rows)
+
+
+class ThrottledSendMixin:
+    """ส่งข้อมูลเซ็นเซอร์ผ่าน LatestValueThrottle ตาม SENSOR_WEBSOCKET['MAX_RATE']
+
+    ข้อมูลหนึ่งรายการส่งเป็น ``sensor_data`` หลายรายการส่งรวมเป็น ``sensor_data_batch``
+    โดยต่อ JSON ของแต่ละรายการที่ reading_messages แปลงไว้แล้ว (ไม่ json.dumps ซ้ำต่อ consumer)
+    การเชื่อมต่อแบบไบนารีได้ array ของแถวตาม WireFormatMixin แทน
+    """
+
+    def start_throttle(self):
+        options = settings.SENSOR_WEBSOCKET
+        self.throttle = LatestValueThrottle(
+            self.send_sensor_items,
+            max_rate=options['MAX_RATE'],
+            max_pending=options['MAX_PENDING'],
+        )
+
+    async def send_sensor_items(self, entries):
+        if self.binary:
+            await self.send(bytes_data=await self.encode_frame(entries))
+        elif len(entries) == 1:
+            await self.send(text_data='{"type": "sensor_data", "data": ' + entries[0][2] + '}')
+        else:
+            await self.send(text_data=(
+                '{"type": "sensor_data_batch", "data": [' + ', '.join(entry[2] for entry in entries) + ']}'
+            ))
+
+    async def send_stats(self):
+        await self.send_message({'type': 'stats', 'data': self.throttle.stats()})
+
+
+class StreamResumeMixin:
+    """ต่อ stream ของอุปกรณ์จาก seq ที่ client ได้รับล่าสุด (ดู sensors/streams.py)
+
+    อุปกรณ์ที่ต่อได้ส่งเป็น ``replay`` (ทุกข้อมูลที่พลาดไปจาก buffer) ส่วนที่ต่อไม่ได้
+    ใช้ snapshot ``latest_data`` ตามเดิม ทั้งสองแบบบอก ``epoch`` และ ``seq`` ให้ client
+    ใช้ต่อครั้งถัดไป ข้อความจาก channel layer ที่ seq ไม่เกินนั้น (มาถึงระหว่างเข้าร่วม group)
+    ถูกข้ามเพราะ client ได้รับไปแล้ว
+    """
+
+    async def start_streams(self):
+        # SQLiteStreamBuffer อ่านและเขียนไฟล์ จึงสร้างและอ่านนอก event loop (เช่นเดียวกับ resume)
+        self.streams = await sync_to_async(get_stream_buffer)()
+        # device_id -> seq ที่ client ได้รับแล้วจาก replay หรือ snapshot
+        self.sent_seqs = {}
+
+    async def resume(self, device_ids, last_seqs, epoch):
+        """คืน (items ที่ต้อง replay, อุปกรณ์ที่ต้องใช้ snapshot)
+
+        เรียกหลังเข้าร่วม group และก่อนอ่าน snapshot เพื่อไม่ให้ข้อมูลหายระหว่างนั้น
+        """
+        positions = await sync_to_async(self.read_streams)(device_ids, last_seqs, epoch)
+        replay, snapshot = [], []
+        for device_id, (seq, items) in zip(device_ids, positions):
+            self.sent_seqs[device_id] = seq
+            if items is None:
+                snapshot.append(device_id)
+            else:
+                replay.extend(items)
+        return replay, snapshot
+
+    def read_streams(self, device_ids, last_seqs, epoch):
+        """(seq, items ที่พลาดไปหรือ None) ของแต่ละอุปกรณ์ตามลำดับ"""
+        positions = []
+        for device_id in device_ids:
+            last_seq = last_seqs.get(device_id) if epoch == self.streams.epoch else None
+            if isinstance(last_seq, int) and not isinstance(last_seq, bool) and last_seq >= 0:
+                positions.append(self.streams.since(device_id, last_seq))
+            else:
+                positions.append((self.streams.current(device_id), None))
+        return positions
+
+    def is_new(self, event):
+        return event['seq'] > self.sent_seqs.get(event['device_id'], 0)
+
+    async def send_replay(self, items, seq):
+        if self.binary:
+            frame = await self.encode_frame(items)
+            # map ของ header + data โดย data คือ frame ที่แปลงแล้ว ([1:] ตัด header ของ map 3 รายการ)
+            header = {'type': 'replay', 'epoch': self.streams.epoch, 'seq': seq}
+            await self.send(bytes_data=(
+                _packer.pack_map_header(len(header) + 1) + msgpack.packb(header)[1:]
+                + msgpack.packb('data') + frame
+            ))
+            return
+        await self.send(text_data=(
+            '{"type": "replay", "epoch": ' + json.dumps(self.streams.epoch)
+            + ', "seq": ' + json.dumps(seq)
+            + ', "data": [' + ', '.join(entry[2] for entry in items) + ']}'
+        ))
+
+
+class SensorDataConsumer(ThrottledSendMixin, StreamResumeMixin, WireFormatMixin, AsyncWebsocketConsumer):
+    """WebSocket ของอุปกรณ์เดียว (ws/sensor-data/<device_id>/)
+
+    เชื่อมต่อใหม่ด้วย ``?epoch=<epoch>&last_seq=<seq>`` จาก ``replay``/``latest_data``
+    หรือ ``seq`` ของข้อมูลล่าสุดที่ได้รับ เพื่อรับเฉพาะข้อมูลที่พลาดไป
+    """
 
-class SensorDataConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        self.start_throttle()
+        await self.start_streams()
+        subprotocol = self.select_wire_format()
         self.device_id = self.scope['url_route']['kwargs']['device_id']
-        self.group_name = f'sensor_data_{self.device_id}'
+        self.group_name = group_name(self.device_id)
         
         # ตรวจสอบว่าอุปกรณ์มีอยู่และผู้ใช้มีสิทธิ์เข้าถึง
         device = await self.get_device(self.device_id)
@@ -21,78 +214,250 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept(subprotocol)
         
-        # ส่งข้อมูลล่าสุด
+        # ต่อจาก seq เดิมถ้าทำได้ ไม่เช่นนั้นส่งข้อมูลล่าสุด
+        stream_id = str(device.id)
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            last_seqs = {stream_id: int(params['last_seq'][0])}
+        except (KeyError, ValueError):
+            last_seqs = {}
+        replay, snapshot = await self.resume([stream_id], last_seqs, params.get('epoch', [None])[0])
+        seq = self.sent_seqs[stream_id]
+        if not snapshot:
+            await self.send_replay(replay, seq)
+            return
         latest_data = await self.get_latest_sensor_data(self.device_id)
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'latest_data',
+            'epoch': self.streams.epoch,
+            'seq': seq,
             'data': latest_data
-        }))
+        })
     
     async def disconnect(self, close_code):
+        self.throttle.close()
         # ออกจาก group
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
     
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message_type = text_data_json.get('type')
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = self.decode_message(text_data, bytes_data)
+        except ValueError:
+            await self.send_error('ข้อความต้องเป็น JSON หรือ msgpack')
+            return
+        message_type = message.get('type') if isinstance(message, dict) else None
         
         if message_type == 'ping':
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'pong',
                 'message': 'WebSocket connection is alive'
-            }))
+            })
+        elif message_type == 'stats':
+            await self.send_stats()
     
     async def sensor_data(self, event):
-        # ส่งข้อมูลเซ็นเซอร์ใหม่ไปยัง WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'sensor_data',
-            'data': event['data']
-        }))
+        # ส่งข้อมูลเซ็นเซอร์ใหม่ไปยัง WebSocket (รวมกับข้อมูลที่รอส่งตามอัตราที่กำหนด)
+        if self.is_new(event):
+            self.throttle.add(event['items'])
     
     async def alert(self, event):
         # ส่งการแจ้งเตือนไปยัง WebSocket
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'alert',
             'data': event['data']
-        }))
+        })
     
     @database_sync_to_async
     def get_device(self, device_id):
+        # เฉพาะอุปกรณ์ของผู้ใช้ที่ล็อกอิน (ไม่ล็อกอิน ไม่พบ หรือเป็นของผู้อื่น คืน None เหมือนกัน)
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return None
         try:
-            return Device.objects.get(id=device_id)
-        except Device.DoesNotExist:
+            return Device.objects.get(id=device_id, owner=user)
+        except (Device.DoesNotExist, ValueError, ValidationError):
             return None
     
     @database_sync_to_async
     def get_latest_sensor_data(self, device_id):
+        # อ่านจากตารางค่าล่าสุด (หนึ่งแถวต่อเซ็นเซอร์) ด้วย query เดียว
+        latest_readings = DeviceLatestReading.objects.filter(
+            device_id=device_id
+        ).select_related('device', 'sensor_type')
+        
+        return [serialize_latest_reading(latest) for latest in latest_readings]
+
+
+class MultiplexSensorDataConsumer(ThrottledSendMixin, StreamResumeMixin, WireFormatMixin, AsyncWebsocketConsumer):
+    """WebSocket เดียวสำหรับหลายอุปกรณ์ (ws/sensor-data/)
+
+    client ส่งข้อความ::
+
+        {"type": "subscribe", "devices": ["<uuid>", ...], "sensor_types": [1, 2]}
+        {"type": "unsubscribe", "devices": ["<uuid>", ...]}
+
+    ``sensor_types`` ไม่ระบุคือทุกประเภท และการ subscribe อุปกรณ์เดิมซ้ำคือเปลี่ยนตัวกรอง
+    เซิร์ฟเวอร์ตอบ ``subscribed`` (อุปกรณ์ที่รับ และที่ไม่พบหรือไม่ใช่ของผู้ใช้ใน ``rejected``)
+    ตามด้วย ``latest_data``
+    ของทุกอุปกรณ์ใน query เดียว ข้อความที่ไม่ตรงตัวกรองจะไม่ถูกส่งต่อ
+    เมื่อเชื่อมต่อใหม่ ใส่ ``"epoch": "<epoch>", "last_seq": {"<uuid>": <seq>}`` ใน subscribe
+    อุปกรณ์ที่ต่อจาก buffer ได้ส่งเป็น ``replay`` ที่เหลือส่งใน ``latest_data``
+    ส่วนข้อมูลที่ตรงถูกส่งตามอัตราของ ThrottledSendMixin (อาจรวมหลายอุปกรณ์ในข้อความเดียว)
+    """
+
+    async def connect(self):
+        self.start_throttle()
+        await self.start_streams()
+        subprotocol = self.select_wire_format()
+        # device_id -> frozenset ของ sensor_type_id (None คือทุกประเภท)
+        self.subscriptions = {}
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        await self.accept(subprotocol)
+
+    async def disconnect(self, close_code):
+        self.throttle.close()
+        await self.leave(list(self.subscriptions))
+
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            device = Device.objects.get(id=device_id)
-            latest_data = []
-            
-            # เอาเฉพาะข้อมูลล่าสุดของแต่ละเซ็นเซอร์
-            sensor_types = device.sensordata_set.values_list('sensor_type', flat=True).distinct()
-            
-            for sensor_type_id in sensor_types:
-                latest = SensorData.objects.filter(
-                    device=device,
-                    sensor_type_id=sensor_type_id
-                ).select_related('sensor_type').order_by('-timestamp').first()
-                
-                if latest:
-                    latest_data.append({
-                        'id': str(latest.id),
-                        'device': device.name,
-                        'sensor_type': latest.sensor_type.name,
-                        'value': latest.value,
-                        'unit': latest.sensor_type.unit,
-                        'timestamp': latest.timestamp.isoformat()
-                    })
-            
-            return latest_data
-        except Device.DoesNotExist:
-            return []
+            message = self.decode_message(text_data, bytes_data)
+        except ValueError:
+            await self.send_error('ข้อความต้องเป็น JSON หรือ msgpack')
+            return
+        message_type = message.get('type') if isinstance(message, dict) else None
+
+        if message_type == 'ping':
+            await self.send_message({
+                'type': 'pong',
+                'message': 'WebSocket connection is alive'
+            })
+        elif message_type == 'stats':
+            await self.send_stats()
+        elif message_type in ('subscribe', 'unsubscribe'):
+            device_ids = self.parse_device_ids(message.get('devices'))
+            if device_ids is None:
+                await self.send_error('devices ต้องเป็นรายการ UUID ของอุปกรณ์')
+            elif message_type == 'subscribe':
+                last_seqs = message.get('last_seq')
+                await self.subscribe(device_ids, message.get('sensor_types'),
+                                     last_seqs if isinstance(last_seqs, dict) else {}, message.get('epoch'))
+            else:
+                await self.unsubscribe(device_ids)
+        else:
+            await self.send_error(f'ไม่รู้จักข้อความประเภท {message_type}')
+
+    async def subscribe(self, device_ids, sensor_types, last_seqs=None, epoch=None):
+        if sensor_types is not None and not (
+            isinstance(sensor_types, list)
+            and all(isinstance(i, int) and not isinstance(i, bool) for i in sensor_types)
+        ):
+            await self.send_error('sensor_types ต้องเป็นรายการ id ของประเภทเซ็นเซอร์')
+            return
+
+        existing = await self.get_existing_devices(device_ids)
+        accepted = [device_id for device_id in device_ids if device_id in existing]
+        new = [device_id for device_id in accepted if device_id not in self.subscriptions]
+        max_devices = settings.SENSOR_WEBSOCKET['MAX_DEVICES']
+        if len(self.subscriptions) + len(new) > max_devices:
+            await self.send_error(f'ติดตามได้สูงสุด {max_devices} อุปกรณ์ต่อการเชื่อมต่อ')
+            return
+
+        # บันทึกตัวกรองก่อนเข้าร่วม group เพื่อไม่ให้ข้อมูลที่มาระหว่างนั้นถูกทิ้ง
+        type_filter = frozenset(sensor_types) if sensor_types else None
+        for device_id in accepted:
+            self.subscriptions[device_id] = type_filter
+        await asyncio.gather(*(
+            self.channel_layer.group_add(group_name(device_id), self.channel_name)
+            for device_id in new
+        ))
+
+        await self.send_message({
+            'type': 'subscribed',
+            'devices': accepted,
+            'rejected': [device_id for device_id in device_ids if device_id not in existing],
+        })
+        replay, snapshot = await self.resume(accepted, last_seqs or {}, epoch)
+        needs_snapshot = set(snapshot)
+        resumed = [device_id for device_id in accepted if device_id not in needs_snapshot]
+        if resumed:
+            await self.send_replay(
+                [entry for entry in replay if self.wants(entry[0], entry[1])],
+                {device_id: self.sent_seqs[device_id] for device_id in resumed},
+            )
+        if snapshot or not accepted:
+            latest_data = await self.get_latest_sensor_data(snapshot)
+            await self.send_message({
+                'type': 'latest_data',
+                'epoch': self.streams.epoch,
+                'seq': {device_id: self.sent_seqs[device_id] for device_id in snapshot},
+                'data': [item for item in latest_data if self.wants(item['device_id'], item['sensor_type_id'])]
+            })
+
+    async def unsubscribe(self, device_ids):
+        removed = [device_id for device_id in device_ids if device_id in self.subscriptions]
+        await self.leave(removed)
+        await self.send_message({'type': 'unsubscribed', 'devices': removed})
+
+    async def leave(self, device_ids):
+        for device_id in device_ids:
+            self.subscriptions.pop(device_id, None)
+            self.sent_seqs.pop(device_id, None)
+            self.throttle.discard(device_id)
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(group_name(device_id), self.channel_name)
+            for device_id in device_ids
+        ))
+
+    def wants(self, device_id, sensor_type_id):
+        """ข้อมูลนี้ตรงกับอุปกรณ์และประเภทเซ็นเซอร์ที่ client ติดตามหรือไม่"""
+        if device_id not in self.subscriptions:
+            return False
+        sensor_types = self.subscriptions[device_id]
+        return sensor_types is None or sensor_type_id is None or sensor_type_id in sensor_types
+
+    async def sensor_data(self, event):
+        if self.is_new(event):
+            self.throttle.add([entry for entry in event['items'] if self.wants(entry[0], entry[1])])
+
+    async def alert(self, event):
+        if self.wants(event['data']['device_id'], event['data']['sensor_type_id']):
+            await self.send_message({
+                'type': 'alert',
+                'data': event['data']
+            })
+
+    @staticmethod
+    def parse_device_ids(devices):
+        """UUID ในรูปแบบมาตรฐาน (ไม่ซ้ำ ตามลำดับเดิม) หรือ None ถ้ารูปแบบไม่ถูกต้อง"""
+        if not isinstance(devices, list):
+            return None
+        device_ids = []
+        for device in devices:
+            try:
+                device_id = str(uuid.UUID(str(device)))
+            except ValueError:
+                return None
+            if device_id not in device_ids:
+                device_ids.append(device_id)
+        return device_ids
+
+    @database_sync_to_async
+    def get_existing_devices(self, device_ids):
+        """อุปกรณ์ใน device_ids ที่เป็นของผู้ใช้"""
+        devices = Device.objects.filter(id__in=device_ids, owner=self.scope['user'])
+        return {str(device_id) for device_id in devices.values_list('id', flat=True)}
+
+    @database_sync_to_async
+    def get_latest_sensor_data(self, device_ids):
+        latest_readings = DeviceLatestReading.objects.filter(
+            device_id__in=device_ids
+        ).select_related('device', 'sensor_type')
+        return [serialize_latest_reading(latest) for latest in latest_readings]
@@ -0,0 +1,86 @@
+"""
+ลดจำนวนจุดของกราฟ (downsampling) ด้วย LTTB และ min/max ต่อช่วง
+"""
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb(t, v, threshold):
+    """Largest-Triangle-Three-Buckets: เลือกจุดที่รักษารูปร่างกราฟได้ดีที่สุด
+
+    คืนค่า index ของจุดที่เลือก (รวมจุดแรกและจุดสุดท้ายเสมอ)
+    """
+    n = len(t)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # ขอบของแต่ละ bucket สำหรับจุดกลาง (ไม่รวมจุดแรกและจุดสุดท้าย)
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+
+    # ค่าเฉลี่ยของแต่ละ bucket คำนวณทีเดียวด้วย reduceat
+    counts = ends - starts
+    avg_t = np.add.reduceat(t[:n - 1], starts) / counts
+    avg_v = np.add.reduceat(v[:n - 1], starts) / counts
+    # bucket ถัดไปของ bucket สุดท้ายคือจุดสุดท้าย
+    next_t = np.append(avg_t[1:], t[-1])
+    next_v = np.append(avg_v[1:], v[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = starts[i], ends[i]
+        # พื้นที่สามเหลี่ยมระหว่างจุดที่เลือกก่อนหน้า จุดใน bucket และค่าเฉลี่ย bucket ถัดไป
+        area = np.abs(
+            (t[a] - next_t[i]) * (v[lo:hi] - v[a])
+            - (t[a] - t[lo:hi]) * (next_v[i] - v[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(t, v, threshold):
+    """เก็บจุดต่ำสุดและสูงสุดของแต่ละช่วงเวลาที่กว้างเท่ากัน
+
+    คืนค่า index ของจุดที่เลือกเรียงตามเวลา (รวมจุดแรกและจุดสุดท้ายเสมอ ไม่เกิน ``threshold`` จุด)
+    """
+    n = len(t)
+    if threshold >= n:
+        return np.arange(n)
+    # สองจุดสำหรับจุดแรกและจุดสุดท้าย ที่เหลือสองจุดต่อช่วง
+    buckets = (threshold - 2) // 2
+    if buckets < 1:
+        return np.array([0, n - 1])
+
+    span = t[-1] - t[0]
+    if span <= 0:
+        bucket_ids = np.zeros(n, dtype=np.int64)
+    else:
+        bucket_ids = np.minimum(((t - t[0]) / span * buckets).astype(np.int64), buckets - 1)
+
+    # เรียงตาม bucket แล้วตามค่า ตัวแรกของแต่ละ bucket คือค่าต่ำสุด ตัวสุดท้ายคือค่าสูงสุด
+    order = np.lexsort((v, bucket_ids))
+    sorted_ids = bucket_ids[order]
+    first = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    last = np.r_[first[1:], n] - 1
+    return np.unique(np.concatenate([[0, n - 1], order[first], order[last]]))
+
+
+def downsample(series, threshold, method='lttb'):
+    """ลดจำนวนจุดของ series (array ที่มีคอลัมน์ t และ v) ให้เหลือไม่เกิน threshold"""
+    if method not in METHODS:
+        raise ValueError(f"ไม่รู้จักวิธี downsampling: {method}")
+    if len(series) <= threshold:
+        return series
+
+    t, v = series['t'], series['v']
+    if method == 'lttb':
+        indices = lttb(t, v, threshold)
+    else:
+        indices = minmax(t, v, threshold)
+    return series[indices]
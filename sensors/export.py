@@ -0,0 +1,106 @@
+"""
+ส่งออกข้อมูลเซ็นเซอร์เป็น CSV / NDJSON แบบ stream (ใช้หน่วยความจำคงที่)
+"""
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUMNS = ['timestamp', 'device_id', 'device', 'sensor_type', 'unit', 'value']
+
+# รวมข้อมูลเป็นก้อนประมาณขนาดนี้ก่อนส่ง เพื่อลดจำนวนครั้งที่เขียนลง socket
+CHUNK_BYTES = 64 * 1024
+
+
+class _Echo:
+    """ไฟล์จำลองสำหรับ csv.writer ที่คืนค่าบรรทัดแทนการเขียน"""
+
+    def write(self, value):
+        return value
+
+
+def _format_lines(rows, fmt, device_names, sensor_types):
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(COLUMNS)
+        for timestamp, device_id, sensor_type_id, value in rows:
+            name, unit = sensor_types[sensor_type_id]
+            yield writer.writerow([
+                timestamp.isoformat(), device_id, device_names[device_id], name, unit, value
+            ])
+    else:
+        for timestamp, device_id, sensor_type_id, value in rows:
+            name, unit = sensor_types[sensor_type_id]
+            yield json.dumps({
+                'timestamp': timestamp.isoformat(),
+                'device_id': str(device_id),
+                'device': device_names[device_id],
+                'sensor_type': name,
+                'unit': unit,
+                'value': value,
+            }, ensure_ascii=False) + '\n'
+
+
+def iter_export(rows, fmt, device_names, sensor_types, compress=False):
+    """แปลงแถวข้อมูลเป็นก้อน bytes สำหรับ StreamingHttpResponse
+
+    ``device_names`` คือ dict ของ device_id -> ชื่อ และ ``sensor_types`` คือ
+    dict ของ sensor_type_id -> (ชื่อ, หน่วย)
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    first = True
+
+    for line in _format_lines(rows, fmt, device_names, sensor_types):
+        buffer.append(line)
+        size += len(line)
+        # ส่งก้อนแรกทันที ไม่ต้องรอให้ query อ่านครบ
+        if first or size >= CHUNK_BYTES:
+            first = False
+            data = ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+            if compressor:
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield data
+
+    data = ''.join(buffer).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+async def _aiterate(iterator):
+    # ดึงทีละก้อนใน thread เดิมเสมอ เพื่อให้ใช้ database connection เดียวกันตลอด
+    next_chunk = sync_to_async(lambda: next(iterator, None), thread_sensitive=True)
+    while True:
+        chunk = await next_chunk()
+        if chunk is None:
+            break
+        yield chunk
+
+
+def streaming_export_response(request, chunks, fmt, filename, compress=False):
+    """สร้าง StreamingHttpResponse ที่ไม่ต้องเก็บข้อมูลทั้งหมดไว้ในหน่วยความจำ
+
+    ภายใต้ ASGI Django 4.2 จะอ่าน iterator แบบ sync จนหมดก่อนส่ง
+    จึงต้องห่อเป็น async iterator ให้ส่งทีละก้อนจริง
+    """
+    content = _aiterate(iter(chunks)) if isinstance(request, ASGIRequest) else chunks
+
+    if compress:
+        response = StreamingHttpResponse(content, content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(content, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
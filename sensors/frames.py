@@ -0,0 +1,180 @@
+"""
+รูปแบบข้อมูลไบนารีแบบกะทัดรัดสำหรับ /api/sensor-data/frame
+
+หนึ่ง frame คืออุปกรณ์หนึ่งตัว เวลาฐาน และรายการ (sensor_type_id, delta_ms, value)
+เวลาของแต่ละค่าคือเวลาฐาน + delta_ms (เวลาฐาน 0 คือใช้เวลาที่เซิร์ฟเวอร์ได้รับ
+เหมาะกับอุปกรณ์ที่ไม่มีนาฬิกา ซึ่งส่ง delta ติดลบแทน "กี่มิลลิวินาทีที่แล้ว")
+
+รองรับสอง Content-Type
+
+``application/msgpack``
+    array ``[device_id, base_ms, [[sensor_type_id, delta_ms, value], ...], extras]``
+    โดย device_id เป็น bin 16 bytes หรือ str ของ UUID และ extras (ถ้ามี) เป็น map
+
+``application/vnd.sensor-frame``
+    struct little-endian: header ``<2sBB16sqH`` (magic ``SF``, version, flags,
+    UUID 16 bytes, base_ms, จำนวนรายการ) ตามด้วยรายการ ``<Hif`` ขนาด 10 bytes
+    (หรือ ``<Hid`` 14 bytes เมื่อ flags มี FLAG_FLOAT64) และ extras แบบ msgpack
+    ต่อท้ายเมื่อ flags มี FLAG_EXTRAS รายการถูกอ่านด้วย ``numpy.frombuffer``
+    โดยไม่คัดลอกข้อมูล
+"""
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import NamedTuple, Optional
+
+import msgpack
+import numpy as np
+
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+STRUCT_CONTENT_TYPE = 'application/vnd.sensor-frame'
+CONTENT_TYPES = MSGPACK_CONTENT_TYPES + (STRUCT_CONTENT_TYPE,)
+
+MAGIC = b'SF'
+VERSION = 1
+FLAG_EXTRAS = 0x01
+FLAG_FLOAT64 = 0x02
+
+HEADER = struct.Struct('<2sBB16sqH')
+ENTRY_DTYPES = {
+    False: np.dtype([('sensor_type_id', '<u2'), ('delta_ms', '<i4'), ('value', '<f4')]),
+    True: np.dtype([('sensor_type_id', '<u2'), ('delta_ms', '<i4'), ('value', '<f8')]),
+}
+# delta_ms เป็น int32 ในทั้งสองรูปแบบ และเวลาของทุกรายการต้องแทนด้วย datetime ได้
+MIN_DELTA_MS, MAX_DELTA_MS = -2 ** 31, 2 ** 31 - 1
+MAX_TIME_MS = int(datetime.max.replace(tzinfo=dt_timezone.utc).timestamp() * 1000)
+
+
+class FrameError(ValueError):
+    """frame ไม่ถูกต้องตามรูปแบบ"""
+
+
+class Frame(NamedTuple):
+    device_id: uuid.UUID
+    base_ms: int
+    sensor_type_ids: list
+    delta_ms: list
+    values: list
+    extras: Optional[dict]
+
+    def __len__(self):
+        return len(self.values)
+
+    def timestamps(self, now):
+        """เวลาของแต่ละรายการ (ใช้ now เป็นเวลาฐานเมื่อ base_ms เป็น 0)"""
+        if self.base_ms:
+            base = datetime.fromtimestamp(self.base_ms / 1000, tz=dt_timezone.utc)
+        else:
+            base = now
+        return [base + timedelta(milliseconds=delta) for delta in self.delta_ms]
+
+
+def decode(body, content_type):
+    """แปลง body ตาม Content-Type เป็น Frame"""
+    if content_type in MSGPACK_CONTENT_TYPES:
+        return decode_msgpack(body)
+    if content_type == STRUCT_CONTENT_TYPE:
+        return decode_struct(body)
+    raise FrameError(f'ไม่รองรับ Content-Type: {content_type}')
+
+
+def _check_times(base_ms, min_delta, max_delta):
+    """ตรวจว่า Frame.timestamps แปลงทุกรายการได้ (min_delta/max_delta รวม 0 ไว้ด้วย)"""
+    if min_delta < MIN_DELTA_MS or max_delta > MAX_DELTA_MS:
+        raise FrameError(f'delta_ms ต้องอยู่ระหว่าง {MIN_DELTA_MS} ถึง {MAX_DELTA_MS}')
+    if base_ms and not (0 <= base_ms + min_delta and base_ms + max_delta <= MAX_TIME_MS):
+        raise FrameError('base_ms + delta_ms อยู่นอกช่วงเวลาที่รองรับ')
+
+
+def _parse_device_id(value):
+    try:
+        if isinstance(value, bytes):
+            return uuid.UUID(bytes=value)
+        return uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        raise FrameError('device_id ต้องเป็น UUID (16 bytes หรือข้อความ)')
+
+
+def decode_msgpack(body):
+    try:
+        data = msgpack.unpackb(body, raw=False, use_list=False, strict_map_key=False)
+    except (ValueError, msgpack.UnpackException) as e:
+        raise FrameError(f'msgpack ไม่ถูกต้อง: {e}')
+    if not isinstance(data, tuple) or len(data) not in (3, 4):
+        raise FrameError('frame ต้องเป็น array [device_id, base_ms, entries, extras]')
+
+    extras = data[3] if len(data) == 4 else None
+    if extras is not None and not isinstance(extras, dict):
+        raise FrameError('extras ต้องเป็น map')
+    if not isinstance(data[1], int) or not isinstance(data[2], tuple):
+        raise FrameError('base_ms ต้องเป็นจำนวนเต็ม และ entries ต้องเป็น array')
+
+    sensor_type_ids = []
+    delta_ms = []
+    values = []
+    for entry in data[2]:
+        try:
+            sensor_type_id, delta, value = entry
+        except (TypeError, ValueError):
+            raise FrameError('แต่ละรายการต้องเป็น [sensor_type_id, delta_ms, value]')
+        if not isinstance(sensor_type_id, int) or not isinstance(delta, int) \
+                or not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise FrameError('ชนิดข้อมูลของรายการไม่ถูกต้อง')
+        sensor_type_ids.append(sensor_type_id)
+        delta_ms.append(delta)
+        values.append(float(value))
+    _check_times(data[1], min(delta_ms, default=0), max(delta_ms, default=0))
+    return Frame(_parse_device_id(data[0]), data[1], sensor_type_ids, delta_ms, values, extras)
+
+
+def decode_struct(body):
+    view = memoryview(body)
+    if len(view) < HEADER.size:
+        raise FrameError('frame สั้นกว่า header')
+    magic, version, flags, device_bytes, base_ms, count = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise FrameError('magic หรือ version ของ frame ไม่ถูกต้อง')
+
+    dtype = ENTRY_DTYPES[bool(flags & FLAG_FLOAT64)]
+    end = HEADER.size + count * dtype.itemsize
+    if len(view) < end or (len(view) > end and not flags & FLAG_EXTRAS):
+        raise FrameError('ขนาด frame ไม่ตรงกับจำนวนรายการ')
+    entries = np.frombuffer(view, dtype=dtype, count=count, offset=HEADER.size)
+    _check_times(base_ms, int(entries['delta_ms'].min(initial=0)), int(entries['delta_ms'].max(initial=0)))
+
+    extras = None
+    if flags & FLAG_EXTRAS:
+        try:
+            extras = msgpack.unpackb(view[end:], raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise FrameError(f'extras ไม่ถูกต้อง: {e}')
+        if not isinstance(extras, dict):
+            raise FrameError('extras ต้องเป็น map')
+
+    values = entries['value']
+    if dtype == ENTRY_DTYPES[False]:
+        # float32 -> ตัวเลขทศนิยมที่สั้นที่สุดที่ให้ค่าเดิม (23.1 แทน 23.100000381...)
+        values = [float(str(value)) for value in values]
+    else:
+        values = values.tolist()
+    return Frame(uuid.UUID(bytes=device_bytes), base_ms,
+                 entries['sensor_type_id'].tolist(), entries['delta_ms'].tolist(), values, extras)
+
+
+def encode_msgpack(device_id, entries, base_ms=0, extras=None):
+    """สร้าง frame แบบ msgpack จากรายการ (sensor_type_id, delta_ms, value)"""
+    frame = [uuid.UUID(str(device_id)).bytes, base_ms, [list(entry) for entry in entries]]
+    if extras:
+        frame.append(extras)
+    return msgpack.packb(frame, use_bin_type=True)
+
+
+def encode_struct(device_id, entries, base_ms=0, extras=None, float64=False):
+    """สร้าง frame แบบ struct จากรายการ (sensor_type_id, delta_ms, value)"""
+    flags = (FLAG_EXTRAS if extras else 0) | (FLAG_FLOAT64 if float64 else 0)
+    body = np.array([tuple(entry) for entry in entries], dtype=ENTRY_DTYPES[float64])
+    parts = [HEADER.pack(MAGIC, VERSION, flags, uuid.UUID(str(device_id)).bytes, base_ms, len(body)),
+             body.tobytes()]
+    if extras:
+        parts.append(msgpack.packb(extras, use_bin_type=True))
+    return b''.join(parts)
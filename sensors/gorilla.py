@@ -0,0 +1,178 @@
+"""
+บีบอัดอนุกรมเวลาแบบ Gorilla
+
+- เวลา (ไมโครวินาที) เก็บเป็น delta-of-delta ความยาวแปรผัน
+- ค่า float เก็บเป็น XOR กับค่าก่อนหน้า โดยเก็บเฉพาะบิตที่มีความหมาย
+
+ไม่ขึ้นกับ Django จึงนำไปใช้ใน benchmark ได้โดยตรง
+"""
+import struct
+
+# จำนวนจุด, เวลาแรก (ไมโครวินาที), ค่าแรก
+HEADER = struct.Struct('<Iqd')
+
+# (prefix, ความยาว prefix, จำนวนบิตของค่า) เรียงจากเล็กไปใหญ่
+# ขนาดบิตเลือกให้เหมาะกับความคลาดเคลื่อนของเวลาระดับไมโครวินาที
+DOD_BUCKETS = [
+    (0b10, 2, 7),
+    (0b110, 3, 12),
+    (0b1110, 4, 20),
+]
+DOD_FALLBACK = (0b1111, 4, 64)
+
+
+class BitWriter:
+    """เขียนข้อมูลทีละบิตลง bytearray"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._acc = 0
+        self._nbits = 0
+
+    def write(self, value, nbits):
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._nbits += nbits
+        if self._nbits >= 8:
+            whole = self._nbits >> 3
+            self._nbits &= 7
+            self._buffer += (self._acc >> self._nbits).to_bytes(whole, 'big')
+            self._acc &= (1 << self._nbits) - 1
+
+    def getvalue(self):
+        if self._nbits:
+            return bytes(self._buffer) + bytes([(self._acc << (8 - self._nbits)) & 0xFF])
+        return bytes(self._buffer)
+
+
+class BitReader:
+    """อ่านข้อมูลทีละบิตจาก buffer โดยไม่คัดลอกทั้งก้อน"""
+
+    def __init__(self, data, offset=0):
+        self._data = memoryview(data)
+        self._pos = offset * 8
+
+    def read_bit(self):
+        pos = self._pos
+        self._pos = pos + 1
+        return (self._data[pos >> 3] >> (7 - (pos & 7))) & 1
+
+    def read(self, nbits):
+        pos = self._pos
+        start = pos >> 3
+        end = (pos + nbits + 7) >> 3
+        self._pos = pos + nbits
+        chunk = int.from_bytes(self._data[start:end], 'big')
+        return (chunk >> ((end << 3) - pos - nbits)) & ((1 << nbits) - 1)
+
+
+def _float_bits(values):
+    return struct.unpack(f'<{len(values)}Q', struct.pack(f'<{len(values)}d', *values))
+
+
+def _bits_float(bits):
+    return list(struct.unpack(f'<{len(bits)}d', struct.pack(f'<{len(bits)}Q', *bits)))
+
+
+def encode(timestamps, values):
+    """บีบอัดเวลา (int ไมโครวินาที เรียงจากเก่าไปใหม่) และค่า float เป็น bytes"""
+    count = len(timestamps)
+    if count == 0:
+        return HEADER.pack(0, 0, 0.0)
+
+    bits = _float_bits(values)
+    writer = BitWriter()
+    write = writer.write
+
+    prev_t = timestamps[0]
+    prev_delta = 0
+    prev_bits = bits[0]
+    leading = -1
+    trailing = 0
+
+    for i in range(1, count):
+        # เวลา: delta-of-delta
+        t = timestamps[i]
+        delta = t - prev_t
+        dod = delta - prev_delta
+        if dod == 0:
+            write(0, 1)
+        else:
+            for prefix, prefix_len, nbits in DOD_BUCKETS:
+                half = 1 << (nbits - 1)
+                if -half < dod <= half:
+                    write(prefix, prefix_len)
+                    write(dod, nbits)
+                    break
+            else:
+                prefix, prefix_len, nbits = DOD_FALLBACK
+                write(prefix, prefix_len)
+                write(dod, nbits)
+        prev_t = t
+        prev_delta = delta
+
+        # ค่า: XOR กับค่าก่อนหน้า
+        current = bits[i]
+        xor = current ^ prev_bits
+        if xor == 0:
+            write(0, 1)
+        else:
+            lz = min(64 - xor.bit_length(), 31)
+            tz = (xor & -xor).bit_length() - 1
+            if leading >= 0 and lz >= leading and tz >= trailing:
+                # ใช้ช่วงบิตเดิมซ้ำ
+                write(0b10, 2)
+                write(xor >> trailing, 64 - leading - trailing)
+            else:
+                meaningful = 64 - lz - tz
+                write(0b11, 2)
+                write(lz, 5)
+                write(meaningful - 1, 6)
+                write(xor >> tz, meaningful)
+                leading, trailing = lz, tz
+        prev_bits = current
+
+    return HEADER.pack(count, timestamps[0], values[0]) + writer.getvalue()
+
+
+def decode(payload):
+    """แตกข้อมูลที่บีบอัดด้วย encode กลับเป็น (รายการเวลา, รายการค่า)"""
+    count, first_t, first_v = HEADER.unpack_from(payload)
+    if count == 0:
+        return [], []
+
+    reader = BitReader(payload, HEADER.size)
+    read, read_bit = reader.read, reader.read_bit
+
+    timestamps = [first_t]
+    bits = [_float_bits([first_v])[0]]
+    prev_t = first_t
+    prev_delta = 0
+    prev_bits = bits[0]
+    leading = 0
+    trailing = 0
+
+    for _ in range(count - 1):
+        if read_bit() == 0:
+            dod = 0
+        else:
+            for prefix, prefix_len, nbits in DOD_BUCKETS:
+                if read_bit() == 0:
+                    break
+            else:
+                nbits = DOD_FALLBACK[2]
+            dod = read(nbits)
+            if dod > (1 << (nbits - 1)):
+                dod -= 1 << nbits
+        prev_delta += dod
+        prev_t += prev_delta
+        timestamps.append(prev_t)
+
+        if read_bit():
+            if read_bit():
+                leading = read(5)
+                meaningful = read(6) + 1
+                trailing = 64 - leading - meaningful
+            prev_bits ^= read(64 - leading - trailing) << trailing
+        bits.append(prev_bits)
+
+    return timestamps, _bits_float(bits)
@@ -0,0 +1,128 @@
+"""
+ตรวจจับอุปกรณ์ offline ด้วย heap ของกำหนดเวลา (deadline) แทนการ query MAX(timestamp)
+
+ฝั่งบันทึกข้อมูลอัปเดต ``Device.last_seen_at`` (ไม่เกินหนึ่งครั้งต่อ TOUCH_SECONDS ต่ออุปกรณ์)
+ส่วนคำสั่ง ``monitor_heartbeats`` อ่านเฉพาะอุปกรณ์ที่เพิ่งส่งข้อมูล แล้วให้
+``HeartbeatTracker`` ตัดสินว่าอุปกรณ์ใดเลยกำหนด งานต่อรอบจึงขึ้นกับจำนวนเหตุการณ์
+ไม่ขึ้นกับจำนวนอุปกรณ์หรือปริมาณข้อมูลย้อนหลัง
+"""
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .alerts import get_alert_store
+from .models import Device, SensorAlert
+
+_touched = {}
+_touched_lock = threading.Lock()
+
+
+def touch_devices(device_ids, now=None):
+    """บันทึกเวลาที่ได้รับข้อมูลล่าสุดของอุปกรณ์ (ข้ามอุปกรณ์ที่เพิ่งบันทึกไป)"""
+    min_gap = settings.SENSOR_HEARTBEAT['TOUCH_SECONDS']
+    clock = time.monotonic()
+    with _touched_lock:
+        stale = [
+            device_id for device_id in device_ids
+            if clock - _touched.get(device_id, float('-inf')) >= min_gap
+        ]
+        for device_id in stale:
+            _touched[device_id] = clock
+    if stale:
+        Device.objects.filter(pk__in=stale).update(last_seen_at=now or timezone.now())
+
+
+class HeartbeatTracker:
+    """ติดตามกำหนดเวลาของแต่ละอุปกรณ์ด้วย min-heap
+
+    อุปกรณ์หนึ่งตัวมีรายการใน heap ไม่เกินหนึ่งรายการ ``record`` เพียงอัปเดตเวลา
+    ล่าสุดใน dict (O(1)) เมื่อรายการใน heap ถึงกำหนดจึงค่อยตรวจเวลาล่าสุดจริง
+    แล้วตั้งกำหนดใหม่ถ้าอุปกรณ์ยังส่งข้อมูลอยู่
+    เวลาทั้งหมดเป็น epoch วินาที
+    """
+
+    def __init__(self, default_interval, grace=1.0):
+        self.default_interval = default_interval
+        self.grace = grace
+        self._last_seen = {}
+        self._intervals = {}
+        self._heap = []
+        self._armed = set()
+        self._offline = set()
+
+    def set_interval(self, device_id, interval):
+        """ช่วงเวลาส่งข้อมูลที่คาดไว้ของอุปกรณ์ (None คือใช้ค่าเริ่มต้น)"""
+        if interval:
+            self._intervals[device_id] = interval
+        else:
+            self._intervals.pop(device_id, None)
+
+    def timeout(self, device_id):
+        return self._intervals.get(device_id, self.default_interval) * self.grace
+
+    def mark_offline(self, device_id):
+        """ระบุว่าอุปกรณ์ offline อยู่แล้ว (เช่น มีการแจ้งเตือนที่ยังเปิดอยู่)"""
+        self._offline.add(device_id)
+
+    def record(self, device_id, seen_at):
+        """บันทึกว่าได้รับข้อมูลจากอุปกรณ์ คืนค่า True ถ้าอุปกรณ์กลับมา online"""
+        if seen_at <= self._last_seen.get(device_id, float('-inf')):
+            return False
+        self._last_seen[device_id] = seen_at
+
+        if device_id not in self._armed:
+            self._armed.add(device_id)
+            heapq.heappush(self._heap, (seen_at + self.timeout(device_id), device_id))
+
+        if device_id in self._offline:
+            self._offline.discard(device_id)
+            return True
+        return False
+
+    def expire(self, now):
+        """อุปกรณ์ที่เพิ่งเลยกำหนด ณ เวลา now (คืนค่าเป็นรายการ device_id)"""
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, device_id = heapq.heappop(heap)
+            deadline = self._last_seen[device_id] + self.timeout(device_id)
+            if deadline > now:
+                # ได้รับข้อมูลใหม่หลังตั้งกำหนดเดิม เลื่อนกำหนดออกไป
+                heapq.heappush(heap, (deadline, device_id))
+                continue
+            self._armed.discard(device_id)
+            if device_id not in self._offline:
+                self._offline.add(device_id)
+                expired.append(device_id)
+        return expired
+
+    def last_seen(self, device_id):
+        return self._last_seen.get(device_id)
+
+
+def save_offline_changes(tracker, went_offline, came_back):
+    """สร้างการแจ้งเตือน offline และปิดการแจ้งเตือนของอุปกรณ์ที่กลับมา คืนการแจ้งเตือนที่ควรส่งต่อ"""
+    alerts = []
+    now = timezone.now()
+    if went_offline:
+        devices = Device.objects.in_bulk(went_offline)
+        for device_id in went_offline:
+            device = devices.get(device_id)
+            if device is None or not device.is_active:
+                continue
+            timeout = tracker.timeout(device_id)
+            silent = now.timestamp() - tracker.last_seen(device_id)
+            alerts.append(SensorAlert(
+                device=device,
+                alert_type='offline',
+                message=f"อุปกรณ์ {device.name} ไม่ส่งข้อมูลนาน {silent:.0f} วินาที (กำหนด {timeout:.0f} วินาที)",
+                threshold_value=timeout,
+                actual_value=silent,
+            ))
+
+    store = get_alert_store()
+    store.resolve([(device_id, None, 'offline') for device_id in came_back], now)
+    return store.submit(alerts, now)
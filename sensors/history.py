@@ -0,0 +1,79 @@
+"""
+อ่านข้อมูลย้อนหลังของเซ็นเซอร์แบบ stream (รวมข้อมูลปกติกับ cold storage)
+"""
+import heapq
+from operator import itemgetter
+
+import numpy as np
+
+from .coldstore import cold_page, iter_cold_rows, iter_cold_series, reading_sort_key
+from .models import SensorData, SensorDataSegment
+
+SERIES_DTYPE = np.dtype([('t', 'f8'), ('v', 'f8')])
+
+
+def _iter_hot_series(device_id, sensor_type_id, start, end, chunk_size):
+    rows = SensorData.objects.filter(
+        device_id=device_id,
+        sensor_type_id=sensor_type_id,
+        timestamp__gte=start,
+        timestamp__lt=end
+    ).order_by('timestamp').values_list('timestamp', 'value')
+
+    for timestamp, value in rows.iterator(chunk_size=chunk_size):
+        yield timestamp.timestamp(), value
+
+
+def iter_series(device_id, sensor_type_id, start, end, chunk_size=5000):
+    """(epoch วินาที, ค่า) ของช่วงเวลา [start, end) เรียงตามเวลาจากเก่าไปใหม่"""
+    return heapq.merge(
+        iter_cold_series(device_id, sensor_type_id, start, end),
+        _iter_hot_series(device_id, sensor_type_id, start, end, chunk_size),
+        key=itemgetter(0)
+    )
+
+
+def load_series(device_id, sensor_type_id, start, end):
+    """โหลดข้อมูลช่วงเวลาเป็น array ของ numpy (คอลัมน์ t และ v)"""
+    return np.fromiter(
+        iter_series(device_id, sensor_type_id, start, end),
+        dtype=SERIES_DTYPE
+    )
+
+
+def _iter_hot_rows(device_ids, start, end, sensor_type_id, chunk_size):
+    rows = SensorData.objects.filter(device_id__in=device_ids)
+    if sensor_type_id:
+        rows = rows.filter(sensor_type_id=sensor_type_id)
+    if start:
+        rows = rows.filter(timestamp__gte=start)
+    if end:
+        rows = rows.filter(timestamp__lt=end)
+
+    rows = rows.order_by('timestamp').values_list('timestamp', 'device_id', 'sensor_type_id', 'value')
+    yield from rows.iterator(chunk_size=chunk_size)
+
+
+def iter_rows(device_ids, start=None, end=None, sensor_type_id=None, chunk_size=5000):
+    """(timestamp, device_id, sensor_type_id, value) ของหลายอุปกรณ์ เรียงตามเวลาจากเก่าไปใหม่"""
+    return heapq.merge(
+        iter_cold_rows(device_ids, start=start, end=end, sensor_type_id=sensor_type_id),
+        _iter_hot_rows(device_ids, start, end, sensor_type_id, chunk_size),
+        key=itemgetter(0)
+    )
+
+
+def recent_readings(device_id, limit):
+    """ข้อมูลล่าสุดของอุปกรณ์ limit รายการ เรียงจากใหม่ไปเก่า"""
+    hot = list(
+        SensorData.objects.filter(device_id=device_id)
+        .select_related('device', 'sensor_type')
+        .order_by('-timestamp', '-id')[:limit]
+    )
+    # ถ้าข้อมูลปกติเต็มแล้ว อ่านเฉพาะก้อนที่มีข้อมูลใหม่กว่ารายการสุดท้าย
+    bound = hot[-1].timestamp if len(hot) == limit else None
+    cold = cold_page(
+        SensorDataSegment.objects.filter(device_id=device_id),
+        'next', None, None, limit, bound=bound
+    )
+    return sorted(hot + cold, key=reading_sort_key, reverse=True)[:limit]
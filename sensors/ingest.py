@@ -0,0 +1,202 @@
+"""
+ฟังก์ชันกลางสำหรับบันทึกข้อมูลเซ็นเซอร์และกระจายผ่าน WebSocket
+"""
+import atexit
+import json
+import threading
+from collections import defaultdict
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from .alerts import check_readings
+from .anomaly import check_anomalies
+from .buffer import IngestBuffer
+from .heartbeat import touch_devices
+from .models import SensorData, DeviceLatestReading
+from .rollups import update_rollups
+from .streams import get_stream_buffer
+from .upsert import bulk_upsert
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def serialize_sensor_data(sensor_data):
+    """แปลงข้อมูลเซ็นเซอร์เป็น dict สำหรับส่งผ่าน WebSocket"""
+    return {
+        "id": str(sensor_data.id),
+        "device_id": str(sensor_data.device_id),
+        "device": sensor_data.device.name,
+        "sensor_type_id": sensor_data.sensor_type_id,
+        "sensor_type": sensor_data.sensor_type.name,
+        "value": sensor_data.value,
+        "unit": sensor_data.sensor_type.unit,
+        "timestamp": sensor_data.timestamp.isoformat()
+    }
+
+
+def save_readings(readings):
+    """บันทึกข้อมูลเซ็นเซอร์หลายรายการด้วย INSERT เดียว พร้อมอัปเดตค่าล่าสุดและ rollup"""
+    with transaction.atomic():
+        SensorData.objects.bulk_create(readings)
+        update_latest_readings(readings)
+        update_rollups(readings)
+    touch_devices({sensor_data.device_id for sensor_data in readings})
+    return readings
+
+
+def update_latest_readings(readings):
+    """upsert ค่าล่าสุดของแต่ละ (อุปกรณ์, ประเภทเซ็นเซอร์)
+
+    ข้อมูลที่เก่ากว่าค่าที่เก็บไว้แล้วจะไม่ทับค่าเดิม
+    """
+    latest = {}
+    for sensor_data in readings:
+        key = (sensor_data.device_id, sensor_data.sensor_type_id)
+        current = latest.get(key)
+        if current is None or sensor_data.timestamp >= current.timestamp:
+            latest[key] = sensor_data
+    if not latest:
+        return
+
+    bulk_upsert(
+        DeviceLatestReading,
+        ['device', 'sensor_type', 'reading_id', 'value', 'timestamp'],
+        [
+            (sensor_data.device_id, sensor_data.sensor_type_id, sensor_data.id,
+             sensor_data.value, sensor_data.timestamp)
+            for sensor_data in latest.values()
+        ],
+        conflict_fields=['device', 'sensor_type'],
+        updates={
+            'reading_id': 'excluded."reading_id"',
+            'value': 'excluded."value"',
+            'timestamp': 'excluded."timestamp"',
+        },
+        where='excluded."timestamp" >= {table}."timestamp"'
+    )
+
+
+def serialize_alert(alert):
+    """แปลงการแจ้งเตือนเป็น dict สำหรับส่งผ่าน WebSocket"""
+    return {
+        "id": alert.id,
+        "device_id": str(alert.device_id),
+        "device": alert.device.name,
+        "sensor_type_id": alert.sensor_type_id,
+        "sensor_type": alert.sensor_type.name if alert.sensor_type else None,
+        "alert_type": alert.alert_type,
+        "message": alert.message,
+        "threshold_value": alert.threshold_value,
+        "actual_value": alert.actual_value,
+        "score": alert.score,
+        "occurrences": alert.occurrences,
+        "last_triggered_at": alert.last_triggered_at.isoformat() if alert.last_triggered_at else None,
+        "created_at": alert.created_at.isoformat()
+    }
+
+
+def process_readings(readings):
+    """บันทึกข้อมูล ตรวจเกณฑ์แจ้งเตือนและค่าผิดปกติ แล้วกระจายผ่าน WebSocket"""
+    save_readings(readings)
+    alerts = check_readings(readings) + check_anomalies(readings)
+    broadcast_readings(readings)
+    broadcast_alerts(alerts)
+
+
+def submit_readings(readings):
+    """ส่งข้อมูลเข้าสู่การบันทึกตามโหมดที่ตั้งค่าไว้
+
+    โหมด ``direct`` บันทึกทันทีในคำขอ ส่วนโหมด ``buffered`` ใส่ลงคิวให้
+    writer thread บันทึกเป็นชุด และอาจ raise ``BufferFull`` เมื่อคิวเต็ม
+    """
+    if settings.SENSOR_INGEST_MODE == 'buffered':
+        get_ingest_buffer().put_many(readings)
+    else:
+        process_readings(readings)
+
+
+def get_ingest_buffer():
+    """บัฟเฟอร์ของ process นี้ (สร้างเมื่อเรียกครั้งแรก)"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            options = settings.SENSOR_INGEST_BUFFER
+            _buffer = IngestBuffer(
+                process_readings,
+                max_size=options['MAX_SIZE'],
+                batch_size=options['BATCH_SIZE'],
+                flush_interval_ms=options['FLUSH_INTERVAL_MS'],
+                overflow=options['OVERFLOW'],
+                block_timeout_ms=options['BLOCK_TIMEOUT_MS'],
+            )
+            _buffer.start()
+            atexit.register(_buffer.stop)
+        return _buffer
+
+
+def reading_messages(readings):
+    """ข้อความ channel layer ของข้อมูลชุดนี้ หนึ่งข้อความต่ออุปกรณ์: [(group, event), ...]
+
+    แต่ละรายการถูกแปลงครั้งเดียวที่นี่ เป็น tuple ของ (device_id, sensor_type_id, JSON, packed)
+    โดย packed คือ msgpack ของ epoch_ms, value, seq (ไม่มี header ของ array) สำหรับ frame ไบนารี
+    consumer ทุกตัวใน group ส่งต่อได้ทันทีโดยไม่ต้องแปลงซ้ำ และ channel layer คัดลอกได้โดยแทบไม่มีต้นทุน แต่ละข้อความได้ seq ของอุปกรณ์
+    (ใส่ใน JSON ทุกรายการด้วย) และถูกเก็บใน StreamBuffer ให้ client ที่เชื่อมต่อใหม่ขอย้อนหลังได้
+    StreamBuffer อาจเขียนไฟล์ (SQLiteStreamBuffer) จึงเรียกจาก thread ปกติเท่านั้น ไม่ใช่จาก event loop
+    """
+    by_device = defaultdict(list)
+    for sensor_data in readings:
+        data = serialize_sensor_data(sensor_data)
+        epoch_ms = int(sensor_data.timestamp.timestamp() * 1000)
+        by_device[data["device_id"]].append((data, epoch_ms))
+
+    streams = get_stream_buffer()
+    messages = []
+    for device_id, items in by_device.items():
+        def encode(seq, items=items):
+            return tuple(
+                (device_id, data["sensor_type_id"], json.dumps({**data, "seq": seq}),
+                 msgpack.packb(epoch_ms) + msgpack.packb(data["value"]) + msgpack.packb(seq))
+                for data, epoch_ms in items
+            )
+
+        seq, encoded = streams.append(device_id, encode)
+        messages.append((
+            f"sensor_data_{device_id}",
+            {"type": "sensor_data", "device_id": device_id, "seq": seq, "items": encoded},
+        ))
+    return messages
+
+
+def broadcast_readings(readings):
+    """ส่งข้อมูลผ่าน WebSocket หนึ่งข้อความต่ออุปกรณ์"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not readings:
+        return
+
+    async_to_sync(_group_send_all)(channel_layer, reading_messages(readings))
+
+
+def broadcast_alerts(alerts):
+    """ส่งการแจ้งเตือนผ่าน WebSocket ไปยัง group ของอุปกรณ์"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not alerts:
+        return
+
+    messages = [
+        (f"sensor_data_{alert.device_id}", {"type": "alert", "data": serialize_alert(alert)})
+        for alert in alerts
+    ]
+    async_to_sync(_group_send_all)(channel_layer, messages)
+
+
+async def _group_send_all(channel_layer, messages):
+    # channel layer ที่ส่งหลายข้อความได้ในครั้งเดียว (SQLiteChannelLayer) ใช้ transaction เดียว
+    group_send_many = getattr(channel_layer, 'group_send_many', None)
+    if group_send_many is not None:
+        await group_send_many(messages)
+        return
+    for group, event in messages:
+        await channel_layer.group_send(group, event)
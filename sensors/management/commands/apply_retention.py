@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from sensors.retention import delete_in_batches, retention_targets
+
+
+class Command(BaseCommand):
+    help = 'ลบข้อมูลที่เก่ากว่านโยบายเก็บข้อมูล (RetentionPolicy) เป็นชุด ๆ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', help='ใช้นโยบายเฉพาะอุปกรณ์นี้ (UUID)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='จำนวนแถวที่ลบต่อครั้ง')
+        parser.add_argument('--sleep-ms', type=int, default=50,
+                            help='เวลาพักระหว่างชุด (มิลลิวินาที) เพื่อให้การบันทึกข้อมูลใหม่ทำงานได้')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='แสดงจำนวนแถวที่จะลบโดยไม่ลบจริง')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='รัน VACUUM หลังลบเสร็จ (SQLite) เพื่อคืนพื้นที่ไฟล์')
+        parser.add_argument('--incremental-vacuum', type=int, nargs='?', const=0, metavar='PAGES',
+                            help='รัน incremental vacuum หลังลบเสร็จ (SQLite) ไม่ระบุจำนวนหน้าคือคืนทั้งหมด')
+
+    def handle(self, *args, **options):
+        targets = retention_targets(device_id=options['device'])
+        if not targets:
+            self.stdout.write('ไม่มีนโยบายเก็บข้อมูลที่ต้องใช้')
+
+        sleep = options['sleep_ms'] / 1000
+        totals = {}
+        for device_id, sensor_type_id, name, queryset in targets:
+            label = f'{device_id} / {sensor_type_id} [{name}]'
+            if options['dry_run']:
+                count = queryset.count()
+            else:
+                def progress(deleted, label=label):
+                    self.stdout.write(f'  {label}: ลบแล้ว {deleted} แถว')
+
+                count = delete_in_batches(queryset, options['batch_size'], sleep, progress)
+            if count:
+                self.stdout.write(f'{label}: {count} แถว')
+            totals[name] = totals.get(name, 0) + count
+
+        verb = 'จะลบ' if options['dry_run'] else 'ลบ'
+        for name, count in totals.items():
+            self.stdout.write(self.style.SUCCESS(f'{verb} {name} ทั้งหมด {count} แถว'))
+
+        if not options['dry_run']:
+            self.vacuum(options)
+
+    def vacuum(self, options):
+        if not (options['vacuum'] or options['incremental_vacuum'] is not None):
+            return
+        if connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING('ข้าม VACUUM: ใช้ได้เฉพาะ SQLite (ฐานข้อมูลอื่นใช้ autovacuum)'))
+            return
+
+        with connection.cursor() as cursor:
+            if options['vacuum']:
+                self.stdout.write('กำลัง VACUUM...')
+                cursor.execute('VACUUM')
+            else:
+                cursor.execute('PRAGMA auto_vacuum')
+                if cursor.fetchone()[0] != 2:
+                    # ต้องเปลี่ยนโหมดแล้ว VACUUM หนึ่งครั้ง ครั้งต่อไปจึงคืนพื้นที่แบบ incremental ได้
+                    self.stdout.write('เปลี่ยนเป็น auto_vacuum=INCREMENTAL และ VACUUM ครั้งแรก...')
+                    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    cursor.execute('VACUUM')
+                else:
+                    pages = options['incremental_vacuum']
+                    cursor.execute('PRAGMA freelist_count')
+                    self.stdout.write(f'หน้าว่าง {cursor.fetchone()[0]} หน้า กำลังคืนพื้นที่...')
+                    cursor.execute(f'PRAGMA incremental_vacuum({pages:d})' if pages else 'PRAGMA incremental_vacuum')
+                    cursor.fetchall()
+        self.stdout.write(self.style.SUCCESS('คืนพื้นที่ไฟล์ฐานข้อมูลเสร็จสิ้น'))
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sensors.anomaly import ewma_scores
+from sensors.history import load_series
+from sensors.models import DeviceLatestReading
+
+
+class Command(BaseCommand):
+    help = 'ทดสอบตัวตรวจจับค่าผิดปกติ (EWMA) ย้อนหลังกับข้อมูลที่บันทึกไว้'
+
+    def add_arguments(self, parser):
+        options = settings.SENSOR_ANOMALY
+        parser.add_argument('--device', help='เฉพาะอุปกรณ์นี้ (UUID)')
+        parser.add_argument('--sensor-type', type=int, help='เฉพาะประเภทเซ็นเซอร์นี้ (id)')
+        parser.add_argument('--days', type=int, default=30, help='ใช้ข้อมูลย้อนหลังกี่วัน')
+        parser.add_argument('--alpha', type=float, default=options['ALPHA'])
+        parser.add_argument('--threshold', type=float, default=options['THRESHOLD'])
+        parser.add_argument('--warmup', type=int, default=options['WARMUP'])
+        parser.add_argument('--top', type=int, default=5, help='แสดงจุดที่คะแนนสูงสุดกี่จุดต่อเซ็นเซอร์')
+
+    def handle(self, *args, **options):
+        end = timezone.now()
+        start = end - timedelta(days=options['days'])
+
+        streams = DeviceLatestReading.objects.select_related('device', 'sensor_type')
+        if options['device']:
+            streams = streams.filter(device_id=options['device'])
+        if options['sensor_type']:
+            streams = streams.filter(sensor_type_id=options['sensor_type'])
+
+        total_points = total_anomalies = 0
+        for stream in streams.order_by('device__name', 'sensor_type__name'):
+            series = load_series(stream.device_id, stream.sensor_type_id, start, end)
+            if len(series) == 0:
+                continue
+            scores = ewma_scores(series['v'], options['alpha'], options['warmup'])
+            flagged = np.flatnonzero(np.abs(np.nan_to_num(scores)) > options['threshold'])
+            total_points += len(series)
+            total_anomalies += len(flagged)
+
+            self.stdout.write(
+                f'{stream.device.name} / {stream.sensor_type.name}: '
+                f'{len(series)} จุด ผิดปกติ {len(flagged)} จุด ({len(flagged) / len(series):.2%})'
+            )
+            top = flagged[np.argsort(-np.abs(scores[flagged]))][:options['top']]
+            for index in sorted(top):
+                timestamp = datetime.fromtimestamp(series['t'][index], tz=dt_timezone.utc)
+                self.stdout.write(
+                    f'  {timestamp:%Y-%m-%d %H:%M:%S} ค่า {series["v"][index]:g} z = {scores[index]:+.1f}'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'รวม {total_points} จุด ผิดปกติ {total_anomalies} จุด '
+            f'(alpha={options["alpha"]}, threshold={options["threshold"]}, warmup={options["warmup"]})'
+        ))
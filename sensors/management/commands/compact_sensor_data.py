@@ -0,0 +1,53 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from sensors.coldstore import compact_day, day_range
+from sensors.models import SensorData
+
+
+class Command(BaseCommand):
+    help = 'ย้ายข้อมูลเซ็นเซอร์เก่าไปเก็บเป็นก้อนบีบอัดรายวัน (cold storage)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.SENSOR_COLD_AFTER_DAYS,
+                            help='ย้ายข้อมูลที่เก่ากว่าจำนวนวันนี้ (นับเป็นวันเต็มตาม UTC)')
+        parser.add_argument('--device', help='ย้ายเฉพาะอุปกรณ์นี้ (UUID)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='แสดงจำนวนวันและแถวที่จะย้ายโดยไม่แก้ไขข้อมูล')
+
+    def handle(self, *args, **options):
+        # ย้ายเฉพาะวันที่จบไปแล้วทั้งวัน
+        cutoff_day = (timezone.now() - timedelta(days=options['older_than_days'])).date()
+        cutoff, _ = day_range(cutoff_day)
+
+        readings = SensorData.objects.filter(timestamp__lt=cutoff)
+        if options['device']:
+            readings = readings.filter(device_id=options['device'])
+
+        keys = list(
+            readings.annotate(day=TruncDate('timestamp', tzinfo=dt_timezone.utc))
+            .values_list('device_id', 'sensor_type_id', 'day')
+            .distinct()
+            .order_by('day', 'device_id', 'sensor_type_id')
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f'จะย้าย {len(keys)} ก้อน ({readings.count()} แถว) ก่อน {cutoff_day}')
+            return
+
+        total_rows = total_bytes = 0
+        for index, (device_id, sensor_type_id, day) in enumerate(keys, 1):
+            moved, size = compact_day(device_id, sensor_type_id, day)
+            total_rows += moved
+            total_bytes += size
+            if index % 100 == 0:
+                self.stdout.write(f'ย้ายแล้ว {index}/{len(keys)} ก้อน ({total_rows} แถว)')
+
+        per_point = total_bytes / total_rows if total_rows else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'ย้ายข้อมูล {total_rows} แถว เป็น {len(keys)} ก้อน '
+            f'ขนาด {total_bytes} bytes ({per_point:.1f} bytes/จุด)'
+        ))
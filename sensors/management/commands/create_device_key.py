@@ -0,0 +1,37 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from sensors.auth import create_api_key
+from sensors.models import Device, DeviceAPIKey
+
+
+class Command(BaseCommand):
+    help = 'สร้าง API key ของอุปกรณ์ (แสดงคีย์ครั้งเดียว) หรือยกเลิกคีย์เดิม'
+
+    def add_arguments(self, parser):
+        parser.add_argument('device', help='UUID ของอุปกรณ์')
+        parser.add_argument('--name', default='', help='ชื่อคีย์ (เช่น firmware หรือสถานที่ติดตั้ง)')
+        parser.add_argument('--revoke', metavar='PREFIX',
+                            help='ยกเลิกคีย์ของอุปกรณ์ที่ขึ้นต้นด้วย PREFIX แทนการสร้างคีย์ใหม่')
+
+    def handle(self, *args, **options):
+        try:
+            device = Device.objects.get(id=options['device'])
+        except (Device.DoesNotExist, ValidationError):
+            raise CommandError(f"ไม่พบอุปกรณ์ {options['device']}")
+
+        if options['revoke']:
+            keys = DeviceAPIKey.objects.filter(
+                device=device, prefix__startswith=options['revoke'], revoked_at__isnull=True
+            )
+            count = 0
+            for api_key in keys:
+                api_key.revoked_at = timezone.now()
+                api_key.save(update_fields=['revoked_at'])
+                count += 1
+            self.stdout.write(f'ยกเลิก {count} คีย์ของ {device.name}')
+            return
+
+        api_key, key = create_api_key(device, options['name'])
+        self.stdout.write(f'สร้างคีย์ {api_key.prefix}… ของ {device.name} แล้ว (คีย์นี้จะไม่แสดงอีก)')
+        self.stdout.write(key)
@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from sensors.channel_layers import local_layer_warning
+from sensors.heartbeat import HeartbeatTracker, save_offline_changes
+from sensors.ingest import broadcast_alerts
+from sensors.models import Device, SensorAlert
+
+
+class Command(BaseCommand):
+    help = 'ตรวจจับอุปกรณ์ที่หยุดส่งข้อมูล แล้วสร้างหรือปิดการแจ้งเตือน offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=settings.SENSOR_HEARTBEAT['TICK_SECONDS'],
+                            help='ตรวจทุก ๆ กี่วินาที')
+        parser.add_argument('--once', action='store_true', help='ตรวจรอบเดียวแล้วจบ')
+
+    def handle(self, *args, **options):
+        options_hb = settings.SENSOR_HEARTBEAT
+        tracker = HeartbeatTracker(options_hb['DEFAULT_INTERVAL'], options_hb['GRACE'])
+        tick = options['tick']
+        # อ่านซ้อนย้อนหลังเล็กน้อย เผื่อ transaction ที่ commit ช้ากว่าเวลาที่บันทึก
+        overlap = timedelta(seconds=max(tick, options_hb['TOUCH_SECONDS']) * 2)
+
+        warning = local_layer_warning()
+        if warning:
+            self.stderr.write(self.style.WARNING(warning))
+        cursor = self.load(tracker)
+        self.stdout.write(f'เริ่มติดตามอุปกรณ์ (ตรวจทุก {tick} วินาที)')
+
+        while True:
+            now = timezone.now()
+            changed = Device.objects.filter(
+                is_active=True, last_seen_at__gte=cursor - overlap
+            ).values_list('id', 'heartbeat_interval', 'last_seen_at')
+
+            came_back = []
+            for device_id, interval, last_seen_at in changed:
+                tracker.set_interval(device_id, interval)
+                if tracker.record(device_id, last_seen_at.timestamp()):
+                    came_back.append(device_id)
+                cursor = max(cursor, last_seen_at)
+
+            went_offline = tracker.expire(now.timestamp())
+            if went_offline or came_back:
+                alerts = save_offline_changes(tracker, went_offline, came_back)
+                broadcast_alerts(alerts)
+                self.stdout.write(f'{now:%H:%M:%S} offline {len(went_offline)} ตัว, กลับมา {len(came_back)} ตัว')
+
+            if options['once']:
+                break
+            time.sleep(tick)
+
+    def load(self, tracker):
+        """โหลดเวลาล่าสุดของทุกอุปกรณ์ครั้งเดียวตอนเริ่ม คืนค่าเวลาล่าสุดที่พบ"""
+        now = timezone.now()
+        devices = Device.objects.filter(is_active=True, last_seen_at__isnull=False)
+        for device_id, interval, last_seen_at in devices.values_list(
+                'id', 'heartbeat_interval', 'last_seen_at'):
+            tracker.set_interval(device_id, interval)
+            tracker.record(device_id, last_seen_at.timestamp())
+
+        # อุปกรณ์ที่ยังมีการแจ้งเตือน offline เปิดอยู่: กลับมาแล้วระหว่างที่ไม่ได้ตรวจ หรือยัง offline
+        came_back = []
+        open_alerts = SensorAlert.objects.filter(alert_type='offline', is_resolved=False)
+        for device_id in set(open_alerts.values_list('device_id', flat=True)):
+            last_seen = tracker.last_seen(device_id)
+            if last_seen is not None and last_seen + tracker.timeout(device_id) > now.timestamp():
+                came_back.append(device_id)
+            else:
+                tracker.mark_offline(device_id)
+        if came_back:
+            save_offline_changes(tracker, [], came_back)
+
+        return devices.aggregate(latest=Max('last_seen_at'))['latest'] or now
@@ -0,0 +1,115 @@
+import logging
+import time
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from sensors.buffer import BufferFull
+from sensors.channel_layers import local_layer_warning
+from sensors.ingest import get_ingest_buffer
+from sensors.mqtt_bridge import InvalidMessage, ReadingResolver
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'รับข้อมูลเซ็นเซอร์จาก MQTT broker แล้วบันทึกเป็นชุดผ่านบัฟเฟอร์ของ ingest'
+
+    def add_arguments(self, parser):
+        options = settings.MQTT
+        parser.add_argument('--host', default=options['HOST'])
+        parser.add_argument('--port', type=int, default=options['PORT'])
+        parser.add_argument('--username', default=options['USERNAME'])
+        parser.add_argument('--password', default=options['PASSWORD'])
+        parser.add_argument('--topic', action='append',
+                            help=f"topic ที่ subscribe (ระบุได้หลายครั้ง ค่าเริ่มต้น {options['TOPIC']})")
+        parser.add_argument('--qos', type=int, choices=(0, 1, 2), default=options['QOS'])
+        parser.add_argument('--client-id', default='', help='ระบุเพื่อใช้ persistent session ของ broker')
+        parser.add_argument('--stats-seconds', type=int, default=60,
+                            help='แสดงสถิติทุก ๆ กี่วินาที (0 คือไม่แสดง)')
+
+    def handle(self, *args, **options):
+        topics = options['topic'] or [settings.MQTT['TOPIC']]
+        qos = options['qos']
+        self.resolver = ReadingResolver()
+        # ใช้บัฟเฟอร์เดียวกับโหมด buffered: บันทึกด้วย bulk_create ตรวจแจ้งเตือน แล้วกระจายผ่าน channel layer
+        # ซึ่งต้องเป็น channel layer ที่ใช้ร่วมกับ web server จึงจะถึง WebSocket
+        warning = local_layer_warning()
+        if warning:
+            self.stderr.write(self.style.WARNING(warning))
+        self.buffer = buffer = get_ingest_buffer()
+        self.counts = counts = {'received': 0, 'invalid': 0, 'rejected': 0, 'dropped': 0}
+
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=options['client_id'],
+            clean_session=not options['client_id'],
+        )
+        if options['username']:
+            client.username_pw_set(options['username'], options['password'] or None)
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+        def on_connect(client, userdata, flags, reason_code, properties):
+            if reason_code.is_failure:
+                self.stderr.write(f'เชื่อมต่อ broker ไม่สำเร็จ: {reason_code}')
+                return
+            # subscribe ทุกครั้งที่เชื่อมต่อ (รวมถึงหลัง reconnect)
+            client.subscribe([(topic, qos) for topic in topics])
+            self.stdout.write(f"เชื่อมต่อ {options['host']}:{options['port']} แล้ว subscribe {', '.join(topics)}")
+
+        def on_connect_fail(client, userdata):
+            self.stderr.write(f"เชื่อมต่อ {options['host']}:{options['port']} ไม่ได้ กำลังลองใหม่")
+
+        def on_disconnect(client, userdata, flags, reason_code, properties):
+            if reason_code.is_failure:
+                self.stderr.write(f'การเชื่อมต่อหลุด ({reason_code}) กำลังเชื่อมต่อใหม่')
+
+        def on_message(client, userdata, message):
+            self.ingest(message.topic, message.payload)
+
+        client.on_connect = on_connect
+        client.on_connect_fail = on_connect_fail
+        client.on_disconnect = on_disconnect
+        client.on_message = on_message
+
+        client.connect_async(options['host'], options['port'], keepalive=settings.MQTT['KEEPALIVE'])
+        client.loop_start()
+        try:
+            while True:
+                time.sleep(options['stats_seconds'] or 3600)
+                if options['stats_seconds']:
+                    stats = buffer.get_stats()
+                    self.stdout.write(
+                        f"รับ {counts['received']} ข้าม {counts['invalid']} คิวเต็ม {counts['rejected']} "
+                        f"ทิ้ง {counts['dropped']} "
+                        f"บันทึก {stats['flushed']} ล้มเหลว {stats['failed']} ค้าง {stats['depth']}"
+                    )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            client.disconnect()
+            client.loop_stop()
+            buffer.stop()
+
+    def ingest(self, topic, payload):
+        """ใส่ข้อความหนึ่งข้อความลงบัฟเฟอร์ (เรียกใน network thread ของ paho)
+
+        ข้อความที่ใช้ไม่ได้ถูกนับและข้ามไป exception ใด ๆ ต้องไม่หลุดออกไปหยุด network loop
+        """
+        counts = self.counts
+        counts['received'] += 1
+        try:
+            self.buffer.put(self.resolver.resolve(topic, payload))
+        except InvalidMessage as e:
+            counts['invalid'] += 1
+            logger.warning('ข้าม %s: %s', topic, e)
+        except BufferFull:
+            counts['rejected'] += 1
+        except Exception:
+            # เช่น ฐานข้อมูลผิดพลาดขณะค้นอุปกรณ์หรือประเภทเซ็นเซอร์
+            counts['dropped'] += 1
+            logger.exception('ข้อความจาก %s ผิดพลาด', topic)
+        finally:
+            # query ของ resolver ทำใน network thread นี้
+            close_old_connections()
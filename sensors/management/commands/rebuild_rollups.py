@@ -0,0 +1,129 @@
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from sensors.coldstore import decode_points
+from sensors.models import SensorData, SensorDataSegment, SensorRollup
+from sensors.rollups import BUCKET_SECONDS, aggregate_readings, bucket_start, write_rollups
+
+
+class Command(BaseCommand):
+    help = 'สร้างตาราง rollup ใหม่จากข้อมูลเซ็นเซอร์ดิบ (ใช้สำหรับ backfill ครั้งแรกด้วย --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', help='สร้างใหม่เฉพาะอุปกรณ์นี้ (UUID)')
+        parser.add_argument('--since', help='สร้างใหม่ตั้งแต่วันที่นี้ (YYYY-MM-DD) ค่าเริ่มต้นคือทั้งหมด')
+        parser.add_argument('--all', action='store_true',
+                            help='ลบและสร้าง rollup ใหม่ทุก bucket รวมถึงช่วงที่ข้อมูลดิบถูกลบตาม '
+                                 'RetentionPolicy ไปแล้ว (ค่าเริ่มต้นคือเฉพาะ bucket ที่ยังมีข้อมูลดิบหรือ '
+                                 'cold storage ครบ)')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='จำนวนแถวที่อ่านต่อรอบ และจำนวน bucket สูงสุดก่อนเขียนลงฐานข้อมูล')
+
+    def handle(self, *args, **options):
+        readings = SensorData.objects.order_by('device', 'sensor_type', 'timestamp')
+        rollups = SensorRollup.objects.all()
+        segments = SensorDataSegment.objects.all()
+        since = None
+
+        if options['device']:
+            readings = readings.filter(device_id=options['device'])
+            rollups = rollups.filter(device_id=options['device'])
+            segments = segments.filter(device_id=options['device'])
+
+        # (device_id, sensor_type_id) -> {bucket: เวลาเริ่มของ bucket แรกที่สร้างใหม่} (None คือทุก bucket)
+        starts = None if options['all'] else self.covered_starts(readings, segments)
+
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since ต้องอยู่ในรูปแบบ YYYY-MM-DD')
+            # เริ่มที่ต้นวัน เพื่อให้ bucket รายวันถูกสร้างใหม่ครบทั้งวัน
+            since = bucket_start(timezone.make_aware(datetime.combine(since, time.min)), '1d')
+            readings = readings.filter(timestamp__gte=since)
+            rollups = rollups.filter(bucket_start__gte=since)
+            segments = segments.filter(end_time__gte=since)
+
+        chunk_size = options['chunk_size']
+        total = 0
+
+        def flush(aggregates):
+            if starts is not None:
+                aggregates = {
+                    key: values for key, values in aggregates.items()
+                    if key[3] >= starts[key[:2]][key[2]]
+                }
+            write_rollups(aggregates)
+
+        with transaction.atomic():
+            if starts is None:
+                deleted, _ = rollups.delete()
+            else:
+                # ไม่แตะ rollup ของช่วงที่ข้อมูลดิบถูกลบไปแล้ว (และของเซ็นเซอร์ที่ไม่เหลือข้อมูลดิบเลย)
+                deleted = 0
+                for (device_id, sensor_type_id), bucket_starts in starts.items():
+                    condition = Q()
+                    for bucket, start in bucket_starts.items():
+                        condition |= Q(bucket=bucket, bucket_start__gte=start)
+                    count, _ = rollups.filter(condition, device_id=device_id, sensor_type_id=sensor_type_id).delete()
+                    deleted += count
+            self.stdout.write(f'ลบ rollup เดิม {deleted} แถว')
+
+            # write_rollups บวกค่าเข้ากับแถวเดิม จึงเขียนเป็นช่วง ๆ ได้โดยไม่ต้องเก็บทุก bucket ไว้ในหน่วยความจำ
+            aggregates = {}
+            rows = readings.values_list('device_id', 'sensor_type_id', 'timestamp', 'value')
+            for row in rows.iterator(chunk_size=chunk_size):
+                aggregate_readings([row], aggregates)
+                total += 1
+                if len(aggregates) >= chunk_size:
+                    flush(aggregates)
+                    aggregates = {}
+                    self.stdout.write(f'ประมวลผลแล้ว {total} แถว')
+
+            # ข้อมูลที่ย้ายไป cold storage แล้ว
+            segments = segments.values_list('device_id', 'sensor_type_id', 'payload')
+            for device_id, sensor_type_id, payload in segments.iterator(chunk_size=20):
+                rows = [
+                    (device_id, sensor_type_id, timestamp, value)
+                    for timestamp, value in decode_points(payload)
+                    if since is None or timestamp >= since
+                ]
+                aggregate_readings(rows, aggregates)
+                total += len(rows)
+                if len(aggregates) >= chunk_size:
+                    flush(aggregates)
+                    aggregates = {}
+                    self.stdout.write(f'ประมวลผลแล้ว {total} แถว')
+            flush(aggregates)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'สร้าง rollup ใหม่จากข้อมูล {total} แถวเสร็จสิ้น')
+        )
+
+    @staticmethod
+    def covered_starts(readings, segments):
+        """bucket แรกของแต่ละขนาดที่เริ่มไม่ก่อนข้อมูลแรกที่ยังเหลือ (ข้อมูลดิบหรือ cold storage)
+
+        bucket ที่คร่อมข้อมูลแรกอาจถูกลบข้อมูลดิบไปบางส่วนแล้ว จึงเก็บ rollup เดิมไว้
+        """
+        earliest = {}
+        for device_id, sensor_type_id, first in chain(
+            readings.order_by().values('device_id', 'sensor_type_id')
+            .annotate(first=Min('timestamp')).values_list('device_id', 'sensor_type_id', 'first'),
+            segments.order_by().values('device_id', 'sensor_type_id')
+            .annotate(first=Min('start_time')).values_list('device_id', 'sensor_type_id', 'first'),
+        ):
+            key = (device_id, sensor_type_id)
+            earliest[key] = min(earliest.get(key, first), first)
+
+        starts = {}
+        for key, first in earliest.items():
+            starts[key] = {}
+            for bucket, size in BUCKET_SECONDS.items():
+                start = bucket_start(first, bucket)
+                starts[key][bucket] = start if start == first else start + timedelta(seconds=size)
+        return starts
@@ -0,0 +1,188 @@
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from itertools import repeat
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from sensors.heartbeat import touch_devices
+from sensors.ingest import update_latest_readings
+from sensors.models import Device, SensorData
+from sensors.rollups import aggregate_series, write_rollups
+from sensors.synthetic import PROFILES, device_seeds, generate_device, get_or_create_sensor_types
+
+
+def _generate(job):
+    return generate_device(*job)
+
+
+def _imap(jobs, workers):
+    """ผลของ generate_device ตามลำดับ jobs (workers > 1 คือสร้างใน process อื่น)
+
+    ส่งงานล่วงหน้าไม่เกิน 2 เท่าของจำนวน worker เพื่อไม่ให้ข้อมูลที่รอบันทึกค้างในหน่วยความจำ
+    """
+    if workers <= 1:
+        yield from map(_generate, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(_generate, job))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class RowWriter:
+    """เขียน SensorData เป็นชุดด้วย executemany ของ INSERT เดียว
+
+    ไม่สร้าง model instance ทีละแถวแบบ bulk_create (ซึ่งใช้เวลาส่วนใหญ่ของการเขียน)
+    ค่าที่ซ้ำกันทั้งชุด เช่น อุปกรณ์และเวลา ถูกแปลงเป็นค่าของฐานข้อมูลเพียงครั้งเดียว
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.rows = []
+        self.total = 0
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        meta = SensorData._meta
+        self.fields = {name: meta.get_field(name) for name in ('id', 'device', 'sensor_type', 'value', 'timestamp')}
+        quote = self.connection.ops.quote_name
+        self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(meta.db_table),
+            ', '.join(quote(field.column) for field in self.fields.values()),
+            ', '.join(['%s'] * len(self.fields)),
+        )
+
+    @property
+    def pending(self):
+        return len(self.rows)
+
+    def prepare_timestamps(self, stamps):
+        field = self.fields['timestamp']
+        return [field.get_db_prep_save(stamp, self.connection) for stamp in stamps]
+
+    def add(self, device_id, sensor_type_id, values, prepared_stamps):
+        """เพิ่มข้อมูลของเซ็นเซอร์หนึ่งตัว คืน id ของแถวสุดท้าย (None ถ้าไม่มีข้อมูล)"""
+        device = self.fields['device'].get_db_prep_save(device_id, self.connection)
+        sensor_type = self.fields['sensor_type'].get_db_prep_save(sensor_type_id, self.connection)
+        ids = [uuid.uuid4() for _ in values]
+        # เหมือน UUIDField.get_db_prep_value: ฐานข้อมูลที่ไม่มีชนิด UUID เก็บเป็น hex
+        prepared_ids = ids if self.connection.features.has_native_uuid_field else [row_id.hex for row_id in ids]
+        self.rows.extend(zip(prepared_ids, repeat(device), repeat(sensor_type), values, prepared_stamps))
+        return ids[-1] if ids else None
+
+    def flush(self):
+        for start in range(0, len(self.rows), self.batch_size):
+            with self.connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows[start:start + self.batch_size])
+        self.total += len(self.rows)
+        self.rows = []
+
+
+class Command(BaseCommand):
+    help = 'สร้างข้อมูลเซ็นเซอร์จำลองหลายอุปกรณ์ (รอบวัน + noise + spike + ช่วงขาดข้อมูล) สำหรับทดสอบและ benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=10, help='จำนวนอุปกรณ์ใหม่ที่จะสร้าง')
+        parser.add_argument('--device', action='append', metavar='UUID',
+                            help='ใช้อุปกรณ์ที่มีอยู่แทนการสร้างใหม่ (ระบุได้หลายครั้ง)')
+        parser.add_argument('--owner', default='seed', help='เจ้าของอุปกรณ์ใหม่ (สร้างผู้ใช้ถ้ายังไม่มี)')
+        parser.add_argument('--name-prefix', default='seed', help='คำนำหน้าชื่ออุปกรณ์ใหม่')
+        parser.add_argument('--sensor-types', default=','.join(PROFILES),
+                            help=f'ประเภทเซ็นเซอร์ คั่นด้วยจุลภาค (จาก {", ".join(PROFILES)})')
+        parser.add_argument('--days', type=float, default=1, help='ช่วงเวลาย้อนหลังจากปัจจุบัน')
+        parser.add_argument('--interval', type=float, default=60, help='ระยะห่างระหว่างข้อมูล (วินาที)')
+        parser.add_argument('--gap-rate', type=float, default=0.0005,
+                            help='โอกาสที่แต่ละจุดจะเริ่มช่วงขาดข้อมูล')
+        parser.add_argument('--spike-rate', type=float, default=0.001, help='สัดส่วนของค่าที่เป็น spike')
+        parser.add_argument('--seed', type=int, default=0, help='seed ของตัวสุ่ม (ผลลัพธ์เหมือนเดิมทุกครั้ง)')
+        parser.add_argument('--batch-size', type=int, default=20000, help='จำนวนแถวที่เขียนต่อครั้ง')
+        parser.add_argument('--workers', type=int, default=1, help='จำนวน process ที่ใช้สร้างข้อมูล')
+        parser.add_argument('--no-rollups', action='store_true', help='ไม่สร้าง rollup (สร้างภายหลังด้วย rebuild_rollups --all)')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['sensor_types'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in PROFILES]
+        if unknown or not names:
+            raise CommandError(f"ไม่รู้จักประเภทเซ็นเซอร์ {', '.join(unknown)} (เลือกจาก {', '.join(PROFILES)})")
+        if options['interval'] <= 0 or options['days'] <= 0 or options['batch_size'] <= 0:
+            raise CommandError('--interval, --days และ --batch-size ต้องมากกว่า 0')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            devices = self.get_devices(options)
+            sensor_types = get_or_create_sensor_types(names)
+            total = self.seed(devices, sensor_types, options)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'สร้างข้อมูล {total} แถวของ {len(devices)} อุปกรณ์ใน {elapsed:.1f} วินาที '
+            f'({total / max(elapsed, 1e-9):,.0f} แถว/วินาที)'
+        ))
+
+    def get_devices(self, options):
+        if options['device']:
+            try:
+                devices = list(Device.objects.filter(id__in=options['device']))
+            except ValidationError:
+                raise CommandError('--device ต้องเป็น UUID')
+            if len(devices) != len(set(options['device'])):
+                raise CommandError('ไม่พบอุปกรณ์บางตัวที่ระบุใน --device')
+            return devices
+
+        if options['devices'] <= 0:
+            raise CommandError('--devices ต้องมากกว่า 0')
+        owner, created = get_user_model().objects.get_or_create(
+            username=options['owner'], defaults={'email': f"{options['owner']}@example.com"}
+        )
+        if created:
+            owner.set_unusable_password()
+            owner.save(update_fields=['password'])
+        return Device.objects.bulk_create([
+            Device(name=f"{options['name_prefix']}-{i:04d}", owner=owner)
+            for i in range(1, options['devices'] + 1)
+        ])
+
+    def seed(self, devices, sensor_types, options):
+        end = timezone.now().timestamp()
+        start = end - options['days'] * 86400
+        names = [sensor_type.name for sensor_type in sensor_types]
+        jobs = [
+            (seed, names, start, end, options['interval'], options['gap_rate'], options['spike_rate'])
+            for seed in device_seeds(options['seed'], len(devices))
+        ]
+
+        batch_size = options['batch_size']
+        rollups = not options['no_rollups']
+        writer = RowWriter(batch_size)
+        latest, aggregates = [], {}
+        for device, (times, series) in zip(devices, _imap(jobs, options['workers'])):
+            stamps = [datetime.fromtimestamp(t, tz=dt_timezone.utc) for t in times.tolist()]
+            prepared_stamps = writer.prepare_timestamps(stamps)
+            for sensor_type in sensor_types:
+                values = series[sensor_type.name]
+                last_id = writer.add(device.id, sensor_type.id, values.tolist(), prepared_stamps)
+                if last_id is not None:
+                    latest.append(SensorData(id=last_id, device_id=device.id, sensor_type_id=sensor_type.id,
+                                             value=float(values[-1]), timestamp=stamps[-1]))
+                if rollups:
+                    aggregate_series(device.id, sensor_type.id, times, values, aggregates)
+                if writer.pending >= batch_size:
+                    writer.flush()
+                    self.stdout.write(f'บันทึกแล้ว {writer.total} แถว')
+            if len(aggregates) >= batch_size:
+                write_rollups(aggregates)
+                aggregates = {}
+
+        writer.flush()
+        update_latest_readings(latest)
+        write_rollups(aggregates)
+        touch_devices([device.id for device in devices])
+        return writer.total
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_latest_readings(apps, schema_editor):
+    """สร้างค่าล่าสุดจากข้อมูลเซ็นเซอร์ที่มีอยู่แล้ว"""
+    SensorData = apps.get_model('sensors', 'SensorData')
+    DeviceLatestReading = apps.get_model('sensors', 'DeviceLatestReading')
+    
+    pairs = SensorData.objects.order_by().values_list('device_id', 'sensor_type_id').distinct()
+    latest_readings = []
+    for device_id, sensor_type_id in pairs:
+        latest = SensorData.objects.filter(
+            device_id=device_id,
+            sensor_type_id=sensor_type_id
+        ).order_by('-timestamp').first()
+        latest_readings.append(DeviceLatestReading(
+            device_id=device_id,
+            sensor_type_id=sensor_type_id,
+            reading_id=latest.id,
+            value=latest.value,
+            timestamp=latest.timestamp
+        ))
+    
+    DeviceLatestReading.objects.bulk_create(latest_readings, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceLatestReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reading_id', models.UUIDField(verbose_name='รหัสข้อมูล')),
+                ('value', models.FloatField(verbose_name='ค่า')),
+                ('timestamp', models.DateTimeField(verbose_name='เวลาที่บันทึก')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.device', verbose_name='อุปกรณ์')),
+                ('sensor_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.sensortype', verbose_name='ประเภทเซ็นเซอร์')),
+            ],
+            options={
+                'verbose_name': 'ค่าล่าสุด',
+                'verbose_name_plural': 'ค่าล่าสุด',
+                'ordering': ['sensor_type__name'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='devicelatestreading',
+            constraint=models.UniqueConstraint(fields=('device', 'sensor_type'), name='unique_latest_reading'),
+        ),
+        migrations.RunPython(backfill_latest_readings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0002_device_latest_reading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(choices=[('1m', '1 นาที'), ('1h', '1 ชั่วโมง'), ('1d', '1 วัน')], max_length=2, verbose_name='ช่วงเวลา')),
+                ('bucket_start', models.DateTimeField(verbose_name='เริ่มช่วงเวลา')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='จำนวนข้อมูล')),
+                ('sum_value', models.FloatField(default=0, verbose_name='ผลรวม')),
+                ('min_value', models.FloatField(verbose_name='ค่าต่ำสุด')),
+                ('max_value', models.FloatField(verbose_name='ค่าสูงสุด')),
+                ('sum_squares', models.FloatField(default=0, verbose_name='ผลรวมกำลังสอง')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.device', verbose_name='อุปกรณ์')),
+                ('sensor_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.sensortype', verbose_name='ประเภทเซ็นเซอร์')),
+            ],
+            options={
+                'verbose_name': 'สรุปข้อมูลเซ็นเซอร์',
+                'verbose_name_plural': 'สรุปข้อมูลเซ็นเซอร์',
+                'ordering': ['-bucket_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sensorrollup',
+            constraint=models.UniqueConstraint(fields=('device', 'sensor_type', 'bucket', 'bucket_start'), name='unique_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0003_sensor_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDataSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='วันที่')),
+                ('start_time', models.DateTimeField(verbose_name='เวลาแรก')),
+                ('end_time', models.DateTimeField(verbose_name='เวลาสุดท้าย')),
+                ('count', models.PositiveIntegerField(verbose_name='จำนวนข้อมูล')),
+                ('min_value', models.FloatField(verbose_name='ค่าต่ำสุด')),
+                ('max_value', models.FloatField(verbose_name='ค่าสูงสุด')),
+                ('payload', models.BinaryField(verbose_name='ข้อมูลบีบอัด')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.device', verbose_name='อุปกรณ์')),
+                ('sensor_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.sensortype', verbose_name='ประเภทเซ็นเซอร์')),
+            ],
+            options={
+                'verbose_name': 'ข้อมูลเซ็นเซอร์ที่บีบอัด',
+                'verbose_name_plural': 'ข้อมูลเซ็นเซอร์ที่บีบอัด',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['device', 'sensor_type', '-end_time'], name='sensors_sen_device__4cef93_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sensordatasegment',
+            constraint=models.UniqueConstraint(fields=('device', 'sensor_type', 'day'), name='unique_segment_day'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0004_sensor_data_segment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('raw_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='เก็บข้อมูลดิบ (วัน)')),
+                ('minute_rollup_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='เก็บ rollup รายนาที (วัน)')),
+                ('hour_rollup_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='เก็บ rollup รายชั่วโมง (วัน)')),
+                ('day_rollup_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='เก็บ rollup รายวัน (วัน)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sensors.device', verbose_name='อุปกรณ์')),
+                ('sensor_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sensors.sensortype', verbose_name='ประเภทเซ็นเซอร์')),
+            ],
+            options={
+                'verbose_name': 'นโยบายเก็บข้อมูล',
+                'verbose_name_plural': 'นโยบายเก็บข้อมูล',
+                'ordering': ['device', 'sensor_type'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='retentionpolicy',
+            constraint=models.UniqueConstraint(fields=('device', 'sensor_type'), name='unique_retention_scope'),
+        ),
+    ]
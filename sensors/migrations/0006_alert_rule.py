@@ -0,0 +1,37 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0005_retention_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_threshold', models.FloatField(blank=True, null=True, verbose_name='เกณฑ์ค่าสูง')),
+                ('low_threshold', models.FloatField(blank=True, null=True, verbose_name='เกณฑ์ค่าต่ำ')),
+                ('hysteresis', models.FloatField(default=0, verbose_name='ระยะ hysteresis')),
+                ('is_active', models.BooleanField(default=True, verbose_name='สถานะใช้งาน')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='วันที่อัปเดต')),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sensors.device', verbose_name='อุปกรณ์')),
+                ('sensor_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.sensortype', verbose_name='ประเภทเซ็นเซอร์')),
+            ],
+            options={
+                'verbose_name': 'เกณฑ์แจ้งเตือน',
+                'verbose_name_plural': 'เกณฑ์แจ้งเตือน',
+                'ordering': ['sensor_type', 'device'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='alertrule',
+            constraint=models.UniqueConstraint(fields=('device', 'sensor_type'), name='unique_alert_rule'),
+        ),
+    ]
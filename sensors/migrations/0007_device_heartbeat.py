@@ -0,0 +1,29 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0006_alert_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='heartbeat_interval',
+            field=models.PositiveIntegerField(blank=True, help_text='เว้นว่างเพื่อใช้ค่าเริ่มต้นของระบบ', null=True, verbose_name='ช่วงเวลาส่งข้อมูล (วินาที)'),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='ส่งข้อมูลล่าสุด'),
+        ),
+        migrations.AlterField(
+            model_name='sensoralert',
+            name='sensor_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sensors.sensortype', verbose_name='ประเภทเซ็นเซอร์'),
+        ),
+    ]
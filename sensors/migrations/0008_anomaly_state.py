@@ -0,0 +1,39 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0007_device_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensoralert',
+            name='score',
+            field=models.FloatField(blank=True, null=True, verbose_name='คะแนนความผิดปกติ'),
+        ),
+        migrations.CreateModel(
+            name='AnomalyState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='จำนวนข้อมูล')),
+                ('mean', models.FloatField(default=0, verbose_name='ค่าเฉลี่ย (EWMA)')),
+                ('variance', models.FloatField(default=0, verbose_name='ความแปรปรวน (EWMA)')),
+                ('updated_at', models.DateTimeField(verbose_name='วันที่อัปเดต')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.device', verbose_name='อุปกรณ์')),
+                ('sensor_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sensors.sensortype', verbose_name='ประเภทเซ็นเซอร์')),
+            ],
+            options={
+                'verbose_name': 'สถานะตรวจจับค่าผิดปกติ',
+                'verbose_name_plural': 'สถานะตรวจจับค่าผิดปกติ',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='anomalystate',
+            constraint=models.UniqueConstraint(fields=('device', 'sensor_type'), name='unique_anomaly_state'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+def backfill_last_triggered_at(apps, schema_editor):
+    """การแจ้งเตือนเดิมเกิดครั้งเดียว ใช้เวลาที่สร้างเป็นเวลาที่เกิดล่าสุด"""
+    SensorAlert = apps.get_model('sensors', 'SensorAlert')
+    SensorAlert.objects.update(last_triggered_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0008_anomaly_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensoralert',
+            name='last_triggered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='เกิดล่าสุด'),
+        ),
+        migrations.AddField(
+            model_name='sensoralert',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1, verbose_name='จำนวนครั้งที่เกิด'),
+        ),
+        migrations.AddIndex(
+            model_name='sensoralert',
+            index=models.Index(fields=['is_resolved', 'device', 'sensor_type', 'alert_type'], name='sensors_sen_is_reso_861060_idx'),
+        ),
+        migrations.RunPython(backfill_last_triggered_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.25 on 2026-10-18 09:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0009_alert_occurrences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceAPIKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='ชื่อคีย์')),
+                ('prefix', models.CharField(max_length=12, verbose_name='ส่วนต้นของคีย์')),
+                ('key_hash', models.CharField(max_length=64, unique=True, verbose_name='ค่าแฮชของคีย์')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('last_used_at', models.DateTimeField(blank=True, null=True, verbose_name='ใช้งานล่าสุด')),
+                ('revoked_at', models.DateTimeField(blank=True, null=True, verbose_name='วันที่ยกเลิก')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_keys', to='sensors.device', verbose_name='อุปกรณ์')),
+            ],
+            options={
+                'verbose_name': 'API key ของอุปกรณ์',
+                'verbose_name_plural': 'API key ของอุปกรณ์',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:53
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+def remove_duplicate_scopes(apps, schema_editor):
+    # ขอบเขตที่เว้นว่างเคยซ้ำได้ เก็บนโยบายที่สร้างล่าสุดของแต่ละขอบเขตไว้
+    RetentionPolicy = apps.get_model('sensors', 'RetentionPolicy')
+    seen = set()
+    for policy in RetentionPolicy.objects.order_by('-created_at', '-id'):
+        scope = (policy.device_id, policy.sensor_type_id)
+        if scope in seen:
+            policy.delete()
+        else:
+            seen.add(scope)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0010_device_api_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_scopes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='retentionpolicy',
+            constraint=models.UniqueConstraint(condition=models.Q(('sensor_type__isnull', True)), fields=('device',), name='unique_retention_device_scope'),
+        ),
+        migrations.AddConstraint(
+            model_name='retentionpolicy',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('sensor_type', models.Value(0)), condition=models.Q(('device__isnull', True)), name='unique_retention_global_scope'),
+        ),
+    ]
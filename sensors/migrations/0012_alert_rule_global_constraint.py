@@ -0,0 +1,29 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+def remove_duplicate_global_rules(apps, schema_editor):
+    # เกณฑ์ของทุกอุปกรณ์เคยซ้ำได้ เก็บเกณฑ์ที่แก้ไขล่าสุดของแต่ละประเภทเซ็นเซอร์ไว้
+    AlertRule = apps.get_model('sensors', 'AlertRule')
+    seen = set()
+    for rule in AlertRule.objects.filter(device__isnull=True).order_by('-updated_at', '-id'):
+        if rule.sensor_type_id in seen:
+            rule.delete()
+        else:
+            seen.add(rule.sensor_type_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0011_retention_policy_scope_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_global_rules, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alertrule',
+            constraint=models.UniqueConstraint(condition=models.Q(('device__isnull', True)), fields=('sensor_type',), name='unique_global_alert_rule'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import uuid
@@ -15,6 +17,12 @@ class Device(models.Model):
     description = models.TextField(blank=True, verbose_name="คำอธิบาย")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="เจ้าของ")
     is_active = models.BooleanField(default=True, verbose_name="สถานะใช้งาน")
+    heartbeat_interval = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name="ช่วงเวลาส่งข้อมูล (วินาที)",
+        help_text="เว้นว่างเพื่อใช้ค่าเริ่มต้นของระบบ"
+    )
+    last_seen_at = models.DateTimeField(null=True, blank=True, db_index=True,
+                                        verbose_name="ส่งข้อมูลล่าสุด")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่อัปเดต")
     
@@ -63,6 +71,207 @@ class SensorData(models.Model):
         return f"{self.device.name} - {self.sensor_type.name}: {self.value} {self.sensor_type.unit}"
 
 
+class DeviceLatestReading(models.Model):
+    """ค่าล่าสุดของแต่ละเซ็นเซอร์ในอุปกรณ์ (อัปเดตทุกครั้งที่บันทึกข้อมูล)"""
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name="อุปกรณ์")
+    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, verbose_name="ประเภทเซ็นเซอร์")
+    reading_id = models.UUIDField(verbose_name="รหัสข้อมูล")
+    value = models.FloatField(verbose_name="ค่า")
+    timestamp = models.DateTimeField(verbose_name="เวลาที่บันทึก")
+    
+    class Meta:
+        verbose_name = "ค่าล่าสุด"
+        verbose_name_plural = "ค่าล่าสุด"
+        ordering = ['sensor_type__name']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'sensor_type'], name='unique_latest_reading'),
+        ]
+    
+    def __str__(self):
+        return f"{self.device.name} - {self.sensor_type.name}: {self.value} {self.sensor_type.unit}"
+
+
+class SensorRollup(models.Model):
+    """สรุปข้อมูลเซ็นเซอร์ตามช่วงเวลา (อัปเดตทุกครั้งที่บันทึกข้อมูล)"""
+    BUCKETS = [
+        ('1m', '1 นาที'),
+        ('1h', '1 ชั่วโมง'),
+        ('1d', '1 วัน'),
+    ]
+    
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name="อุปกรณ์")
+    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, verbose_name="ประเภทเซ็นเซอร์")
+    bucket = models.CharField(max_length=2, choices=BUCKETS, verbose_name="ช่วงเวลา")
+    bucket_start = models.DateTimeField(verbose_name="เริ่มช่วงเวลา")
+    count = models.PositiveIntegerField(default=0, verbose_name="จำนวนข้อมูล")
+    sum_value = models.FloatField(default=0, verbose_name="ผลรวม")
+    min_value = models.FloatField(verbose_name="ค่าต่ำสุด")
+    max_value = models.FloatField(verbose_name="ค่าสูงสุด")
+    sum_squares = models.FloatField(default=0, verbose_name="ผลรวมกำลังสอง")
+    
+    class Meta:
+        verbose_name = "สรุปข้อมูลเซ็นเซอร์"
+        verbose_name_plural = "สรุปข้อมูลเซ็นเซอร์"
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'sensor_type', 'bucket', 'bucket_start'],
+                name='unique_rollup_bucket'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.device.name} - {self.sensor_type.name} [{self.bucket} {self.bucket_start}]"
+
+
+class SensorDataSegment(models.Model):
+    """ข้อมูลเซ็นเซอร์เก่าหนึ่งวันที่บีบอัดแล้ว (cold storage)"""
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name="อุปกรณ์")
+    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, verbose_name="ประเภทเซ็นเซอร์")
+    day = models.DateField(verbose_name="วันที่")
+    start_time = models.DateTimeField(verbose_name="เวลาแรก")
+    end_time = models.DateTimeField(verbose_name="เวลาสุดท้าย")
+    count = models.PositiveIntegerField(verbose_name="จำนวนข้อมูล")
+    min_value = models.FloatField(verbose_name="ค่าต่ำสุด")
+    max_value = models.FloatField(verbose_name="ค่าสูงสุด")
+    payload = models.BinaryField(verbose_name="ข้อมูลบีบอัด")
+    
+    class Meta:
+        verbose_name = "ข้อมูลเซ็นเซอร์ที่บีบอัด"
+        verbose_name_plural = "ข้อมูลเซ็นเซอร์ที่บีบอัด"
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'sensor_type', 'day'], name='unique_segment_day'),
+        ]
+        indexes = [
+            models.Index(fields=['device', 'sensor_type', '-end_time']),
+        ]
+    
+    def __str__(self):
+        return f"{self.device.name} - {self.sensor_type.name} [{self.day}] {self.count} รายการ"
+
+
+class RetentionPolicy(models.Model):
+    """ระยะเวลาเก็บข้อมูล กำหนดรายอุปกรณ์ รายประเภทเซ็นเซอร์ หรือทั้งระบบ (เว้นว่างทั้งคู่)
+
+    ค่าจำนวนวันที่เว้นว่างหมายถึงเก็บตลอดไป
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, null=True, blank=True,
+                               verbose_name="อุปกรณ์")
+    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, null=True, blank=True,
+                                    verbose_name="ประเภทเซ็นเซอร์")
+    raw_days = models.PositiveIntegerField(null=True, blank=True,
+                                           verbose_name="เก็บข้อมูลดิบ (วัน)")
+    minute_rollup_days = models.PositiveIntegerField(null=True, blank=True,
+                                                     verbose_name="เก็บ rollup รายนาที (วัน)")
+    hour_rollup_days = models.PositiveIntegerField(null=True, blank=True,
+                                                   verbose_name="เก็บ rollup รายชั่วโมง (วัน)")
+    day_rollup_days = models.PositiveIntegerField(null=True, blank=True,
+                                                  verbose_name="เก็บ rollup รายวัน (วัน)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+    
+    class Meta:
+        verbose_name = "นโยบายเก็บข้อมูล"
+        verbose_name_plural = "นโยบายเก็บข้อมูล"
+        ordering = ['device', 'sensor_type']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'sensor_type'], name='unique_retention_scope'),
+            # NULL ไม่ซ้ำกันใน unique index จึงต้องมี constraint แยกสำหรับขอบเขตที่เว้นว่าง
+            models.UniqueConstraint(fields=['device'], condition=Q(sensor_type__isnull=True),
+                                    name='unique_retention_device_scope'),
+            models.UniqueConstraint(Coalesce('sensor_type', Value(0)), condition=Q(device__isnull=True),
+                                    name='unique_retention_global_scope'),
+        ]
+    
+    def __str__(self):
+        device = self.device.name if self.device else "ทุกอุปกรณ์"
+        sensor_type = self.sensor_type.name if self.sensor_type else "ทุกประเภท"
+        raw = f"{self.raw_days} วัน" if self.raw_days is not None else "ตลอดไป"
+        return f"{device} / {sensor_type}: ข้อมูลดิบ {raw}"
+
+
+class AlertRule(models.Model):
+    """เกณฑ์แจ้งเตือนค่าสูง/ต่ำของประเภทเซ็นเซอร์ (ทุกอุปกรณ์ หรือเฉพาะอุปกรณ์)
+
+    แจ้งเตือนเมื่อค่าเกินเกณฑ์ และถือว่ากลับสู่ปกติเมื่อค่ากลับเข้ามาเกินระยะ hysteresis
+    เพื่อไม่ให้แจ้งเตือนซ้ำเมื่อค่าแกว่งอยู่รอบเกณฑ์
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, null=True, blank=True,
+                               verbose_name="อุปกรณ์")
+    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, verbose_name="ประเภทเซ็นเซอร์")
+    high_threshold = models.FloatField(null=True, blank=True, verbose_name="เกณฑ์ค่าสูง")
+    low_threshold = models.FloatField(null=True, blank=True, verbose_name="เกณฑ์ค่าต่ำ")
+    hysteresis = models.FloatField(default=0, verbose_name="ระยะ hysteresis")
+    is_active = models.BooleanField(default=True, verbose_name="สถานะใช้งาน")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="วันที่อัปเดต")
+    
+    class Meta:
+        verbose_name = "เกณฑ์แจ้งเตือน"
+        verbose_name_plural = "เกณฑ์แจ้งเตือน"
+        ordering = ['sensor_type', 'device']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'sensor_type'], name='unique_alert_rule'),
+            # device ที่เป็น NULL ไม่ซ้ำกันใน unique index จึงแยกเกณฑ์ของทุกอุปกรณ์ออกมา
+            models.UniqueConstraint(fields=['sensor_type'], condition=Q(device__isnull=True),
+                                    name='unique_global_alert_rule'),
+        ]
+    
+    def __str__(self):
+        device = self.device.name if self.device else "ทุกอุปกรณ์"
+        return f"{device} - {self.sensor_type.name}: ต่ำ {self.low_threshold} / สูง {self.high_threshold}"
+
+
+class AnomalyState(models.Model):
+    """สถานะของตัวตรวจจับค่าผิดปกติ (EWMA) ของแต่ละเซ็นเซอร์ในอุปกรณ์
+
+    บันทึกไว้เป็นระยะ เพื่อให้เริ่มทำงานต่อได้หลังรีสตาร์ทโดยไม่ต้องอ่านข้อมูลย้อนหลัง
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name="อุปกรณ์")
+    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, verbose_name="ประเภทเซ็นเซอร์")
+    count = models.PositiveIntegerField(default=0, verbose_name="จำนวนข้อมูล")
+    mean = models.FloatField(default=0, verbose_name="ค่าเฉลี่ย (EWMA)")
+    variance = models.FloatField(default=0, verbose_name="ความแปรปรวน (EWMA)")
+    updated_at = models.DateTimeField(verbose_name="วันที่อัปเดต")
+    
+    class Meta:
+        verbose_name = "สถานะตรวจจับค่าผิดปกติ"
+        verbose_name_plural = "สถานะตรวจจับค่าผิดปกติ"
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'sensor_type'], name='unique_anomaly_state'),
+        ]
+    
+    def __str__(self):
+        return f"{self.device.name} - {self.sensor_type.name}: {self.mean:.2f} ± {self.variance ** 0.5:.2f}"
+
+
+class DeviceAPIKey(models.Model):
+    """API key ของอุปกรณ์ (ส่งใน header X-API-Key)
+
+    เก็บเฉพาะ SHA-256 ของคีย์ ตัวคีย์แสดงครั้งเดียวตอนสร้าง
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='api_keys',
+                               verbose_name="อุปกรณ์")
+    name = models.CharField(max_length=100, blank=True, verbose_name="ชื่อคีย์")
+    prefix = models.CharField(max_length=12, verbose_name="ส่วนต้นของคีย์")
+    key_hash = models.CharField(max_length=64, unique=True, verbose_name="ค่าแฮชของคีย์")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+    last_used_at = models.DateTimeField(null=True, blank=True, verbose_name="ใช้งานล่าสุด")
+    revoked_at = models.DateTimeField(null=True, blank=True, verbose_name="วันที่ยกเลิก")
+
+    class Meta:
+        verbose_name = "API key ของอุปกรณ์"
+        verbose_name_plural = "API key ของอุปกรณ์"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.device.name} - {self.prefix}…"
+
+    @property
+    def is_active(self):
+        return self.revoked_at is None
+
+
 class SensorAlert(models.Model):
     """การแจ้งเตือนจากเซ็นเซอร์"""
     ALERT_TYPES = [
@@ -73,11 +282,16 @@ class SensorAlert(models.Model):
     ]
     
     device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name="อุปกรณ์")
-    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, verbose_name="ประเภทเซ็นเซอร์")
+    # ไม่มีประเภทเซ็นเซอร์สำหรับการแจ้งเตือนระดับอุปกรณ์ (เช่น offline)
+    sensor_type = models.ForeignKey(SensorType, on_delete=models.CASCADE, null=True, blank=True,
+                                    verbose_name="ประเภทเซ็นเซอร์")
     alert_type = models.CharField(max_length=20, choices=ALERT_TYPES, verbose_name="ประเภทการแจ้งเตือน")
     message = models.TextField(verbose_name="ข้อความแจ้งเตือน")
     threshold_value = models.FloatField(null=True, blank=True, verbose_name="ค่าขีดจำกัด")
     actual_value = models.FloatField(null=True, blank=True, verbose_name="ค่าจริง")
+    score = models.FloatField(null=True, blank=True, verbose_name="คะแนนความผิดปกติ")
+    occurrences = models.PositiveIntegerField(default=1, verbose_name="จำนวนครั้งที่เกิด")
+    last_triggered_at = models.DateTimeField(null=True, blank=True, verbose_name="เกิดล่าสุด")
     is_resolved = models.BooleanField(default=False, verbose_name="แก้ไขแล้ว")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่แจ้งเตือน")
     resolved_at = models.DateTimeField(null=True, blank=True, verbose_name="วันที่แก้ไข")
@@ -86,6 +300,9 @@ class SensorAlert(models.Model):
         verbose_name = "การแจ้งเตือน"
         verbose_name_plural = "การแจ้งเตือน"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_resolved', 'device', 'sensor_type', 'alert_type']),
+        ]
     
     def __str__(self):
         return f"{self.device.name} - {self.alert_type}: {self.message}"
\ No newline at end of file
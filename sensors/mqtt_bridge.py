@@ -0,0 +1,134 @@
+"""
+แปลงข้อความ MQTT เป็นข้อมูลเซ็นเซอร์ (ใช้โดยคำสั่ง mqtt_ingest)
+
+topic ลงท้ายด้วย ``<device_id>/<sensor>`` (เช่น ``devices/<device_id>/temperature``)
+โดย sensor เป็น id หรือชื่อประเภทเซ็นเซอร์
+payload เป็นตัวเลขล้วน (เช่น ``23.5``) หรือ JSON ``{"value": 23.5, "timestamp": ..., "raw_data": {...}}``
+"""
+import json
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import Device, SensorData, SensorType
+
+
+class InvalidMessage(ValueError):
+    """ข้อความที่แปลงเป็นข้อมูลเซ็นเซอร์ไม่ได้"""
+
+
+def parse_payload(payload):
+    """คืนค่า (value, timestamp หรือ None, raw_data หรือ None)"""
+    try:
+        text = payload.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        raise InvalidMessage('payload ไม่ใช่ UTF-8')
+
+    if not text.startswith('{'):
+        try:
+            value = float(text)
+        except ValueError:
+            value = math.nan
+        if not math.isfinite(value):
+            raise InvalidMessage(f'ค่าไม่ใช่ตัวเลข: {text[:50]!r}')
+        return value, None, None
+
+    try:
+        data = json.loads(text)
+        value = float(data['value'])
+    except (ValueError, KeyError, TypeError):
+        value = math.nan
+    if not math.isfinite(value):
+        raise InvalidMessage('JSON ต้องมี value เป็นตัวเลข')
+
+    timestamp = data.get('timestamp')
+    if timestamp is not None:
+        timestamp = _parse_timestamp(timestamp)
+    return value, timestamp, data.get('raw_data')
+
+
+def _parse_timestamp(value):
+    try:
+        if isinstance(value, (int, float)):
+            # epoch วินาที (หรือมิลลิวินาทีถ้าค่าใหญ่เกิน)
+            if value > 1e11:
+                value /= 1000
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise InvalidMessage(f'timestamp ไม่ถูกต้อง: {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class ReadingResolver:
+    """แปลง (topic, payload) เป็น SensorData ที่ยังไม่บันทึก โดยใช้ cache ของอุปกรณ์และประเภทเซ็นเซอร์
+
+    อุปกรณ์แต่ละตัว (รวมถึงกรณีไม่พบหรือปิดใช้งาน) ถูก query ไม่เกินหนึ่งครั้งต่อ ``ttl`` วินาที
+    ประเภทเซ็นเซอร์โหลดทั้งหมดครั้งเดียว และโหลดใหม่เมื่อพบชื่อที่ไม่รู้จัก (ไม่บ่อยกว่า ``ttl``)
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._sensor_types = None
+        self._sensor_types_loaded_at = 0.0
+
+    def _load_sensor_types(self):
+        sensor_types = {}
+        for sensor_type in SensorType.objects.all():
+            sensor_types[str(sensor_type.id)] = sensor_type
+            sensor_types[sensor_type.name.lower()] = sensor_type
+        self._sensor_types = sensor_types
+        self._sensor_types_loaded_at = time.monotonic()
+
+    def get_device(self, device_id):
+        try:
+            key = uuid.UUID(device_id)
+        except ValueError:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            cached = self._devices.get(key)
+            if cached is None or now - cached[1] >= self.ttl:
+                cached = self._devices[key] = (
+                    Device.objects.filter(id=key, is_active=True).first(), now
+                )
+            return cached[0]
+
+    def get_sensor_type(self, name):
+        key = name.lower()
+        with self._lock:
+            if self._sensor_types is None or (
+                    key not in self._sensor_types
+                    and time.monotonic() - self._sensor_types_loaded_at >= self.ttl):
+                self._load_sensor_types()
+            return self._sensor_types.get(key)
+
+    def resolve(self, topic, payload):
+        parts = topic.strip('/').split('/')
+        if len(parts) < 2:
+            raise InvalidMessage(f'topic ไม่ถูกต้อง: {topic}')
+        device_id, sensor_name = parts[-2:]
+
+        device = self.get_device(device_id)
+        if device is None:
+            raise InvalidMessage(f'ไม่พบอุปกรณ์ {device_id}')
+        sensor_type = self.get_sensor_type(sensor_name)
+        if sensor_type is None:
+            raise InvalidMessage(f'ไม่พบประเภทเซ็นเซอร์ {sensor_name}')
+
+        value, timestamp, raw_data = parse_payload(payload)
+        return SensorData(
+            device=device,
+            sensor_type=sensor_type,
+            value=value,
+            timestamp=timestamp or timezone.now(),
+            raw_data=raw_data,
+        )
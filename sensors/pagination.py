@@ -0,0 +1,135 @@
+"""
+แบ่งหน้าแบบ keyset (cursor) สำหรับ django-ninja
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+
+from django.db.models import Q
+from ninja import Field, Schema
+from ninja.errors import HttpError
+from ninja.pagination import PaginationBase
+
+from .coldstore import cold_page, reading_sort_key
+from .models import SensorDataSegment
+
+
+def encode_cursor(direction, value, pk):
+    """สร้าง cursor แบบทึบ (opaque) จากทิศทางและตำแหน่ง (ค่าที่ใช้เรียง, id)"""
+    payload = json.dumps([direction, value.isoformat(), str(pk)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """แปลง cursor กลับเป็น (ทิศทาง, ค่าที่ใช้เรียง, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, value, pk = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(value), pk
+    except (ValueError, TypeError):
+        raise HttpError(400, "cursor ไม่ถูกต้อง")
+
+
+class KeysetPagination(PaginationBase):
+    """แบ่งหน้าตาม (ordering_field, id) จากใหม่ไปเก่า
+
+    แต่ละหน้าใช้เงื่อนไข WHERE ต่อจากตำแหน่งใน cursor แทน OFFSET
+    จึงใช้เวลาเท่ากันไม่ว่าจะอยู่หน้าที่เท่าไร
+    """
+
+    class Input(Schema):
+        cursor: Optional[str] = None
+        limit: int = Field(100, ge=1, le=1000)
+
+    class Output(Schema):
+        items: List[Any]
+        next: Optional[str]
+        prev: Optional[str]
+
+    def __init__(self, ordering_field='timestamp', **kwargs):
+        super().__init__(**kwargs)
+        self.ordering_field = ordering_field
+
+    def fetch_page(self, queryset, direction, value, pk, size, **params):
+        """ข้อมูลไม่เกิน size รายการถัดจากตำแหน่งใน cursor ตามทิศทาง
+
+        ``next`` เรียงจากใหม่ไปเก่า ส่วน ``prev`` เรียงจากเก่าไปใหม่
+        """
+        field = self.ordering_field
+        if direction == 'next':
+            # หน้าถัดไป: ข้อมูลที่เก่ากว่าตำแหน่งใน cursor
+            queryset = queryset.order_by(f'-{field}', '-id')
+            if value is not None:
+                # เงื่อนไข <= แยกออกมาเพื่อให้ฐานข้อมูลใช้ index เป็นช่วง (range) ได้
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lte': value}),
+                    Q(**{f'{field}__lt': value}) | Q(id__lt=pk)
+                )
+        else:
+            # หน้าก่อนหน้า: ข้อมูลที่ใหม่กว่า อ่านย้อนขึ้น
+            queryset = queryset.order_by(field, 'id').filter(
+                Q(**{f'{field}__gte': value}),
+                Q(**{f'{field}__gt': value}) | Q(id__gt=pk)
+            )
+        return list(queryset[:size])
+
+    def paginate_queryset(self, queryset, pagination, **params):
+        field = self.ordering_field
+        limit = pagination.limit
+
+        if pagination.cursor:
+            direction, value, pk = decode_cursor(pagination.cursor)
+        else:
+            direction, value, pk = 'next', None, None
+
+        # ดึงเกินหนึ่งแถวเพื่อรู้ว่ายังมีหน้าต่อไปหรือไม่
+        items = self.fetch_page(queryset, direction, value, pk, limit + 1, **params)
+        has_more = len(items) > limit
+        items = items[:limit]
+        # หน้าก่อนหน้าอ่านจากเก่าไปใหม่ กลับลำดับให้เหมือนหน้าอื่น
+        if direction == 'prev':
+            items.reverse()
+
+        next_cursor = prev_cursor = None
+        if items:
+            first, last = items[0], items[-1]
+            if direction == 'prev' or has_more:
+                next_cursor = encode_cursor('next', getattr(last, field), last.pk)
+            if (direction == 'next' and value is not None) or (direction == 'prev' and has_more):
+                prev_cursor = encode_cursor('prev', getattr(first, field), first.pk)
+        elif value is not None:
+            # ไม่มีข้อมูลในทิศทางนี้แล้ว ให้ย้อนกลับจากตำแหน่งเดิมได้
+            if direction == 'next':
+                prev_cursor = encode_cursor('prev', value, pk)
+            else:
+                next_cursor = encode_cursor('next', value, pk)
+
+        return {
+            'items': items,
+            'next': next_cursor,
+            'prev': prev_cursor,
+        }
+
+
+class SensorDataPagination(KeysetPagination):
+    """KeysetPagination ของข้อมูลเซ็นเซอร์ที่รวมข้อมูลจาก cold storage ด้วย"""
+
+    def fetch_page(self, queryset, direction, value, pk, size, request=None,
+                   device_id=None, sensor_type_id=None, **params):
+        hot = super().fetch_page(queryset, direction, value, pk, size)
+
+        segments = SensorDataSegment.objects.filter(device__owner=request.user)
+        if device_id:
+            segments = segments.filter(device_id=device_id)
+        if sensor_type_id:
+            segments = segments.filter(sensor_type_id=sensor_type_id)
+
+        # ถ้าข้อมูลปกติเต็มหน้าแล้ว ไม่ต้องแตกก้อนที่อยู่เลยรายการสุดท้ายไป
+        bound = hot[-1].timestamp if len(hot) == size else None
+        cold = cold_page(segments, direction, value, pk, size, bound=bound)
+        if not cold:
+            return hot
+        return sorted(hot + cold, key=reading_sort_key, reverse=direction == 'next')[:size]
@@ -0,0 +1,97 @@
+"""
+บังคับใช้นโยบายเก็บข้อมูล (RetentionPolicy) ด้วยการลบเป็นชุดตาม primary key
+
+ลบทีละชุดเล็ก ๆ ใน transaction ของตัวเอง แล้วพักระหว่างชุด
+เพื่อไม่ให้ถือ lock ของฐานข้อมูลนานจนการบันทึกข้อมูลใหม่ต้องรอ
+"""
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import (
+    DeviceLatestReading, RetentionPolicy, SensorData, SensorDataSegment, SensorRollup
+)
+
+# ฟิลด์ของนโยบาย -> bucket ของ rollup
+ROLLUP_FIELDS = {
+    '1m': 'minute_rollup_days',
+    '1h': 'hour_rollup_days',
+    '1d': 'day_rollup_days',
+}
+
+
+def resolve_policy(policies, device_id, sensor_type_id):
+    """นโยบายที่เจาะจงที่สุดของ (อุปกรณ์, ประเภทเซ็นเซอร์)
+
+    ลำดับ: อุปกรณ์+ประเภท, อุปกรณ์, ประเภท, ทั้งระบบ
+    ``policies`` คือ dict ของ (device_id หรือ None, sensor_type_id หรือ None) -> RetentionPolicy
+    """
+    for key in ((device_id, sensor_type_id), (device_id, None),
+                (None, sensor_type_id), (None, None)):
+        policy = policies.get(key)
+        if policy is not None:
+            return policy
+    return None
+
+
+def retention_targets(now=None, device_id=None):
+    """รายการ (device_id, sensor_type_id, ชื่อ, queryset ที่ต้องลบ) ตามนโยบาย
+
+    ใช้คู่ (อุปกรณ์, ประเภทเซ็นเซอร์) จาก DeviceLatestReading ซึ่งมีครบทุกคู่ที่เคยส่งข้อมูล
+    """
+    now = now or timezone.now()
+    policies = {(p.device_id, p.sensor_type_id): p for p in RetentionPolicy.objects.all()}
+    if not policies:
+        return []
+
+    pairs = DeviceLatestReading.objects.values_list('device_id', 'sensor_type_id')
+    if device_id:
+        pairs = pairs.filter(device_id=device_id)
+
+    targets = []
+    for pair_device_id, sensor_type_id in pairs.order_by('device_id', 'sensor_type_id'):
+        policy = resolve_policy(policies, pair_device_id, sensor_type_id)
+        if policy is None:
+            continue
+        scope = {'device_id': pair_device_id, 'sensor_type_id': sensor_type_id}
+
+        if policy.raw_days is not None:
+            cutoff = now - timedelta(days=policy.raw_days)
+            targets.append((pair_device_id, sensor_type_id, 'raw',
+                            SensorData.objects.filter(timestamp__lt=cutoff, **scope)))
+            # ก้อนใน cold storage ลบได้เมื่อข้อมูลทั้งก้อนเก่ากว่ากำหนด
+            targets.append((pair_device_id, sensor_type_id, 'cold',
+                            SensorDataSegment.objects.filter(end_time__lt=cutoff, **scope)))
+
+        for bucket, field in ROLLUP_FIELDS.items():
+            days = getattr(policy, field)
+            if days is not None:
+                cutoff = now - timedelta(days=days)
+                targets.append((pair_device_id, sensor_type_id, f'rollup {bucket}',
+                                SensorRollup.objects.filter(bucket=bucket, bucket_start__lt=cutoff, **scope)))
+    return targets
+
+
+def delete_in_batches(queryset, batch_size=1000, sleep=0.05, progress=None):
+    """ลบแถวใน queryset ทีละ batch_size แถวตาม primary key แล้วคืนจำนวนที่ลบ
+
+    ``progress`` (ถ้ามี) จะถูกเรียกด้วยจำนวนที่ลบสะสมหลังแต่ละชุด
+    """
+    deleted = 0
+    # ไม่เรียงลำดับ เพื่อให้ฐานข้อมูลหยุดอ่าน index ได้ทันทีเมื่อครบชุด
+    pks = queryset.order_by().values_list('pk', flat=True)
+    while True:
+        batch = list(pks[:batch_size])
+        if not batch:
+            break
+        # แต่ละชุดเป็น transaction สั้น ๆ ของตัวเอง (autocommit)
+        count, _ = queryset.model.objects.filter(pk__in=batch).delete()
+        deleted += count
+        if progress:
+            progress(deleted)
+        if len(batch) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+    return deleted
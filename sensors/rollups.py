@@ -0,0 +1,186 @@
+"""
+สรุปข้อมูลเซ็นเซอร์ตามช่วงเวลา (rollup) แบบ 1 นาที / 1 ชั่วโมง / 1 วัน
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db.models import Max, Min, Q, Sum
+
+from .models import SensorRollup
+from .upsert import bulk_upsert, least_function, greatest_function
+
+BUCKET_SECONDS = {
+    '1m': 60,
+    '1h': 3600,
+    '1d': 86400,
+}
+
+
+def bucket_start(timestamp, bucket):
+    """เวลาเริ่มต้นของ bucket ที่ timestamp อยู่ (อิง UTC)"""
+    size = BUCKET_SECONDS[bucket]
+    epoch = math.floor(timestamp.timestamp() / size) * size
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def aggregate_readings(rows, aggregates=None):
+    """รวม (device_id, sensor_type_id, timestamp, value) เป็นผลรวมรายช่วงเวลา"""
+    if aggregates is None:
+        aggregates = {}
+    for device_id, sensor_type_id, timestamp, value in rows:
+        for bucket in BUCKET_SECONDS:
+            key = (device_id, sensor_type_id, bucket, bucket_start(timestamp, bucket))
+            current = aggregates.get(key)
+            if current is None:
+                aggregates[key] = [1, value, value, value, value * value]
+            else:
+                current[0] += 1
+                current[1] += value
+                current[2] = min(current[2], value)
+                current[3] = max(current[3], value)
+                current[4] += value * value
+    return aggregates
+
+
+def aggregate_series(device_id, sensor_type_id, times, values, aggregates=None):
+    """เหมือน aggregate_readings แต่รับข้อมูลชุดใหญ่ของเซ็นเซอร์เดียวเป็น array
+
+    ``times`` คือ epoch วินาทีที่เรียงจากน้อยไปมาก แต่ละ bucket ถูกรวมด้วย
+    ``numpy.ufunc.reduceat`` แทนการวนทีละแถว
+    """
+    if aggregates is None:
+        aggregates = {}
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(times):
+        return aggregates
+    for bucket, size in BUCKET_SECONDS.items():
+        starts = np.floor(times / size) * size
+        first = np.concatenate(([0], np.flatnonzero(np.diff(starts)) + 1))
+        columns = zip(
+            starts[first].tolist(),
+            np.diff(np.append(first, len(times))).tolist(),
+            np.add.reduceat(values, first).tolist(),
+            np.minimum.reduceat(values, first).tolist(),
+            np.maximum.reduceat(values, first).tolist(),
+            np.add.reduceat(values * values, first).tolist(),
+        )
+        for start, count, total, low, high, squares in columns:
+            key = (device_id, sensor_type_id, bucket, datetime.fromtimestamp(start, tz=dt_timezone.utc))
+            current = aggregates.get(key)
+            if current is None:
+                aggregates[key] = [count, total, low, high, squares]
+            else:
+                current[0] += count
+                current[1] += total
+                current[2] = min(current[2], low)
+                current[3] = max(current[3], high)
+                current[4] += squares
+    return aggregates
+
+
+def write_rollups(aggregates):
+    """บวกผลรวมเข้ากับ rollup ที่มีอยู่ด้วย upsert คำสั่งเดียว"""
+    least, greatest = least_function(), greatest_function()
+    bulk_upsert(
+        SensorRollup,
+        ['device', 'sensor_type', 'bucket', 'bucket_start',
+         'count', 'sum_value', 'min_value', 'max_value', 'sum_squares'],
+        [key + tuple(values) for key, values in aggregates.items()],
+        conflict_fields=['device', 'sensor_type', 'bucket', 'bucket_start'],
+        updates={
+            'count': '{table}."count" + excluded."count"',
+            'sum_value': '{table}."sum_value" + excluded."sum_value"',
+            'min_value': least + '({table}."min_value", excluded."min_value")',
+            'max_value': greatest + '({table}."max_value", excluded."max_value")',
+            'sum_squares': '{table}."sum_squares" + excluded."sum_squares"',
+        }
+    )
+
+
+def update_rollups(readings):
+    """อัปเดต rollup จากข้อมูลเซ็นเซอร์ชุดใหม่"""
+    aggregates = aggregate_readings(
+        (r.device_id, r.sensor_type_id, r.timestamp, r.value) for r in readings
+    )
+    write_rollups(aggregates)
+
+
+def _floor(epoch, size):
+    return epoch // size * size
+
+
+def _ceil(epoch, size):
+    return -(-epoch // size) * size
+
+
+def cover_range(start, end):
+    """แบ่งช่วง [start, end) เป็นช่วงย่อยที่ใช้ bucket ใหญ่ที่สุดเท่าที่ลงขอบพอดี
+
+    ความละเอียดต่ำสุดคือ 1 นาที โดย start ถูกปัดลงและ end ถูกปัดขึ้นเป็นนาที
+    นาทีปัจจุบันที่ยังไม่จบจึงรวมอยู่ด้วย (ช่วงที่ได้อาจกว้างกว่าที่ขอไม่เกินหนึ่งนาทีต่อด้าน)
+    """
+    s = _floor(int(start.timestamp()), 60)
+    e = _ceil(math.ceil(end.timestamp()), 60)
+    hour_s, hour_e = _ceil(s, 3600), _floor(e, 3600)
+    day_s, day_e = _ceil(s, 86400), _floor(e, 86400)
+
+    if day_s < day_e:
+        parts = [('1m', s, hour_s), ('1h', hour_s, day_s), ('1d', day_s, day_e),
+                 ('1h', day_e, hour_e), ('1m', hour_e, e)]
+    elif hour_s < hour_e:
+        parts = [('1m', s, hour_s), ('1h', hour_s, hour_e), ('1m', hour_e, e)]
+    else:
+        parts = [('1m', s, e)]
+
+    return [
+        (bucket,
+         datetime.fromtimestamp(a, tz=dt_timezone.utc),
+         datetime.fromtimestamp(b, tz=dt_timezone.utc))
+        for bucket, a, b in parts if a < b
+    ]
+
+
+def range_stats(device, start, end, sensor_type_id=None):
+    """สถิติของช่วงเวลา [start, end) รายประเภทเซ็นเซอร์ จากตาราง rollup
+
+    ใช้ query เดียว และจำนวนแถวที่อ่านขึ้นกับความยาวช่วงเวลาในหน่วย bucket
+    ไม่ใช่จำนวนข้อมูลดิบ
+    """
+    condition = Q()
+    for bucket, bucket_from, bucket_to in cover_range(start, end):
+        condition |= Q(bucket=bucket, bucket_start__gte=bucket_from, bucket_start__lt=bucket_to)
+    if not condition:
+        return []
+
+    queryset = SensorRollup.objects.filter(condition, device=device)
+    if sensor_type_id:
+        queryset = queryset.filter(sensor_type_id=sensor_type_id)
+
+    rows = queryset.order_by().values(
+        'sensor_type_id', 'sensor_type__name', 'sensor_type__unit'
+    ).annotate(
+        total_count=Sum('count'),
+        total_sum=Sum('sum_value'),
+        total_sum_squares=Sum('sum_squares'),
+        lowest=Min('min_value'),
+        highest=Max('max_value'),
+    )
+
+    stats = []
+    for row in rows:
+        count = row['total_count']
+        mean = row['total_sum'] / count
+        variance = max(row['total_sum_squares'] / count - mean * mean, 0.0)
+        stats.append({
+            'sensor_type_id': row['sensor_type_id'],
+            'sensor_type': row['sensor_type__name'],
+            'unit': row['sensor_type__unit'],
+            'count': count,
+            'min': row['lowest'],
+            'max': row['highest'],
+            'avg': mean,
+            'stddev': math.sqrt(variance),
+        })
+    return stats
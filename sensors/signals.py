@@ -0,0 +1,34 @@
+"""
+signal ของแอป sensors
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .alerts import get_alert_store, get_threshold_index
+from .auth import get_api_key_cache
+from .models import AlertRule, Device, DeviceAPIKey, SensorAlert
+
+
+@receiver([post_save, post_delete], sender=AlertRule)
+def reload_alert_rules(sender, **kwargs):
+    # โหลดเกณฑ์ใหม่ในการตรวจครั้งถัดไป
+    get_threshold_index().invalidate()
+
+
+@receiver(post_save, sender=SensorAlert)
+def forget_resolved_alert(sender, instance, **kwargs):
+    # ผู้ใช้ปิดการแจ้งเตือนเอง ครั้งถัดไปให้สร้างการแจ้งเตือนใหม่แทนการอัปเดตอันเดิม
+    if instance.is_resolved:
+        get_alert_store().forget(instance)
+
+
+@receiver([post_save, post_delete], sender=DeviceAPIKey)
+def invalidate_api_key(sender, instance, **kwargs):
+    # คีย์ที่ถูกยกเลิกหรือลบใช้ไม่ได้ทันทีใน process นี้
+    get_api_key_cache().invalidate(instance.key_hash)
+
+
+@receiver([post_save, post_delete], sender=Device)
+def invalidate_device_keys(sender, instance, **kwargs):
+    # cache เก็บอุปกรณ์ไว้ด้วย (เช่น is_active) ให้โหลดใหม่ทั้งหมด
+    get_api_key_cache().invalidate()
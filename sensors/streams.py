@@ -0,0 +1,160 @@
+"""
+หมายเลขลำดับและข้อความย้อนหลังของข้อมูลเซ็นเซอร์ที่กระจายผ่าน WebSocket
+
+ทุกข้อความของอุปกรณ์หนึ่งได้หมายเลขลำดับ (seq) เพิ่มทีละ 1 และถูกเก็บใน ring buffer
+ขนาดจำกัดต่ออุปกรณ์ client ที่เชื่อมต่อใหม่พร้อม ``last_seq`` จึงได้เฉพาะข้อความที่พลาดไป
+จากหน่วยความจำโดยไม่ต้อง query ฐานข้อมูล ถ้าช่องว่างยาวกว่า buffer หรือ ``epoch``
+ไม่ตรง (process เริ่มใหม่ seq จึงเริ่มนับใหม่) client ต้องใช้ snapshot แทน
+
+StreamBuffer อยู่ในหน่วยความจำของ process ที่กระจายข้อความ ส่วน SQLiteStreamBuffer
+(ใช้เมื่อ channel layer เป็น SQLiteChannelLayer) เก็บในไฟล์เดียวกับ channel layer
+ทุก worker จึงใช้ seq ชุดเดียวกันและต่อ stream ได้ไม่ว่า client จะกลับมาที่ process ใด
+"""
+import threading
+import uuid
+from collections import deque
+from itertools import islice
+
+import msgpack
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .channel_layers import connect, write_transaction
+
+_streams = None
+_streams_lock = threading.Lock()
+
+
+class StreamBuffer:
+    """ข้อความล่าสุดไม่เกิน ``size`` ข้อความต่ออุปกรณ์ พร้อม seq ล่าสุดของแต่ละอุปกรณ์"""
+
+    def __init__(self, size=256):
+        self.size = size
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seqs = {}      # device_id -> seq ล่าสุด
+        self._buffers = {}   # device_id -> deque ของ items ตามลำดับ seq
+        self._lock = threading.Lock()
+
+    def append(self, device_id, make_items):
+        """กำหนด seq ถัดไปของอุปกรณ์ แล้วเก็บ ``make_items(seq)`` คืน (seq, items)
+
+        สร้าง items ภายใต้ lock เพื่อให้ลำดับใน buffer ตรงกับ seq เสมอ
+        """
+        with self._lock:
+            seq = self._seqs.get(device_id, 0) + 1
+            items = make_items(seq)
+            buffer = self._buffers.get(device_id)
+            if buffer is None:
+                buffer = self._buffers[device_id] = deque(maxlen=self.size)
+            buffer.append(items)
+            self._seqs[device_id] = seq
+            return seq, items
+
+    def current(self, device_id):
+        """seq ล่าสุดของอุปกรณ์ (0 คือยังไม่มีข้อความ)"""
+        return self._seqs.get(device_id, 0)
+
+    def since(self, device_id, last_seq):
+        """(seq ล่าสุด, items ของทุกข้อความหลัง ``last_seq`` ตามลำดับ)
+
+        items เป็น None ถ้าข้อความที่พลาดไปไม่อยู่ใน buffer ครบแล้ว หรือ ``last_seq``
+        มากกว่า seq ล่าสุด
+        """
+        with self._lock:
+            current = self._seqs.get(device_id, 0)
+            missed = current - last_seq
+            if missed == 0:
+                return current, []
+            buffer = self._buffers.get(device_id, ())
+            if missed < 0 or missed > len(buffer):
+                return current, None
+            return current, [entry for items in islice(buffer, len(buffer) - missed, None) for entry in items]
+
+
+STREAM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stream_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stream_seqs (device_id TEXT PRIMARY KEY, seq INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stream_messages (
+    device_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    items BLOB NOT NULL,
+    PRIMARY KEY (device_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteStreamBuffer:
+    """StreamBuffer ที่เก็บในไฟล์ SQLite ใช้ร่วมกันทุก process (หนึ่ง connection ต่อ thread)
+
+    items ถูกเก็บเป็น msgpack และอ่านกลับเป็น tuple ``epoch`` อยู่ในไฟล์ จึงคงเดิม
+    ตราบที่ไฟล์ยังอยู่ (seq ก็นับต่อจากเดิม)
+    """
+
+    def __init__(self, path, size=256):
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(STREAM_SCHEMA)
+        with write_transaction(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO stream_meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:12],)
+            )
+        (self.epoch,) = conn.execute("SELECT value FROM stream_meta WHERE key = 'epoch'").fetchone()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def append(self, device_id, make_items):
+        with write_transaction(self._conn()) as conn:
+            row = conn.execute('SELECT seq FROM stream_seqs WHERE device_id = ?', (device_id,)).fetchone()
+            seq = (row[0] if row else 0) + 1
+            items = make_items(seq)
+            conn.execute('INSERT OR REPLACE INTO stream_seqs (device_id, seq) VALUES (?, ?)', (device_id, seq))
+            conn.execute('INSERT INTO stream_messages (device_id, seq, items) VALUES (?, ?, ?)',
+                         (device_id, seq, msgpack.packb(items, use_bin_type=True)))
+            conn.execute('DELETE FROM stream_messages WHERE device_id = ? AND seq <= ?', (device_id, seq - self.size))
+        return seq, items
+
+    def current(self, device_id):
+        row = self._conn().execute('SELECT seq FROM stream_seqs WHERE device_id = ?', (device_id,)).fetchone()
+        return row[0] if row else 0
+
+    def since(self, device_id, last_seq):
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute('SELECT seq FROM stream_seqs WHERE device_id = ?', (device_id,)).fetchone()
+            current = row[0] if row else 0
+            missed = current - last_seq
+            if missed == 0:
+                return current, []
+            if missed < 0 or missed > self.size:
+                return current, None
+            rows = conn.execute(
+                'SELECT items FROM stream_messages WHERE device_id = ? AND seq > ? ORDER BY seq',
+                (device_id, last_seq),
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        if len(rows) != missed:
+            return current, None
+        return current, [entry for (items,) in rows for entry in msgpack.unpackb(items, raw=False, use_list=False)]
+
+
+def get_stream_buffer():
+    """StreamBuffer ของ process นี้ (สร้างเมื่อเรียกครั้งแรก)
+
+    channel layer ที่มี ``stream_buffer(size)`` (เช่น SQLiteChannelLayer) เป็นผู้สร้าง
+    เพื่อให้ seq ใช้ร่วมกันทุก process ที่ใช้ channel layer เดียวกัน
+    """
+    global _streams
+    with _streams_lock:
+        if _streams is None:
+            size = settings.SENSOR_WEBSOCKET['REPLAY_BUFFER']
+            factory = getattr(get_channel_layer(), 'stream_buffer', None)
+            _streams = factory(size) if factory else StreamBuffer(size)
+        return _streams
@@ -0,0 +1,105 @@
+"""
+สร้างข้อมูลเซ็นเซอร์จำลองแบบ time series ด้วย NumPy
+
+ค่าของแต่ละเซ็นเซอร์คือรอบวัน (sine ตามเวลา UTC) + noise + spike เป็นครั้งคราว
+และแต่ละอุปกรณ์มีช่วงที่ขาดการส่งข้อมูล (gap) แบบสุ่ม โมดูลนี้ไม่ใช้ฐานข้อมูล
+จึงเรียกจาก worker process ได้โดยไม่ต้อง setup Django
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+DAY_SECONDS = 86400
+
+
+class Profile(NamedTuple):
+    unit: str
+    description: str
+    base: float
+    amplitude: float   # ขนาดของรอบวัน (ติดลบคือต่ำสุดตอนบ่าย)
+    noise: float       # ส่วนเบี่ยงเบนมาตรฐานของ noise
+    spike: float       # ขนาดของ spike
+    low: float
+    high: float
+    daylight: bool = False  # ค่าเป็น 0 ตอนกลางคืน (เช่น แสง)
+
+
+PROFILES = {
+    'Temperature': Profile('°C', 'อุณหภูมิ', 28, 4, 0.3, 8, -40, 85),
+    'Humidity': Profile('%', 'ความชื้น', 60, -12, 1.5, 20, 0, 100),
+    'Light': Profile('lux', 'ความเข้มแสง', 0, 900, 25, 400, 0, 65535, daylight=True),
+    'Pressure': Profile('hPa', 'ความดันอากาศ', 1010, 1.5, 0.2, 6, 900, 1100),
+    'CO2': Profile('ppm', 'คาร์บอนไดออกไซด์', 550, 150, 20, 600, 400, 5000),
+}
+
+
+def sample_times(start, end, interval, rng, gap_rate=0.0, mean_gap=30, jitter=0.1):
+    """เวลา (epoch วินาที) ทุก ``interval`` วินาทีใน [start, end)
+
+    แต่ละจุดคลาดเคลื่อนไม่เกิน ``jitter`` ของ interval และทุกจุดมีโอกาส ``gap_rate``
+    ที่จะเริ่มช่วงขาดข้อมูลยาวเฉลี่ย ``mean_gap`` จุด
+    """
+    times = np.arange(start, end, interval, dtype=np.float64)
+    if jitter:
+        times += rng.uniform(0, jitter * interval, size=len(times))
+    if gap_rate and len(times):
+        starts = np.flatnonzero(rng.random(len(times)) < gap_rate)
+        ends = np.minimum(starts + rng.geometric(1 / mean_gap, size=len(starts)), len(times))
+        depth = np.zeros(len(times) + 1, dtype=np.int32)
+        np.add.at(depth, starts, 1)
+        np.add.at(depth, ends, -1)
+        times = times[np.cumsum(depth[:-1]) == 0]
+    return times
+
+
+def sample_values(profile, times, rng, spike_rate=0.0, phase=0.0, decimals=2):
+    """ค่าของเซ็นเซอร์ตาม ``profile`` ณ เวลา ``times`` (สูงสุดราวบ่ายสองโมง UTC + ``phase`` ชั่วโมง)"""
+    hours = (times % DAY_SECONDS) / 3600 - phase
+    cycle = np.sin(2 * np.pi * (hours - 8) / 24)
+    noise = rng.normal(0, profile.noise, size=len(times))
+    if profile.daylight:
+        cycle = np.clip(cycle, 0, None)
+        noise[cycle == 0] = 0
+    values = profile.base + profile.amplitude * cycle + noise
+    if spike_rate:
+        spikes = np.flatnonzero(rng.random(len(times)) < spike_rate)
+        values[spikes] += rng.choice([-1, 1], size=len(spikes)) * rng.uniform(0.5, 1, size=len(spikes)) * profile.spike
+    return np.round(np.clip(values, profile.low, profile.high), decimals)
+
+
+def generate_device(seed, sensor_names, start, end, interval, gap_rate=0.0, spike_rate=0.0):
+    """ข้อมูลของอุปกรณ์หนึ่งตัว: (times, {ชื่อเซ็นเซอร์: values})
+
+    ทุกเซ็นเซอร์ของอุปกรณ์ใช้เวลาชุดเดียวกัน (อุปกรณ์ส่งทุกค่าพร้อมกัน)
+    ผลลัพธ์ขึ้นกับ ``seed`` เท่านั้น ไม่ว่าจะสร้างใน process ใด
+    """
+    rng = np.random.default_rng(seed)
+    times = sample_times(start, end, interval, rng, gap_rate=gap_rate)
+    phase = rng.uniform(-1, 1)
+    return times, {
+        name: sample_values(PROFILES[name], times, rng, spike_rate=spike_rate, phase=phase)
+        for name in sensor_names
+    }
+
+
+def device_seeds(seed, count):
+    """seed อิสระของอุปกรณ์ ``count`` ตัวจาก seed หลักเดียว"""
+    return np.random.SeedSequence(seed).spawn(count)
+
+
+def get_or_create_sensor_types(names):
+    """SensorType ตามลำดับ ``names`` สร้างรายการที่ยังไม่มีจาก PROFILES ด้วย query เดียว"""
+    # import ในฟังก์ชัน เพื่อให้ worker process import โมดูลนี้ได้โดยไม่ต้อง setup Django
+    from .models import SensorType
+
+    existing = {sensor_type.name: sensor_type for sensor_type in SensorType.objects.filter(name__in=names)}
+    missing = [name for name in names if name not in existing]
+    if missing:
+        SensorType.objects.bulk_create(
+            [SensorType(name=name, unit=PROFILES[name].unit, description=PROFILES[name].description)
+             for name in missing],
+            ignore_conflicts=True,
+        )
+        existing.update((sensor_type.name, sensor_type)
+                        for sensor_type in SensorType.objects.filter(name__in=missing))
+    return [existing[name] for name in names]
@@ -1,3 +1,1416 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import math
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ninja.errors import HttpError
+import msgpack
+import numpy as np
+
+from . import alerts, anomaly, auth, export, frames, gorilla, heartbeat, streams
+from .alerts import AlertStore, ThresholdIndex, check_readings
+from .anomaly import AnomalyDetector, ewma_scores
+from .auth import DeviceKeyAuth, create_api_key
+from .buffer import OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_REJECT, BufferFull, IngestBuffer
+from .channel_layers import SQLiteChannelLayer
+from .coldstore import compact_day
+from .consumers import MultiplexSensorDataConsumer, SensorDataConsumer
+from .downsample import METHODS as DOWNSAMPLE_METHODS, downsample
+from .heartbeat import HeartbeatTracker, touch_devices
+from .history import SERIES_DTYPE
+from .ingest import reading_messages, save_readings
+from .management.commands.mqtt_ingest import Command as MqttIngestCommand
+from .models import (
+    AlertRule, AnomalyState, Device, DeviceAPIKey, RetentionPolicy, SensorAlert, SensorData, SensorDataSegment,
+    SensorRollup, SensorType,
+)
+from .mqtt_bridge import InvalidMessage, ReadingResolver, parse_payload
+from .pagination import decode_cursor, encode_cursor
+from .rollups import cover_range
+from .streams import SQLiteStreamBuffer
+from .throttle import LatestValueThrottle
+
+
+class IsolatedTestCase(TestCase):
+    """TestCase ที่เริ่มทุกเทสต์ด้วยสถานะระดับ process (cache, alert store, EWMA) ใหม่"""
+
+    def setUp(self):
+        super().setUp()
+        alerts._index = alerts._store = anomaly._detector = auth._cache = streams._streams = None
+        self.addCleanup(self._discard_process_state)
+
+    def _discard_process_state(self):
+        alerts._index = alerts._store = anomaly._detector = auth._cache = streams._streams = None
+
+
+def make_device(username='owner', name='device'):
+    user, _ = get_user_model().objects.get_or_create(username=username, defaults={'email': f'{username}@example.com'})
+    return Device.objects.create(name=name, owner=user)
+
+
+class IngestBufferTests(SimpleTestCase):
+    def make_buffer(self, **kwargs):
+        """บัฟเฟอร์ที่ writer ค้างอยู่ใน flush แรกจนกว่าจะ set ``release``"""
+        self.flushed = []
+        self.release = threading.Event()
+        started = threading.Event()
+
+        def flush(batch):
+            started.set()
+            self.release.wait(5)
+            self.flushed.extend(batch)
+
+        buffer = IngestBuffer(flush, batch_size=1, flush_interval_ms=10, **kwargs)
+        buffer.put('first')
+        started.wait(5)
+        self.addCleanup(buffer.stop)
+        self.addCleanup(self.release.set)
+        return buffer
+
+    def test_put_many_rejects_whole_batch_when_full(self):
+        buffer = self.make_buffer(max_size=3, overflow=OVERFLOW_REJECT)
+        buffer.put_many([1, 2])
+        with self.assertRaises(BufferFull):
+            buffer.put_many([3, 4])
+        self.assertEqual(buffer.get_stats()['depth'], 2)
+        self.assertEqual(buffer.rejected, 2)
+
+        self.release.set()
+        buffer.join()
+        self.assertEqual(self.flushed, ['first', 1, 2])
+
+    def test_put_many_block_times_out_without_partial_enqueue(self):
+        buffer = self.make_buffer(max_size=3, overflow=OVERFLOW_BLOCK, block_timeout_ms=50)
+        buffer.put_many([1, 2])
+        with self.assertRaises(BufferFull):
+            buffer.put_many([3, 4])
+        self.assertEqual(buffer.get_stats()['depth'], 2)
+
+    def test_put_many_block_waits_for_room(self):
+        buffer = self.make_buffer(max_size=3, overflow=OVERFLOW_BLOCK, block_timeout_ms=2000)
+        buffer.put_many([1, 2])
+        threading.Timer(0.05, self.release.set).start()
+        buffer.put_many([3, 4])
+        buffer.join()
+        self.assertEqual(self.flushed, ['first', 1, 2, 3, 4])
+
+    def test_put_many_drop_oldest_makes_room(self):
+        buffer = self.make_buffer(max_size=3, overflow=OVERFLOW_DROP_OLDEST)
+        buffer.put_many([1, 2, 3])
+        buffer.put_many([4, 5])
+        self.assertEqual(buffer.dropped, 2)
+
+        self.release.set()
+        buffer.join()
+        self.assertEqual(self.flushed, ['first', 3, 4, 5])
+
+
+class RollupStatsTests(IsolatedTestCase):
+    def test_cover_range_includes_partial_end_minute(self):
+        start = datetime(2024, 1, 1, 10, 0, 30, tzinfo=dt_timezone.utc)
+        end = datetime(2024, 1, 1, 10, 5, 10, 500000, tzinfo=dt_timezone.utc)
+        self.assertEqual(cover_range(start, end), [
+            ('1m', datetime(2024, 1, 1, 10, 0, tzinfo=dt_timezone.utc),
+             datetime(2024, 1, 1, 10, 6, tzinfo=dt_timezone.utc)),
+        ])
+
+    def test_reading_ingested_now_is_in_stats(self):
+        device = make_device()
+        sensor_type = SensorType.objects.create(name='Temperature', unit='C')
+        _, key = create_api_key(device)
+        for value in (20.0, 22.0):
+            response = self.client.post(
+                '/api/sensor-data',
+                {'device_id': str(device.id), 'sensor_type_id': sensor_type.id, 'value': value},
+                content_type='application/json', HTTP_X_API_KEY=key,
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+
+        self.client.force_login(device.owner)
+        response = self.client.get('/api/sensor-data/stats', {'device_id': str(device.id)})
+        self.assertEqual(response.status_code, 200)
+        [stats] = response.json()
+        self.assertEqual((stats['count'], stats['min'], stats['max'], stats['avg']), (2, 20.0, 22.0, 21.0))
+
+        response = self.client.get(f'/sensors/api/stats/{device.id}/')
+        self.assertEqual(response.json()['Temperature']['count'], 2)
+
+
+class RebuildRollupsTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.sensor_type = SensorType.objects.create(name='Temperature', unit='C')
+        day = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        self.day1, self.day2 = day, day + timedelta(days=1)
+        save_readings([
+            SensorData(device=self.device, sensor_type=self.sensor_type, value=value, timestamp=timestamp)
+            for value, timestamp in [
+                (1.0, self.day1 + timedelta(hours=10)), (2.0, self.day1 + timedelta(hours=10, minutes=30)),
+                (3.0, self.day2), (4.0, self.day2 + timedelta(seconds=20)), (5.0, self.day2 + timedelta(hours=5)),
+            ]
+        ])
+        # ข้อมูลดิบของวันแรกถูกลบตาม RetentionPolicy แล้ว และ rollup ของวันที่สองผิด
+        SensorData.objects.filter(timestamp__lt=self.day2).delete()
+        SensorRollup.objects.filter(bucket='1d', bucket_start=self.day2).update(count=99)
+
+    def daily_counts(self):
+        return dict(SensorRollup.objects.filter(bucket='1d').values_list('bucket_start', 'count'))
+
+    def test_default_keeps_rollups_without_raw_data(self):
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.daily_counts(), {self.day1: 2, self.day2: 3})
+        self.assertEqual(SensorRollup.objects.filter(bucket='1m', bucket_start__lt=self.day2).count(), 2)
+
+    def test_all_rebuilds_from_remaining_data_only(self):
+        call_command('rebuild_rollups', '--all', stdout=StringIO())
+        self.assertEqual(self.daily_counts(), {self.day2: 3})
+
+
+class BatchIngestTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.other_device = make_device(name='other-device')
+        self.temperature = SensorType.objects.create(name='Temperature', unit='C')
+        self.humidity = SensorType.objects.create(name='Humidity', unit='%')
+
+    def post_batch(self, readings):
+        return self.client.post('/api/sensor-data/batch', {'readings': readings}, content_type='application/json')
+
+    def test_accepts_valid_items_and_reports_the_rest(self):
+        readings = [
+            {'device_id': str(self.device.id), 'sensor_type_id': self.temperature.id, 'value': 20.0},
+            {'device_id': str(self.other_device.id), 'sensor_type_id': self.temperature.id, 'value': 21.0},
+            {'device_id': 'not-a-uuid', 'sensor_type_id': self.temperature.id, 'value': 22.0},
+            {'device_id': str(uuid.uuid4()), 'sensor_type_id': self.temperature.id, 'value': 23.0},
+            {'device_id': str(self.device.id), 'sensor_type_id': 9999, 'value': 24.0},
+            {'device_id': str(self.device.id), 'sensor_type_id': self.humidity.id, 'value': 55.0,
+             'timestamp': '2024-01-01T00:00:00Z'},
+        ]
+        with mock.patch.object(get_channel_layer(), 'group_send', new_callable=mock.AsyncMock) as group_send:
+            response = self.post_batch(readings)
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+
+        self.assertEqual([item['index'] for item in body['accepted']], [0, 1, 5])
+        self.assertEqual([item['index'] for item in body['rejected']], [2, 3, 4])
+        self.assertIn('not-a-uuid', body['rejected'][0]['error'])
+        self.assertIn('9999', body['rejected'][2]['error'])
+
+        saved = SensorData.objects.in_bulk([item['id'] for item in body['accepted']])
+        self.assertEqual(SensorData.objects.count(), 3)
+        self.assertEqual(sorted(reading.value for reading in saved.values()), [20.0, 21.0, 55.0])
+        self.assertEqual(saved[uuid.UUID(body['accepted'][2]['id'])].timestamp,
+                         datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+
+        # หนึ่งข้อความต่ออุปกรณ์ ไม่ใช่ต่อรายการ
+        sent = {group: len(event['items']) for (group, event), _ in group_send.call_args_list
+                if event['type'] == 'sensor_data'}
+        self.assertEqual(sent, {f'sensor_data_{self.device.id}': 2, f'sensor_data_{self.other_device.id}': 1})
+
+    @override_settings(SENSOR_BATCH_MAX_SIZE=2)
+    def test_rejects_oversized_batch(self):
+        readings = [{'device_id': str(self.device.id), 'sensor_type_id': self.temperature.id, 'value': value}
+                    for value in range(3)]
+        response = self.post_batch(readings)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(SensorData.objects.exists())
+
+
+class FrameTests(SimpleTestCase):
+    device_id = uuid.uuid4()
+    entries = [(1, -1000, 23.5), (2, 0, 55.0)]
+    base_ms = 1704067200000
+
+    def encodings(self, entries=None, base_ms=None):
+        entries = self.entries if entries is None else entries
+        base_ms = self.base_ms if base_ms is None else base_ms
+        return {
+            'msgpack': (frames.MSGPACK_CONTENT_TYPES[0], frames.encode_msgpack(self.device_id, entries, base_ms)),
+            'struct': (frames.STRUCT_CONTENT_TYPE, frames.encode_struct(self.device_id, entries, base_ms)),
+        }
+
+    def test_round_trip(self):
+        base = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        for name, (content_type, body) in self.encodings().items():
+            with self.subTest(name):
+                frame = frames.decode(body, content_type)
+                self.assertEqual(frame.device_id, self.device_id)
+                self.assertEqual((frame.sensor_type_ids, frame.delta_ms, frame.values), ([1, 2], [-1000, 0], [23.5, 55.0]))
+                self.assertEqual(frame.timestamps(None), [base - timedelta(seconds=1), base])
+
+    def test_zero_base_uses_now(self):
+        now = timezone.now()
+        for name, (content_type, body) in self.encodings(base_ms=0).items():
+            with self.subTest(name):
+                self.assertEqual(frames.decode(body, content_type).timestamps(now),
+                                 [now - timedelta(seconds=1), now])
+
+    def test_rejects_out_of_range_times(self):
+        cases = {
+            'huge base': ([(1, 0, 1.0)], 2 ** 62),
+            'negative base': ([(1, 0, 1.0)], -1),
+            'base + delta past year 9999': ([(1, 2 ** 31 - 1, 1.0)], frames.MAX_TIME_MS),
+            'base + delta before 1970': ([(1, -1000, 1.0)], 500),
+            'huge base without entries': ([], 2 ** 62),
+        }
+        for case, (entries, base_ms) in cases.items():
+            for name, (content_type, body) in self.encodings(entries, base_ms).items():
+                with self.subTest(case, encoding=name), self.assertRaises(frames.FrameError):
+                    frames.decode(body, content_type)
+        # msgpack ไม่จำกัดขนาดของ delta เอง
+        with self.assertRaises(frames.FrameError):
+            frames.decode_msgpack(frames.encode_msgpack(self.device_id, [(1, 2 ** 40, 1.0)]))
+
+    def test_rejects_malformed_struct(self):
+        body = frames.encode_struct(self.device_id, self.entries)
+        for case, malformed in {
+            'short header': body[:frames.HEADER.size - 1],
+            'truncated entries': body[:-1],
+            'trailing bytes': body + b'\x00',
+            'bad magic': b'XX' + body[2:],
+            'bad version': body[:2] + b'\x09' + body[3:],
+        }.items():
+            with self.subTest(case), self.assertRaises(frames.FrameError):
+                frames.decode_struct(malformed)
+
+    def test_rejects_malformed_msgpack(self):
+        for case, malformed in {
+            'not msgpack': b'\xc1',
+            'truncated': frames.encode_msgpack(self.device_id, self.entries)[:-1],
+            'not an array': msgpack.packb({'device_id': 1}),
+            'bad device id': msgpack.packb(['device', 0, []]),
+            'bad entry': msgpack.packb([self.device_id.bytes, 0, [[1, 0]]]),
+            'bool value': msgpack.packb([self.device_id.bytes, 0, [[1, 0, True]]]),
+        }.items():
+            with self.subTest(case), self.assertRaises(frames.FrameError):
+                frames.decode_msgpack(malformed)
+
+
+class FrameEndpointTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.temperature = SensorType.objects.create(name='Temperature', unit='C')
+
+    def post_frame(self, content_type, body):
+        return self.client.post('/api/sensor-data/frame', body, content_type=content_type)
+
+    def frame_bodies(self, entries, base_ms=0):
+        return {
+            'msgpack': (frames.MSGPACK_CONTENT_TYPES[0], frames.encode_msgpack(self.device.id, entries, base_ms)),
+            'struct': (frames.STRUCT_CONTENT_TYPE, frames.encode_struct(self.device.id, entries, base_ms)),
+        }
+
+    def test_saves_known_sensor_types(self):
+        entries = [(self.temperature.id, 0, 21.5), (9999, 0, 1.0)]
+        for name, (content_type, body) in self.frame_bodies(entries, 1704067200000).items():
+            with self.subTest(name), \
+                    mock.patch.object(get_channel_layer(), 'group_send', new_callable=mock.AsyncMock):
+                response = self.post_frame(content_type, body)
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(response.json()['accepted'], 1)
+                self.assertEqual([item['index'] for item in response.json()['rejected']], [1])
+        self.assertEqual(
+            list(SensorData.objects.values_list('value', 'timestamp')),
+            [(21.5, datetime(2024, 1, 1, tzinfo=dt_timezone.utc))] * 2,
+        )
+
+    def test_bad_frames_are_client_errors(self):
+        cases = {f'{name} base_ms=2**62': body
+                 for name, body in self.frame_bodies([(self.temperature.id, 0, 1.0)], 2 ** 62).items()}
+        cases.update({f'{name} overflowing delta': body for name, body in
+                      self.frame_bodies([(self.temperature.id, 2 ** 31 - 1, 1.0)], frames.MAX_TIME_MS).items()})
+        struct_body = frames.encode_struct(self.device.id, [(self.temperature.id, 0, 1.0)])
+        cases['truncated struct'] = (frames.STRUCT_CONTENT_TYPE, struct_body[:-3])
+        cases['bad magic'] = (frames.STRUCT_CONTENT_TYPE, b'XX' + struct_body[2:])
+        for case, (content_type, body) in cases.items():
+            with self.subTest(case):
+                self.assertEqual(self.post_frame(content_type, body).status_code, 400)
+        self.assertEqual(self.post_frame('application/octet-stream', struct_body).status_code, 415)
+        self.assertFalse(SensorData.objects.exists())
+
+
+class MqttBridgeTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.temperature = SensorType.objects.create(name='Temperature', unit='C')
+        self.resolver = ReadingResolver()
+
+    def test_parse_bare_number(self):
+        self.assertEqual(parse_payload(b' 23.5\n'), (23.5, None, None))
+
+    def test_parse_json(self):
+        value, timestamp, raw_data = parse_payload(
+            b'{"value": 21, "timestamp": 1704067200000, "raw_data": {"rssi": -60}}'
+        )
+        self.assertEqual(value, 21.0)
+        self.assertEqual(timestamp, datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(raw_data, {'rssi': -60})
+        self.assertEqual(parse_payload(b'{"value": 1.5, "timestamp": "2024-01-01T00:00:00+00:00"}')[1],
+                         datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+
+    def test_parse_rejects_invalid_payloads(self):
+        for payload in (b'hot', b'nan', b'\xff\xfe', b'{"temp": 1}', b'{"value": "x"}', b'{"value": 1',
+                        b'{"value": 1, "timestamp": "yesterday"}'):
+            with self.subTest(payload=payload), self.assertRaises(InvalidMessage):
+                parse_payload(payload)
+
+    def test_resolve_by_name_or_id(self):
+        for sensor in ('temperature', str(self.temperature.id)):
+            reading = self.resolver.resolve(f'devices/{self.device.id}/{sensor}', b'20')
+            self.assertEqual((reading.device, reading.sensor_type, reading.value),
+                             (self.device, self.temperature, 20.0))
+
+    def test_resolve_rejects_unknown_targets(self):
+        cases = {
+            'devices': 'topic',
+            f'devices/{uuid.uuid4()}/temperature': 'อุปกรณ์',
+            'devices/not-a-uuid/temperature': 'อุปกรณ์',
+            f'devices/{self.device.id}/pressure': 'ประเภทเซ็นเซอร์',
+        }
+        for topic, error in cases.items():
+            with self.subTest(topic=topic), self.assertRaisesMessage(InvalidMessage, error):
+                self.resolver.resolve(topic, b'20')
+
+    def test_ingest_counts_instead_of_raising(self):
+        command = MqttIngestCommand()
+        command.resolver = self.resolver
+        command.buffer = mock.Mock()
+        command.counts = {'received': 0, 'invalid': 0, 'rejected': 0, 'dropped': 0}
+        topic = f'devices/{self.device.id}/temperature'
+
+        command.ingest(topic, b'20')
+        with self.assertLogs('sensors.management.commands.mqtt_ingest', 'WARNING'):
+            command.ingest('devices', b'20')
+        with self.assertLogs('sensors.management.commands.mqtt_ingest', 'ERROR'), \
+                mock.patch.object(Device.objects, 'filter', side_effect=DatabaseError('locked')):
+            command.ingest(f'devices/{uuid.uuid4()}/temperature', b'20')
+        command.buffer.put.side_effect = BufferFull
+        command.ingest(topic, b'21')
+
+        self.assertEqual(command.counts, {'received': 4, 'invalid': 1, 'rejected': 1, 'dropped': 1})
+        self.assertEqual([call.args[0].value for call in command.buffer.put.call_args_list], [20.0, 21.0])
+
+
+class DeviceKeyAuthTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.other_device = make_device(name='other-device')
+        self.temperature = SensorType.objects.create(name='Temperature', unit='C')
+        self.api_key, self.key = create_api_key(self.device)
+        group_send = mock.patch.object(get_channel_layer(), 'group_send', new_callable=mock.AsyncMock)
+        group_send.start()
+        self.addCleanup(group_send.stop)
+
+    def post_reading(self, device=None, key=None):
+        headers = {'HTTP_X_API_KEY': key} if key else {}
+        payload = {'device_id': str((device or self.device).id), 'sensor_type_id': self.temperature.id, 'value': 20.0}
+        return self.client.post('/api/sensor-data', payload, content_type='application/json', **headers)
+
+    def test_valid_key_sets_request_device(self):
+        request = RequestFactory().post('/api/sensor-data')
+        self.assertEqual(DeviceKeyAuth().authenticate(request, self.key), self.device)
+        self.assertEqual(request.device, self.device)
+        # ครั้งถัดไปใช้ cache
+        with self.assertNumQueries(0):
+            DeviceKeyAuth().authenticate(request, self.key)
+
+        self.assertEqual(self.post_reading(key=self.key).status_code, 200)
+        self.assertEqual(SensorData.objects.get().device, self.device)
+        self.api_key.refresh_from_db()
+        self.assertIsNotNone(self.api_key.last_used_at)
+
+    def test_invalid_key_does_not_fall_back_to_legacy(self):
+        self.assertEqual(self.post_reading(key='dk_invalid').status_code, 401)
+        self.assertFalse(SensorData.objects.exists())
+
+    def test_revoked_key_is_rejected_while_cached(self):
+        self.assertEqual(self.post_reading(key=self.key).status_code, 200)
+        call_command('create_device_key', str(self.device.id), revoke=self.api_key.prefix, stdout=StringIO())
+        self.assertEqual(self.post_reading(key=self.key).status_code, 401)
+        self.assertEqual(SensorData.objects.count(), 1)
+
+    def test_inactive_device_is_rejected_while_cached(self):
+        self.assertEqual(self.post_reading(key=self.key).status_code, 200)
+        self.device.is_active = False
+        self.device.save()
+        self.assertEqual(self.post_reading(key=self.key).status_code, 401)
+
+    def test_key_cannot_post_for_another_device(self):
+        self.assertEqual(self.post_reading(self.other_device, key=self.key).status_code, 403)
+        self.assertFalse(SensorData.objects.exists())
+
+    def test_required_rejects_requests_without_key(self):
+        with override_settings(SENSOR_API_KEYS={**settings.SENSOR_API_KEYS, 'REQUIRED': True}):
+            self.assertEqual(self.post_reading().status_code, 401)
+            self.assertEqual(self.post_reading(key=self.key).status_code, 200)
+            # ผู้ใช้ที่เข้าสู่ระบบแล้วยังส่งแบบเดิมได้
+            self.client.force_login(self.device.owner)
+            self.assertEqual(self.post_reading().status_code, 200)
+            self.client.logout()
+        self.assertEqual(self.post_reading().status_code, 200)
+
+    def test_create_device_key_command(self):
+        stdout = StringIO()
+        call_command('create_device_key', str(self.other_device.id), name='firmware', stdout=stdout)
+        key = stdout.getvalue().splitlines()[-1]
+        self.assertEqual(DeviceAPIKey.objects.get(device=self.other_device).name, 'firmware')
+        self.assertEqual(self.post_reading(self.other_device, key=key).status_code, 200)
+
+        for device_id in (str(uuid.uuid4()), 'not-a-uuid'):
+            with self.subTest(device_id), self.assertRaises(CommandError):
+                call_command('create_device_key', device_id, stdout=StringIO())
+
+
+class DownsampleTests(SimpleTestCase):
+    def series(self, n):
+        series = np.zeros(n, dtype=SERIES_DTYPE)
+        series['t'] = np.arange(n) * 10.0
+        series['v'] = np.sin(np.arange(n) / 20)
+        series['v'][n // 3] = 50.0  # ค่ากระโดดที่กราฟต้องไม่หาย
+        return series
+
+    def test_keeps_endpoints_and_peak_within_threshold(self):
+        series = self.series(1000)
+        for method in DOWNSAMPLE_METHODS:
+            for threshold in (3, 4, 50, 999):
+                sampled = downsample(series, threshold, method)
+                self.assertLessEqual(len(sampled), threshold, (method, threshold))
+                self.assertEqual((sampled['t'][0], sampled['t'][-1]), (0.0, 9990.0), (method, threshold))
+                self.assertTrue(np.all(np.diff(sampled['t']) > 0), (method, threshold))
+                if threshold >= 4:
+                    self.assertIn(50.0, sampled['v'], (method, threshold))
+
+    def test_short_series_is_unchanged(self):
+        series = self.series(20)
+        for method in DOWNSAMPLE_METHODS:
+            self.assertIs(downsample(series, 20, method), series)
+
+
+class ExportTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        sensor_type = SensorType.objects.create(name='อุณหภูมิ', unit='°C')
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        save_readings([
+            SensorData(device=self.device, sensor_type=sensor_type, value=20.0 + n,
+                       timestamp=start + timedelta(minutes=n))
+            for n in range(200)
+        ])
+        self.client.force_login(self.device.owner)
+
+    def export(self, **params):
+        response = self.client.get('/api/sensor-data/export', {'device_id': str(self.device.id), **params})
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def expected(self, n):
+        timestamp = datetime(2024, 1, 1, tzinfo=dt_timezone.utc) + timedelta(minutes=n)
+        return [timestamp.isoformat(), str(self.device.id), 'device', 'อุณหภูมิ', '°C', str(20.0 + n)]
+
+    def test_csv(self):
+        response, body = self.export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(body.decode('utf-8').splitlines()))
+        self.assertEqual(rows[0], export.COLUMNS)
+        self.assertEqual(rows[1:], [self.expected(n) for n in range(200)])
+
+    def test_ndjson(self):
+        _, body = self.export(format='ndjson')
+        rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual([[str(row[column]) for column in export.COLUMNS] for row in rows],
+                         [self.expected(n) for n in range(200)])
+
+    def test_gzip_decompresses_to_plain_output(self):
+        _, plain = self.export(format='ndjson')
+        # ก้อนเล็กเพื่อให้มีหลายก้อนที่ flush แยกกัน
+        with mock.patch.object(export, 'CHUNK_BYTES', 500):
+            response, compressed = self.export(format='ndjson', gzip='true')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+
+class RetentionTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.kept_device = make_device(name='kept-device')
+        self.sensor_type = SensorType.objects.create(name='Temperature', unit='C')
+        self.now = timezone.now()
+        save_readings([
+            SensorData(device=device, sensor_type=self.sensor_type, value=1.0, timestamp=self.now - age)
+            for device in (self.device, self.kept_device)
+            for age in (timedelta(days=2), timedelta(hours=1))
+        ])
+
+    def test_deletes_only_rows_older_than_policy(self):
+        RetentionPolicy.objects.create(raw_days=1)
+        RetentionPolicy.objects.create(device=self.kept_device, raw_days=30)
+        rollups = list(SensorRollup.objects.order_by('pk').values_list('pk', 'count'))
+
+        call_command('apply_retention', '--sleep-ms', '0', '--batch-size', '1', stdout=StringIO())
+        remaining = SensorData.objects.values_list('device_id', 'timestamp')
+        self.assertEqual(sorted(remaining), sorted([
+            (self.device.id, self.now - timedelta(hours=1)),
+            (self.kept_device.id, self.now - timedelta(days=2)),
+            (self.kept_device.id, self.now - timedelta(hours=1)),
+        ]))
+        # ไม่มีนโยบาย rollup จึงไม่ลบ rollup
+        self.assertEqual(list(SensorRollup.objects.order_by('pk').values_list('pk', 'count')), rollups)
+
+    def test_dry_run_deletes_nothing(self):
+        RetentionPolicy.objects.create(raw_days=1)
+        call_command('apply_retention', '--dry-run', stdout=StringIO())
+        self.assertEqual(SensorData.objects.count(), 4)
+
+    def test_blank_scopes_are_unique(self):
+        RetentionPolicy.objects.create(raw_days=1)
+        RetentionPolicy.objects.create(sensor_type=self.sensor_type, raw_days=1)
+        RetentionPolicy.objects.create(device=self.device, raw_days=1)
+        for scope in ({}, {'sensor_type': self.sensor_type}, {'device': self.device}):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                RetentionPolicy.objects.create(raw_days=2, **scope)
+
+
+class HeartbeatTrackerTests(SimpleTestCase):
+    def test_offline_after_missed_interval_and_back(self):
+        tracker = HeartbeatTracker(default_interval=60, grace=2.0)
+        tracker.set_interval('fast', 10)
+        tracker.record('fast', 0)
+        tracker.record('slow', 0)
+        self.assertEqual(tracker.expire(19), [])
+        self.assertEqual(tracker.expire(20), ['fast'])
+        # ข้อมูลที่มาก่อนกำหนดเลื่อนกำหนดออกไป
+        self.assertFalse(tracker.record('slow', 100))
+        self.assertEqual(tracker.expire(200), [])
+        self.assertEqual(tracker.expire(220), ['slow'])
+        # แจ้งครั้งเดียวจนกว่าจะกลับมา
+        self.assertEqual(tracker.expire(1000), [])
+        self.assertTrue(tracker.record('fast', 1000))
+        self.assertEqual(tracker.expire(1019), [])
+        self.assertEqual(tracker.expire(1020), ['fast'])
+
+
+class HeartbeatMonitorTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        heartbeat._touched.clear()
+        self.addCleanup(heartbeat._touched.clear)
+        self.device = make_device()
+        Device.objects.filter(pk=self.device.pk).update(
+            heartbeat_interval=60, last_seen_at=timezone.now() - timedelta(minutes=10)
+        )
+
+    def monitor(self):
+        call_command('monitor_heartbeats', '--once', stdout=StringIO(), stderr=StringIO())
+        return list(SensorAlert.objects.filter(device=self.device, alert_type='offline')
+                    .values_list('is_resolved', flat=True))
+
+    def test_device_goes_offline_and_comes_back_on_touch(self):
+        self.assertEqual(self.monitor(), [False])
+        self.assertEqual(self.monitor(), [False])  # ไม่แจ้งซ้ำ
+
+        touch_devices([self.device.id])
+        self.device.refresh_from_db()
+        self.assertGreater(self.device.last_seen_at, timezone.now() - timedelta(seconds=5))
+        self.assertEqual(self.monitor(), [True])
+
+
+class PagingMixin:
+    def walk(self, url, params, direction='next', cursor=None):
+        """หน้าทั้งหมดตามทิศทาง: [(ids ของหน้า, response json), ...]"""
+        pages = []
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200, response.content)
+            body = response.json()
+            pages.append(([item['id'] for item in body['items']], body))
+            cursor = body[direction]
+            if not cursor:
+                return pages
+
+
+class KeysetPaginationTests(PagingMixin, IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.client.force_login(self.device.owner)
+        base = timezone.now().replace(microsecond=0)
+        # เวลาซ้ำกันหลายแถว ลำดับจึงขึ้นกับ id
+        times = [base, base, base - timedelta(seconds=1), base - timedelta(seconds=1),
+                 base - timedelta(seconds=1), base - timedelta(seconds=2), base - timedelta(seconds=3)]
+        for created_at in times:
+            alert = SensorAlert.objects.create(device=self.device, alert_type='high', message='x')
+            SensorAlert.objects.filter(pk=alert.pk).update(created_at=created_at)
+        self.expected = list(SensorAlert.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_cursor_round_trip(self):
+        value = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        cursor = encode_cursor('prev', value, 42)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), ('prev', value, '42'))
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in ['not-a-cursor', encode_cursor('next', timezone.now(), 1)[:-3],
+                       'WyJzaWRld2F5cyIsIjIwMjQtMDEtMDFUMDA6MDA6MDAiLCIxIl0']:  # ทิศทาง "sideways"
+            with self.assertRaises(HttpError):
+                decode_cursor(cursor)
+        response = self.client.get('/api/alerts', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_next_pages_cover_every_row_once_with_ties(self):
+        for limit in (1, 2, 3, 7, 10):
+            pages = self.walk('/api/alerts', {'limit': limit})
+            self.assertEqual([pk for ids, _ in pages for pk in ids], self.expected, limit)
+            self.assertIsNone(pages[0][1]['prev'])
+
+    def test_prev_walks_back_through_the_same_pages(self):
+        forward = self.walk('/api/alerts', {'limit': 2})
+        self.assertEqual(len(forward), 4)
+        backward = self.walk('/api/alerts', {'limit': 2}, direction='prev', cursor=forward[-1][1]['prev'])
+        self.assertEqual([ids for ids, _ in backward], [ids for ids, _ in reversed(forward[:-1])])
+        # หน้าแรกที่ได้จากการย้อนกลับไม่มี prev และ next ของมันพาไปหน้าที่สองเดิม
+        self.assertIsNone(backward[-1][1]['prev'])
+        response = self.client.get('/api/alerts', {'limit': 2, 'cursor': backward[-1][1]['next']})
+        self.assertEqual([item['id'] for item in response.json()['items']], forward[1][0])
+
+    def test_past_the_end_can_go_back(self):
+        last = self.walk('/api/alerts', {'limit': 7})[-1][1]
+        self.assertIsNone(last['next'])
+        response = self.client.get('/api/alerts', {'limit': 7, 'cursor': encode_cursor(
+            'next', SensorAlert.objects.get(pk=self.expected[-1]).created_at, self.expected[-1])})
+        body = response.json()
+        self.assertEqual((body['items'], body['next']), ([], None))
+        response = self.client.get('/api/alerts', {'limit': 7, 'cursor': body['prev']})
+        self.assertEqual([item['id'] for item in response.json()['items']], self.expected[:-1])
+
+
+class GorillaTests(SimpleTestCase):
+    def assertRoundTrip(self, timestamps, values):
+        decoded_timestamps, decoded_values = gorilla.decode(gorilla.encode(timestamps, values))
+        self.assertEqual(decoded_timestamps, timestamps)
+        # เทียบเป็นบิต เพื่อให้ NaN และ -0.0 ตรวจได้
+        pack = struct.Struct('<d').pack
+        self.assertEqual([pack(v) for v in decoded_values], [pack(v) for v in values])
+
+    def test_empty_and_single_point(self):
+        self.assertRoundTrip([], [])
+        self.assertRoundTrip([1_700_000_000_000_000], [21.5])
+
+    def test_special_floats(self):
+        values = [math.nan, math.inf, -math.inf, 0.0, -0.0, 5e-324, 1.7976931348623157e308, math.nan, 1.0]
+        self.assertRoundTrip([i * 1_000_000 for i in range(len(values))], values)
+
+    def test_repeated_values_and_regular_interval(self):
+        timestamps = [1_700_000_000_000_000 + i * 5_000_000 for i in range(1000)]
+        self.assertRoundTrip(timestamps, [20.0] * 500 + [20.5] * 500)
+        # ค่าซ้ำทุกจุดใช้หนึ่งบิตต่อเวลา
+        # (ยกเว้น delta แรก) และหนึ่งบิตต่อค่า
+        self.assertLess(len(gorilla.encode(timestamps, [20.0] * 1000)), gorilla.HEADER.size + 2 * 1000 // 8 + 10)
+
+    def test_large_and_irregular_deltas(self):
+        timestamps = [0, 1, 1, 3, 10 ** 6, 10 ** 6 + 7, 86_400 * 10 ** 6 * 365, 2 ** 62, 2 ** 62 + 1, 2 ** 62 + 1]
+        values = [0.1, -0.1, 1e300, -1e-300, 3.14159, 3.14159, 42.0, -42.0, 0.0, 123456.789]
+        self.assertRoundTrip(timestamps, values)
+
+    def test_every_dod_bucket_boundary(self):
+        timestamps = [0]
+        delta = 0
+        for _, _, nbits in gorilla.DOD_BUCKETS + [gorilla.DOD_FALLBACK[:2] + (40,)]:
+            for dod in (1 << (nbits - 1), -(1 << (nbits - 1)) + 1, (1 << (nbits - 1)) + 1, -(1 << (nbits - 1))):
+                delta += dod
+                timestamps.append(timestamps[-1] + delta)
+        self.assertRoundTrip(timestamps, [float(i) for i in range(len(timestamps))])
+
+
+class ColdStorageTests(PagingMixin, IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.sensor_type = SensorType.objects.create(name='Temperature', unit='C')
+        self.client.force_login(self.device.owner)
+        self.old_day = (timezone.now() - timedelta(days=40)).date()
+        self.old_start = datetime.combine(self.old_day, datetime.min.time(), tzinfo=dt_timezone.utc)
+
+    def add(self, timestamps):
+        SensorData.objects.bulk_create([
+            SensorData(device=self.device, sensor_type=self.sensor_type, value=float(i), timestamp=timestamp)
+            for i, timestamp in enumerate(timestamps)
+        ])
+
+    def compact(self):
+        return compact_day(self.device.id, self.sensor_type.id, self.old_day)
+
+    def test_compact_day_round_trip(self):
+        times = [self.old_start + timedelta(minutes=i) for i in range(10)]
+        self.add(times)
+        moved, size = self.compact()
+        self.assertEqual(moved, 10)
+        self.assertFalse(SensorData.objects.exists())
+        segment = SensorDataSegment.objects.get()
+        self.assertEqual((segment.count, segment.start_time, segment.end_time), (10, times[0], times[-1]))
+        self.assertEqual(self.compact(), (0, 0))
+
+    def test_paging_across_hot_cold_boundary(self):
+        now = timezone.now().replace(microsecond=0)
+        old = [self.old_start + timedelta(hours=1, seconds=i // 2) for i in range(7)]  # เวลาซ้ำกันเป็นคู่
+        self.add(old)
+        self.compact()
+        self.add([now - timedelta(seconds=i // 2) for i in range(6)])
+
+        params = {'device_id': str(self.device.id), 'limit': 4}
+        forward = self.walk('/api/sensor-data', params)
+        ids = [pk for page, _ in forward for pk in page]
+        timestamps = [item['timestamp'] for _, body in forward for item in body['items']]
+        self.assertEqual(len(ids), 13)
+        self.assertEqual(len(set(ids)), 13)
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        # หน้าที่สองมีทั้งข้อมูลปกติและข้อมูลจาก cold storage
+        self.assertEqual(len(forward[1][0]), 4)
+
+        backward = self.walk('/api/sensor-data', params, direction='prev', cursor=forward[-1][1]['prev'])
+        self.assertEqual([page for page, _ in backward], [page for page, _ in reversed(forward[:-1])])
+
+    def test_cold_ids_survive_recompaction(self):
+        first = self.old_start + timedelta(hours=1)
+        self.add([first, first + timedelta(minutes=1), first + timedelta(minutes=1)])
+        self.compact()
+        params = {'device_id': str(self.device.id), 'limit': 10}
+        before = self.walk('/api/sensor-data', params)[0][1]['items']
+        cursor = self.walk('/api/sensor-data', {**params, 'limit': 1})[0][1]['next']
+
+        # ข้อมูลที่มาช้า ทั้งก่อน ระหว่าง และเวลาเดียวกับจุดเดิม
+        self.add([first - timedelta(minutes=5), first + timedelta(seconds=30), first + timedelta(minutes=1)])
+        self.compact()
+        after = self.walk('/api/sensor-data', params)[0][1]['items']
+        self.assertEqual(len(after), 6)
+        after_by_id = {item['id']: item for item in after}
+        for item in before:
+            self.assertEqual(after_by_id[item['id']], item)
+
+        # cursor เดิมยังต่อจากจุดเดิม (จุดใหม่ที่เวลาเท่ากันเรียงตาม id จึงอยู่ได้ทั้งสองฝั่ง)
+        after_ids = [item['id'] for item in after]
+        response = self.client.get('/api/sensor-data', {**params, 'cursor': cursor})
+        self.assertEqual([item['id'] for item in response.json()['items']],
+                         after_ids[after_ids.index(before[0]['id']) + 1:])
+
+
+class ThresholdIndexTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.other_device = make_device(name='other-device')
+        self.sensor_type = SensorType.objects.create(name='Temperature', unit='C')
+        AlertRule.objects.create(sensor_type=self.sensor_type, high_threshold=30.0, low_threshold=10.0, hysteresis=2.0)
+        AlertRule.objects.create(device=self.device, sensor_type=self.sensor_type, high_threshold=40.0)
+        self.index = ThresholdIndex(ttl=3600)
+        self.now = timezone.now()
+
+    def reading(self, value, seconds=0, device=None):
+        return SensorData(device=device or self.other_device, sensor_type=self.sensor_type, value=value,
+                          timestamp=self.now + timedelta(seconds=seconds))
+
+    def evaluate(self, *values):
+        triggered, cleared = self.index.evaluate([self.reading(value, n) for n, value in enumerate(values)])
+        return [alert.alert_type for alert in triggered], [key[2] for key in cleared]
+
+    def test_hysteresis(self):
+        self.assertEqual(self.evaluate(31.0), (['high'], []))
+        # กลับมาต่ำกว่าเกณฑ์แต่ยังอยู่ในระยะ hysteresis: ยังแจ้งเตือนอยู่ และไม่แจ้งซ้ำเมื่อเกินอีก
+        self.assertEqual(self.evaluate(29.0, 31.0, 28.5), ([], []))
+        self.assertEqual(self.evaluate(27.9), ([], ['high']))
+        self.assertEqual(self.evaluate(9.0, 11.0), (['low'], []))
+        self.assertEqual(self.evaluate(12.5), ([], ['low']))
+
+    def test_device_rule_overrides_global_rule(self):
+        triggered, _ = self.index.evaluate([self.reading(35.0, device=self.device), self.reading(35.0)])
+        self.assertEqual([alert.device_id for alert in triggered], [self.other_device.id])
+        # เกณฑ์ของอุปกรณ์ไม่มีค่าต่ำ จึงไม่ใช้ค่าต่ำของเกณฑ์ทั่วไป
+        self.assertEqual(self.index.evaluate([self.reading(5.0, device=self.device)]), ([], []))
+
+    def test_breach_and_recovery_in_one_batch_is_saved_resolved(self):
+        recovered_at = self.now + timedelta(seconds=1)
+        # ตรวจตามลำดับเวลา ไม่ใช่ตามลำดับในชุด
+        check_readings([self.reading(20.0, 1), self.reading(35.0, 0)])
+        alert = SensorAlert.objects.get()
+        self.assertEqual((alert.alert_type, alert.is_resolved, alert.resolved_at), ('high', True, recovered_at))
+        # ไม่ได้เปิดค้างไว้ ค่าที่เกินครั้งถัดไปจึงแจ้งเตือนได้
+        self.assertFalse(alerts.get_threshold_index()._firing)
+
+    def test_one_global_rule_per_sensor_type(self):
+        with self.assertRaises(IntegrityError):
+            AlertRule.objects.create(sensor_type=self.sensor_type, high_threshold=50.0)
+
+
+class AlertStoreTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.sensor_type = SensorType.objects.create(name='Temperature', unit='C')
+        self.store = AlertStore(cooldown=300, flush_seconds=3600)
+        self.now = timezone.now()
+        self.key = (self.device.id, self.sensor_type.id, 'high')
+
+    def candidate(self, value=50.0, sensor_type=None, **kwargs):
+        return SensorAlert(device=self.device, sensor_type=sensor_type or self.sensor_type, alert_type='high',
+                           message='สูงเกิน', actual_value=value, **kwargs)
+
+    def at(self, seconds):
+        return self.now + timedelta(seconds=seconds)
+
+    def test_repeats_are_merged_into_open_alert(self):
+        [first] = self.store.submit([self.candidate(50.0)], now=self.at(0))
+        self.assertEqual(self.store.submit([self.candidate(51.0)], now=self.at(1)), [])
+        self.assertEqual(self.store.submit([self.candidate(52.0), self.candidate(53.0)], now=self.at(2)), [])
+
+        alert = SensorAlert.objects.get()
+        self.assertEqual(alert.pk, first.pk)
+        # การเพิ่มจำนวนครั้งยังไม่ถูกเขียนจนกว่าจะ flush
+        self.assertEqual((alert.occurrences, alert.actual_value), (1, 50.0))
+        self.store.flush(force=True)
+        alert.refresh_from_db()
+        self.assertEqual((alert.occurrences, alert.actual_value, alert.last_triggered_at), (4, 53.0, self.at(2)))
+
+    def test_dirty_alerts_are_flushed_in_one_bulk_update(self):
+        others = [SensorType.objects.create(name=f'S{i}', unit='u') for i in range(3)]
+        self.store.submit([self.candidate(sensor_type=sensor_type) for sensor_type in others], now=self.at(0))
+        self.store.submit([self.candidate(60.0, sensor_type=sensor_type) for sensor_type in others], now=self.at(1))
+        self.assertEqual(len(self.store._dirty), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.store.flush(force=True)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.store._dirty, {})
+        self.assertEqual(set(SensorAlert.objects.values_list('occurrences', 'actual_value')), {(2, 60.0)})
+
+        with self.assertNumQueries(0):
+            self.store.flush(force=True)
+
+    def test_reopens_within_cooldown(self):
+        [first] = self.store.submit([self.candidate()], now=self.at(0))
+        self.store.resolve([self.key], now=self.at(10))
+        first.refresh_from_db()
+        self.assertTrue(first.is_resolved)
+
+        [reopened] = self.store.submit([self.candidate(70.0)], now=self.at(100))
+        self.assertEqual(reopened.pk, first.pk)
+        alert = SensorAlert.objects.get()
+        self.assertEqual((alert.is_resolved, alert.resolved_at, alert.occurrences, alert.actual_value),
+                         (False, None, 2, 70.0))
+
+    def test_new_alert_after_cooldown(self):
+        [first] = self.store.submit([self.candidate()], now=self.at(0))
+        self.store.resolve([self.key], now=self.at(10))
+        [second] = self.store.submit([self.candidate()], now=self.at(10 + 300))
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(
+            list(SensorAlert.objects.order_by('created_at', 'id').values_list('is_resolved', flat=True)),
+            [True, False],
+        )
+
+    def test_alert_resolved_in_same_batch_can_reopen(self):
+        resolved = self.candidate(is_resolved=True, resolved_at=self.at(1))
+        self.assertEqual(self.store.submit([resolved], now=self.at(0)), [resolved])
+        [reopened] = self.store.submit([self.candidate()], now=self.at(5))
+        self.assertEqual(reopened.pk, resolved.pk)
+        self.assertFalse(SensorAlert.objects.get().is_resolved)
+
+    def test_resolve_closes_alert_opened_by_another_process(self):
+        self.store.submit([], now=self.at(0))  # โหลดสถานะก่อนที่ process อื่นจะเปิดการแจ้งเตือน
+        other = SensorAlert.objects.create(device=self.device, sensor_type=self.sensor_type,
+                                           alert_type='high', message='x')
+        self.store.resolve([self.key], now=self.at(5))
+        other.refresh_from_db()
+        self.assertEqual((other.is_resolved, other.resolved_at), (True, self.at(5)))
+
+    def test_forget_drops_pending_update(self):
+        [alert] = self.store.submit([self.candidate()], now=self.at(0))
+        self.store.submit([self.candidate()], now=self.at(1))
+        SensorAlert.objects.filter(pk=alert.pk).update(is_resolved=True)
+        self.store.forget(alert)
+        self.store.flush(force=True)
+        alert.refresh_from_db()
+        self.assertEqual((alert.is_resolved, alert.occurrences), (True, 1))
+        # เกิดอีกครั้งหลังผู้ใช้ปิด: สร้างการแจ้งเตือนใหม่
+        [new] = self.store.submit([self.candidate()], now=self.at(2))
+        self.assertNotEqual(new.pk, alert.pk)
+
+
+class AnomalyTests(IsolatedTestCase):
+    @staticmethod
+    def reference_scores(values, alpha, warmup):
+        """EWMA แบบวนทีละค่าตามสูตรใน AnomalyDetector.update"""
+        scores = [math.nan]
+        mean, variance = values[0], 0.0
+        for count, value in enumerate(values[1:], 1):
+            scores.append((value - mean) / math.sqrt(variance) if count >= warmup and variance > 0 else math.nan)
+            diff = value - mean
+            increment = alpha * diff
+            mean += increment
+            variance = (1 - alpha) * (variance + diff * increment)
+        return scores
+
+    def test_ewma_scores_match_loop(self):
+        values = 20 + np.sin(np.arange(3000) / 7) + np.random.default_rng(1).normal(0, 0.3, 3000)
+        values[1500] = 40.0
+        # alpha 0.3 ทำให้ _linear_recurrence คำนวณหลายช่วง
+        for alpha in (0.05, 0.3):
+            expected = self.reference_scores(values.tolist(), alpha, warmup=30)
+            np.testing.assert_allclose(ewma_scores(values, alpha=alpha, warmup=30), expected, rtol=1e-7)
+
+            detector = AnomalyDetector(alpha=alpha, warmup=30)
+            detector._states = {}
+            scores = [detector.update('key', value) for value in values.tolist()]
+            np.testing.assert_allclose([math.nan if s is None else s for s in scores], expected, rtol=1e-9)
+
+    def test_checkpoint_restores_state(self):
+        device = make_device()
+        sensor_type = SensorType.objects.create(name='Temperature', unit='C')
+        now = timezone.now()
+        readings = [
+            SensorData(device=device, sensor_type=sensor_type, value=20.0 + (n % 3),
+                       timestamp=now + timedelta(seconds=n))
+            for n in range(10)
+        ]
+        detector = AnomalyDetector(alpha=0.2, threshold=3.0, warmup=5, checkpoint_seconds=3600)
+        detector.evaluate(readings)
+        detector.checkpoint()
+
+        state = AnomalyState.objects.get()
+        key = (device.id, sensor_type.id)
+        self.assertEqual([state.count, state.mean, state.variance], detector._states[key])
+
+        restored = AnomalyDetector(alpha=0.2, threshold=3.0, warmup=5, checkpoint_seconds=3600)
+        spike = SensorData(device=device, sensor_type=sensor_type, value=30.0, timestamp=now + timedelta(minutes=1))
+        anomalies = detector.evaluate([spike])
+        self.assertEqual(len(anomalies), 1)
+        self.assertEqual(restored.evaluate([spike]), anomalies)
+        self.assertEqual(restored._states, detector._states)
+
+    def test_exit_checkpoint_ignores_database_errors(self):
+        detector = anomaly.get_anomaly_detector()
+        with mock.patch.object(detector, 'checkpoint', side_effect=DatabaseError('no such table')):
+            anomaly._checkpoint_at_exit()
+
+
+class ConsumerTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = make_device()
+        self.other_device = make_device('other', 'other-device')
+        self.user = self.device.owner
+        self.temperature = SensorType.objects.create(name='Temperature', unit='C')
+
+    def communicator(self, consumer, user, device_id=None, query_string=b'', subprotocols=()):
+        path = f'/ws/sensor-data/{device_id}/' if device_id else '/ws/sensor-data/'
+        kwargs = {'device_id': device_id} if device_id else {}
+        return ApplicationCommunicator(consumer.as_asgi(), {
+            'type': 'websocket', 'path': path, 'headers': [], 'query_string': query_string,
+            'subprotocols': list(subprotocols), 'user': user, 'url_route': {'args': (), 'kwargs': kwargs},
+        })
+
+    def publish(self, device, *values):
+        """เก็บหนึ่งข้อความต่อค่าใน StreamBuffer (seq เพิ่มทีละ 1) เหมือนที่ broadcast_readings ทำ"""
+        for value in values:
+            reading_messages([SensorData(device=device, sensor_type=self.temperature, value=value,
+                                         timestamp=timezone.now())])
+
+    async def connect(self, communicator):
+        await communicator.send_input({'type': 'websocket.connect'})
+        return (await communicator.receive_output(2))['type']
+
+    async def exchange(self, communicator, text):
+        await communicator.send_input({'type': 'websocket.receive', 'text': text})
+        return json.loads((await communicator.receive_output(2))['text'])
+
+    async def disconnect(self, communicator):
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(2)
+
+    def test_multiplex_rejects_anonymous(self):
+        communicator = self.communicator(MultiplexSensorDataConsumer, AnonymousUser())
+        self.assertEqual(async_to_sync(self.connect)(communicator), 'websocket.close')
+
+    def test_multiplex_subscribes_only_own_devices(self):
+        unknown = str(uuid.uuid4())
+
+        async def run():
+            communicator = self.communicator(MultiplexSensorDataConsumer, self.user)
+            self.assertEqual(await self.connect(communicator), 'websocket.accept')
+            reply = await self.exchange(communicator, json.dumps({
+                'type': 'subscribe', 'devices': [str(self.device.id), str(self.other_device.id), unknown],
+            }))
+            await self.disconnect(communicator)
+            return reply
+
+        reply = async_to_sync(run)()
+        self.assertEqual(reply['devices'], [str(self.device.id)])
+        self.assertEqual(reply['rejected'], [str(self.other_device.id), unknown])
+
+    def test_single_device_requires_owner(self):
+        for user, device_id in [(AnonymousUser(), str(self.device.id)), (self.user, str(self.other_device.id)),
+                                (self.user, 'not-a-uuid')]:
+            communicator = self.communicator(SensorDataConsumer, user, device_id)
+            self.assertEqual(async_to_sync(self.connect)(communicator), 'websocket.close')
+
+    def test_malformed_message_gets_error(self):
+        async def run(consumer, device_id=None):
+            communicator = self.communicator(consumer, self.user, device_id)
+            self.assertEqual(await self.connect(communicator), 'websocket.accept')
+            if device_id:
+                await communicator.receive_output(2)  # latest_data ตอนเชื่อมต่อ
+            replies = [await self.exchange(communicator, text) for text in ['{not json', '{"type": "ping"}']]
+            await self.disconnect(communicator)
+            return [reply['type'] for reply in replies]
+
+        self.assertEqual(async_to_sync(run)(SensorDataConsumer, str(self.device.id)), ['error', 'pong'])
+        self.assertEqual(async_to_sync(run)(MultiplexSensorDataConsumer), ['error', 'pong'])
+
+    @override_settings(SENSOR_WEBSOCKET={**settings.SENSOR_WEBSOCKET, 'REPLAY_BUFFER': 3})
+    def test_single_device_resume(self):
+        self.publish(self.device, 1.0, 2.0, 3.0, 4.0, 5.0)
+        epoch = streams.get_stream_buffer().epoch
+
+        async def run(query):
+            communicator = self.communicator(SensorDataConsumer, self.user, str(self.device.id),
+                                             query_string=query.encode())
+            self.assertEqual(await self.connect(communicator), 'websocket.accept')
+            message = json.loads((await communicator.receive_output(2))['text'])
+            await self.disconnect(communicator)
+            return message
+
+        # seq 4 และ 5 ยังอยู่ใน buffer
+        message = async_to_sync(run)(f'epoch={epoch}&last_seq=3')
+        self.assertEqual((message['type'], message['epoch'], message['seq']), ('replay', epoch, 5))
+        self.assertEqual([(item['seq'], item['value']) for item in message['data']], [(4, 4.0), (5, 5.0)])
+        self.assertEqual(async_to_sync(run)(f'epoch={epoch}&last_seq=5')['data'], [])
+
+        for query in (f'epoch={epoch}&last_seq=1', f'epoch={epoch}&last_seq=9', 'epoch=other&last_seq=3',
+                      'last_seq=3', f'epoch={epoch}&last_seq=x'):
+            with self.subTest(query):
+                message = async_to_sync(run)(query)
+                self.assertEqual((message['type'], message['epoch'], message['seq']), ('latest_data', epoch, 5))
+
+    def test_binary_subprotocol(self):
+        humidity = SensorType.objects.create(name='Humidity', unit='%')
+        self.publish(self.device, 1.0, 2.0)
+        epoch = streams.get_stream_buffer().epoch
+        device_id = str(self.device.id)
+        live = [SensorData(device=self.device, sensor_type=sensor_type, value=value,
+                           timestamp=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+                for sensor_type, value in [(self.temperature, 3.0), (humidity, 55.0)]]
+
+        async def run():
+            communicator = self.communicator(SensorDataConsumer, self.user, device_id,
+                                             query_string=f'epoch={epoch}&last_seq=1'.encode(),
+                                             subprotocols=['sensor.msgpack.v1', 'other'])
+            await communicator.send_input({'type': 'websocket.connect'})
+            accept = await communicator.receive_output(2)
+
+            async def receive():
+                output = await communicator.receive_output(2)
+                self.assertNotIn('text', output)
+                return msgpack.unpackb(output['bytes'], raw=False)
+
+            messages = [await receive(), await receive()]
+            for group, event in reading_messages(live):
+                await get_channel_layer().group_send(group, event)
+            messages += [await receive(), await receive()]
+            await communicator.send_input({'type': 'websocket.receive', 'bytes': msgpack.packb({'type': 'ping'})})
+            messages.append(await receive())
+            await self.disconnect(communicator)
+            return accept, messages
+
+        accept, (declared, replay, declared_live, frame, pong) = async_to_sync(run)()
+        self.assertEqual((accept['type'], accept['subprotocol']), ('websocket.accept', 'sensor.msgpack.v1'))
+
+        # stream_id ประกาศครั้งเดียวต่อ (อุปกรณ์, ประเภทเซ็นเซอร์) ในการเชื่อมต่อนี้
+        self.assertEqual(declared, {'type': 'streams', 'data': [[1, device_id, 'device', self.temperature.id,
+                                                                'Temperature', 'C']]})
+        self.assertEqual((replay['type'], replay['epoch'], replay['seq']), ('replay', epoch, 2))
+        self.assertEqual([(row[0], row[2], row[3]) for row in replay['data']], [(1, 2.0, 2)])
+        self.assertEqual(declared_live['data'], [[2, device_id, 'device', humidity.id, 'Humidity', '%']])
+
+        epoch_ms = int(datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp() * 1000)
+        self.assertEqual(frame, [[1, epoch_ms, 3.0, 3], [2, epoch_ms, 55.0, 3]])
+        stream_ids = {row[0]: (row[1], row[3]) for row in declared['data'] + declared_live['data']}
+        self.assertEqual({stream_ids[row[0]]: row[2] for row in frame},
+                         {(device_id, self.temperature.id): 3.0, (device_id, humidity.id): 55.0})
+        self.assertEqual(pong['type'], 'pong')
+
+    @override_settings(SENSOR_WEBSOCKET={**settings.SENSOR_WEBSOCKET, 'REPLAY_BUFFER': 3})
+    def test_multiplex_resume(self):
+        second = make_device(name='second-device')
+        self.publish(self.device, 1.0, 2.0, 3.0)
+        self.publish(second, 1.0, 2.0, 3.0, 4.0, 5.0)
+        epoch = streams.get_stream_buffer().epoch
+        devices = [str(self.device.id), str(second.id)]
+
+        async def run(subscribe, count):
+            """ข้อความ count ข้อความที่ตามหลัง subscribed ตามประเภท"""
+            communicator = self.communicator(MultiplexSensorDataConsumer, self.user)
+            self.assertEqual(await self.connect(communicator), 'websocket.accept')
+            await self.exchange(communicator, json.dumps({'type': 'subscribe', 'devices': devices, **subscribe}))
+            replies = [json.loads((await communicator.receive_output(2))['text']) for _ in range(count)]
+            self.assertTrue(await communicator.receive_nothing())
+            await self.disconnect(communicator)
+            return {reply['type']: reply for reply in replies}
+
+        # อุปกรณ์แรกต่อจาก seq 2 ได้ ส่วนอุปกรณ์ที่สองพลาด seq 2 ที่ถูกดันออกจาก buffer แล้ว
+        replies = async_to_sync(run)({'epoch': epoch, 'last_seq': dict(zip(devices, [2, 1]))}, 2)
+        self.assertEqual(replies['replay']['seq'], {devices[0]: 3})
+        self.assertEqual([(item['device_id'], item['seq']) for item in replies['replay']['data']], [(devices[0], 3)])
+        self.assertEqual(replies['latest_data']['seq'], {devices[1]: 5})
+
+        replies = async_to_sync(run)({'epoch': 'other', 'last_seq': dict(zip(devices, [2, 4]))}, 1)
+        self.assertEqual(replies['latest_data']['seq'], dict(zip(devices, [3, 5])))
+
+
+class LatestValueThrottleTests(SimpleTestCase):
+    def run_throttle(self, scenario, send=None, **kwargs):
+        """รัน scenario(throttle) ใน event loop เดียว แล้วคืนข้อความที่ส่ง"""
+        sent = []
+
+        async def send_func(entries):
+            if send is not None:
+                await send(entries)
+            sent.append(entries)
+
+        async def run():
+            throttle = LatestValueThrottle(send_func, **kwargs)
+            await scenario(throttle)
+            while throttle._task is not None:
+                await asyncio.sleep(0)
+            return throttle
+
+        return async_to_sync(run)(), sent
+
+    def test_coalesces_by_device_and_sensor_type(self):
+        async def scenario(throttle):
+            throttle.add([('a', 1, 10.0), ('a', 2, 20.0), ('b', 1, 30.0), ('a', 1, 11.0), ('a', 1, 12.0)])
+
+        throttle, sent = self.run_throttle(scenario, max_rate=0)
+        self.assertEqual(sent, [[('a', 2, 20.0), ('b', 1, 30.0), ('a', 1, 12.0)]])
+        self.assertEqual(throttle.stats(), {'received': 5, 'merged': 2, 'dropped': 0, 'failed': 0, 'pending': 0,
+                                            'sent_items': 3, 'sent_messages': 1})
+
+    def test_merges_while_sending(self):
+        release = asyncio.Event()
+
+        async def send(entries):
+            await release.wait()
+
+        async def scenario(throttle):
+            throttle.add([('a', 1, 1.0)])
+            await asyncio.sleep(0)
+            # ระหว่างรอ client ค่าใหม่ของเซ็นเซอร์เดียวกันแทนที่กันเอง
+            throttle.add([('a', 1, 2.0), ('a', 1, 3.0), ('b', 1, 4.0)])
+            release.set()
+
+        throttle, sent = self.run_throttle(scenario, send=send, max_rate=0)
+        self.assertEqual(sent, [[('a', 1, 1.0)], [('a', 1, 3.0), ('b', 1, 4.0)]])
+        self.assertEqual((throttle.merged, throttle.sent_messages), (1, 2))
+
+    def test_drops_oldest_sensor_when_full(self):
+        async def scenario(throttle):
+            throttle.add([('a', 1, 1.0), ('a', 2, 2.0), ('a', 1, 3.0), ('b', 1, 4.0)])
+
+        throttle, sent = self.run_throttle(scenario, max_rate=0, max_pending=2)
+        self.assertEqual(sent, [[('a', 1, 3.0), ('b', 1, 4.0)]])
+        self.assertEqual((throttle.merged, throttle.dropped), (1, 1))
+
+    def test_discard_removes_pending_device(self):
+        async def scenario(throttle):
+            throttle.add([('a', 1, 1.0), ('b', 1, 2.0)])
+            throttle.discard('a')
+
+        _, sent = self.run_throttle(scenario, max_rate=0)
+        self.assertEqual(sent, [[('b', 1, 2.0)]])
+
+    def test_send_errors_are_counted_and_do_not_stop_sending(self):
+        calls = []
+
+        async def send(entries):
+            calls.append(entries)
+            if len(calls) == 1:
+                raise RuntimeError('client gone')
+
+        async def scenario(throttle):
+            throttle.add([('a', 1, 1.0), ('b', 1, 2.0)])
+            while throttle._task is not None:
+                await asyncio.sleep(0)
+            throttle.add([('a', 1, 3.0)])
+
+        with self.assertLogs('sensors.throttle', 'ERROR'):
+            throttle, sent = self.run_throttle(scenario, send=send, max_rate=0)
+        self.assertEqual(sent, [[('a', 1, 3.0)]])
+        self.assertEqual(throttle.stats()['failed'], 2)
+        self.assertEqual((throttle.sent_items, throttle.sent_messages), (1, 1))
+
+
+class SQLiteChannelLayerTests(SimpleTestCase):
+    """สอง layer บนไฟล์เดียวกันแทนสอง process"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'channels.sqlite3')
+
+    def layer(self, **config):
+        return SQLiteChannelLayer(self.path, **config)
+
+    def members(self):
+        with sqlite3.connect(self.path) as conn:
+            return set(conn.execute('SELECT group_name, channel FROM group_members'))
+
+    @staticmethod
+    async def nothing(layer, channel, timeout=0.1):
+        try:
+            await asyncio.wait_for(layer.receive(channel), timeout)
+        except asyncio.TimeoutError:
+            return True
+        return False
+
+    def test_send_receive(self):
+        async def run():
+            sender, receiver = self.layer(), self.layer()
+            local = await receiver.new_channel()
+            await sender.send(local, {'type': 'local', 'n': 1})
+            await sender.send('plain', {'type': 'plain', 'n': 2})
+            received = [await receiver.receive(local), await receiver.receive('plain')]
+            await receiver.close()
+            return received
+
+        self.assertEqual(async_to_sync(run)(), [{'type': 'local', 'n': 1}, {'type': 'plain', 'n': 2}])
+
+    def test_groups(self):
+        async def run():
+            sender, receiver = self.layer(), self.layer()
+            first, second = await receiver.new_channel(), await receiver.new_channel()
+            for channel in [first, second, 'plain']:
+                await receiver.group_add('devices', channel)
+            await sender.group_send('devices', {'type': 'reading', 'n': 1})
+            received = [await receiver.receive(channel) for channel in [first, second, 'plain']]
+
+            await receiver.group_discard('devices', second)
+            await receiver.group_discard('devices', 'plain')
+            await sender.group_send('devices', {'type': 'reading', 'n': 2})
+            received.append(await receiver.receive(first))
+            skipped = [await self.nothing(receiver, second), await self.nothing(receiver, 'plain')]
+            await receiver.close()
+            return first, received, skipped
+
+        first, received, skipped = async_to_sync(run)()
+        self.assertEqual([message['n'] for message in received], [1, 1, 1, 2])
+        self.assertEqual(skipped, [True, True])
+        self.assertEqual(self.members(), {('devices', first)})
+
+    def test_expired_messages_are_not_delivered(self):
+        async def run():
+            layer = self.layer(expiry=0.05)
+            local = await layer.new_channel()
+            await layer.close()  # ไม่ให้ poller ดึงข้อความก่อนหมดอายุ
+            await layer.send(local, {'type': 'late'})
+            await layer.send('plain', {'type': 'late'})
+            await asyncio.sleep(0.1)
+            return [await self.nothing(layer, local), await self.nothing(layer, 'plain')]
+
+        self.assertEqual(async_to_sync(run)(), [True, True])
+
+    def test_cleanup_drops_memberships(self):
+        """ข้อความหมดอายุของ channel หรือ process ใดนำ channel นั้นหรือทุก channel ของ process นั้นออกจากทุก group"""
+        async def run():
+            sender = self.layer(expiry=0.05)
+            receiver = self.layer(expiry=0.05)
+            first, second = await receiver.new_channel(), await receiver.new_channel()
+            await receiver.close()  # process ที่ไม่ได้รับข้อความแล้ว
+            await receiver.group_add('a', first)
+            await receiver.group_add('b', second)  # group b ไม่มีข้อความหมดอายุ
+            for channel in ['stale', 'alive']:
+                await sender.group_add('c', channel)
+            await sender.group_send('a', {'type': 'reading'})
+            await sender.send('stale', {'type': 'reading'})
+            await asyncio.sleep(0.1)
+            await sender._run(sender._cleanup)
+
+        async_to_sync(run)()
+        self.assertEqual(self.members(), {('c', 'alive')})
+
+    def test_group_membership_expires(self):
+        async def run():
+            layer = self.layer(group_expiry=0.05)
+            await layer.group_add('devices', 'plain')
+            await asyncio.sleep(0.1)
+            await layer.group_send('devices', {'type': 'reading'})
+            skipped = await self.nothing(layer, 'plain')
+            await layer._run(layer._cleanup)
+            return skipped
+
+        self.assertTrue(async_to_sync(run)())
+        self.assertEqual(self.members(), set())
+
+    def test_capacity(self):
+        async def run():
+            sender, receiver = self.layer(capacity=2), self.layer(capacity=2, max_poll_interval=0.005)
+            await sender.send('plain', {'n': 1})
+            await sender.send('plain', {'n': 2})
+            with self.assertRaises(ChannelFull):
+                await sender.send('plain', {'n': 3})
+
+            # channel ของ process: ข้อความที่ดึงเข้า queue แล้วไม่ถูกนับตอน send จึงถูกทิ้งตอนกระจายแทน
+            local = await receiver.new_channel()
+            for n in range(4):
+                await sender.send(local, {'n': n})
+                await asyncio.sleep(0.05)
+            received = [(await receiver.receive(local))['n'] for _ in range(2)]
+            received.append(await self.nothing(receiver, local))
+            await receiver.close()
+            return received
+
+        self.assertEqual(async_to_sync(run)(), [0, 1, True])
+
+
+class SQLiteStreamBufferTests(SimpleTestCase):
+    def test_shared_between_instances(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'channels.sqlite3')
+        writer, reader = SQLiteStreamBuffer(path, size=2), SQLiteStreamBuffer(path, size=2)
+        self.assertEqual(writer.epoch, reader.epoch)
+
+        for n in range(3):
+            self.assertEqual(writer.append('device', lambda seq: (('device', 1, str(seq), b''),))[0], n + 1)
+        self.assertEqual(reader.current('device'), 3)
+        self.assertEqual(reader.since('device', 3), (3, []))
+        self.assertEqual(reader.since('device', 1), (3, [('device', 1, '2', b''), ('device', 1, '3', b'')]))
+        self.assertEqual(reader.since('device', 0), (3, None))  # เก่ากว่า buffer
+        self.assertEqual(reader.since('device', 4), (3, None))
@@ -0,0 +1,100 @@
+"""
+จำกัดอัตราการส่งข้อมูลเซ็นเซอร์ของแต่ละการเชื่อมต่อ WebSocket
+
+ข้อมูลที่มาระหว่างรอส่งถูกรวมเหลือค่าล่าสุดต่อ (อุปกรณ์, ประเภทเซ็นเซอร์)
+แล้วส่งเป็นข้อความเดียวในรอบถัดไป ข้อมูลที่รอส่งของแต่ละการเชื่อมต่อจึงไม่เกิน
+``max_pending`` รายการ ไม่ว่าอุปกรณ์จะส่งถี่เพียงใดหรือ client จะรับช้าเพียงใด
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LatestValueThrottle:
+    """ส่งข้อมูลไม่เกิน ``max_rate`` ข้อความต่อวินาทีผ่าน ``send_func(entries)``
+
+    การส่งทำใน task แยก consumer จึงรับข้อความจาก channel layer ต่อได้
+    ระหว่างที่ client รับข้อมูลช้า ``max_rate`` เป็น 0 คือไม่จำกัดอัตรา
+    แต่ยังรวมข้อมูลที่มาระหว่างการส่งครั้งก่อน ข้อมูลที่ ``send_func`` ส่งไม่สำเร็จ
+    ถูกนับใน ``failed`` แล้วทิ้งไป
+    """
+
+    def __init__(self, send_func, max_rate=10, max_pending=1000):
+        self.send_func = send_func
+        self.interval = 1 / max_rate if max_rate > 0 else 0
+        self.max_pending = max_pending
+        self._pending = {}
+        self._next_send = 0.0
+        self._task = None
+
+        # สถิติ
+        self.received = 0
+        self.merged = 0       # ถูกแทนที่ด้วยค่าใหม่กว่าของเซ็นเซอร์เดียวกันก่อนส่ง
+        self.dropped = 0      # ถูกทิ้งเพราะมีเซ็นเซอร์รอส่งครบ max_pending แล้ว
+        self.failed = 0       # send_func ส่งไม่สำเร็จ
+        self.sent_items = 0
+        self.sent_messages = 0
+
+    def add(self, entries):
+        """รับ tuple ที่ขึ้นต้นด้วย (device_id, sensor_type_id) แล้วนัดส่งรอบถัดไป
+
+        entry ถูกส่งต่อให้ ``send_func`` ตามที่ได้รับ (ดู reading_messages)
+        """
+        for entry in entries:
+            self.received += 1
+            key = (entry[0], entry[1])
+            if self._pending.pop(key, None) is not None:
+                self.merged += 1
+            elif len(self._pending) >= self.max_pending:
+                # ทิ้งเซ็นเซอร์ที่รอนานที่สุด
+                del self._pending[next(iter(self._pending))]
+                self.dropped += 1
+            self._pending[key] = entry
+
+        if self._pending and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self._pending:
+                delay = self._next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                entries = list(self._pending.values())
+                self._pending.clear()
+                self._next_send = time.monotonic() + self.interval
+                try:
+                    await self.send_func(entries)
+                except Exception:
+                    # ไม่มีใครรอผลของ task นี้ จึงต้องจัดการ exception เอง
+                    logger.exception("ส่งข้อมูลเซ็นเซอร์ %d รายการไม่สำเร็จ", len(entries))
+                    self.failed += len(entries)
+                else:
+                    self.sent_items += len(entries)
+                    self.sent_messages += 1
+        finally:
+            self._task = None
+
+    def discard(self, device_id):
+        """ทิ้งข้อมูลที่รอส่งของอุปกรณ์ (เมื่อ client เลิกติดตาม)"""
+        for key in [key for key in self._pending if key[0] == device_id]:
+            del self._pending[key]
+
+    def close(self):
+        """ยกเลิกการส่งที่ค้างอยู่ (เรียกเมื่อการเชื่อมต่อปิด)"""
+        if self._task is not None:
+            self._task.cancel()
+        self._pending.clear()
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'pending': len(self._pending),
+            'sent_items': self.sent_items,
+            'sent_messages': self.sent_messages,
+        }
@@ -0,0 +1,80 @@
+"""
+ตัวช่วยสำหรับ INSERT ... ON CONFLICT DO UPDATE หลายแถว (SQLite 3.24+ / PostgreSQL)
+"""
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+NUMERIC_FIELDS = {
+    'FloatField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+    'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField',
+}
+
+
+def _preparer(field, db):
+    """ฟังก์ชันแปลงค่าของ ``field`` เป็นค่าของฐานข้อมูล
+
+    int/float ของ field ตัวเลขส่งไปตรง ๆ ส่วนค่าอื่นจำผลการแปลงไว้
+    เพราะ foreign key และเวลาของ bucket ซ้ำกันมากในชุดเดียวกัน
+    """
+    numeric = field.get_internal_type() in NUMERIC_FIELDS
+    cache = {}
+
+    def prepare(value):
+        if numeric and type(value) in (int, float):
+            return value
+        try:
+            return cache[value]
+        except KeyError:
+            prepared = cache[value] = field.get_db_prep_save(value, db)
+            return prepared
+        except TypeError:  # ค่าที่ hash ไม่ได้ เช่น dict ของ JSONField
+            return field.get_db_prep_save(value, db)
+
+    return prepare
+
+
+def bulk_upsert(model, field_names, rows, conflict_fields, updates, where=None):
+    """upsert หลายแถวด้วยคำสั่งเดียวผ่าน executemany
+
+    ``updates`` เป็น dict ของชื่อ field -> นิพจน์ SQL โดยใช้ ``{table}`` แทนแถวเดิม
+    และ ``excluded`` แทนแถวใหม่ เช่น ``'{table}."count" + excluded."count"'``
+    """
+    if not rows:
+        return
+
+    # ใช้ connection จริงแทน proxy ``connection`` ซึ่งค้น thread-local ทุกครั้งที่อ่าน attribute
+    db = connections[DEFAULT_DB_ALIAS]
+    opts = model._meta
+    qn = db.ops.quote_name
+    table = qn(opts.db_table)
+    fields = [opts.get_field(name) for name in field_names]
+    columns = ', '.join(qn(field.column) for field in fields)
+    conflict_columns = ', '.join(qn(opts.get_field(name).column) for name in conflict_fields)
+    assignments = ', '.join(
+        f"{qn(opts.get_field(name).column)} = {expression.format(table=table)}"
+        for name, expression in updates.items()
+    )
+
+    sql = (
+        f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(fields))}) "
+        f"ON CONFLICT ({conflict_columns}) DO UPDATE SET {assignments}"
+    )
+    if where:
+        sql += f" WHERE {where.format(table=table)}"
+
+    preparers = [_preparer(field, db) for field in fields]
+    params = [
+        [prepare(value) for prepare, value in zip(preparers, row)]
+        for row in rows
+    ]
+    with db.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def least_function():
+    """ชื่อฟังก์ชันหาค่าน้อยสุดระหว่างสองค่าของฐานข้อมูลที่ใช้อยู่"""
+    return 'LEAST' if connection.vendor == 'postgresql' else 'MIN'
+
+
+def greatest_function():
+    """ชื่อฟังก์ชันหาค่ามากสุดระหว่างสองค่าของฐานข้อมูลที่ใช้อยู่"""
+    return 'GREATEST' if connection.vendor == 'postgresql' else 'MAX'
@@ -1,22 +1,29 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from .models import Device, SensorData, SensorType
-from django.db.models import Max, Min, Avg
-from datetime import datetime, timedelta
+from django.utils import timezone
+from .models import Device, SensorType, DeviceLatestReading
+from .rollups import range_stats
+from .history import recent_readings
+from datetime import timedelta
 import json
 
 
 @login_required
 def dashboard(request):
     """หน้า Dashboard หลัก"""
-    devices = Device.objects.filter(owner=request.user, is_active=True)
+    devices = list(Device.objects.filter(owner=request.user, is_active=True))
+    
+    # เพิ่มข้อมูลเซ็นเซอร์ล่าสุดให้แต่ละ device (query เดียวสำหรับทุกอุปกรณ์)
+    latest_by_device = {}
+    latest_readings = DeviceLatestReading.objects.filter(
+        device__in=devices
+    ).select_related('sensor_type')
+    for latest in latest_readings:
+        latest_by_device.setdefault(latest.device_id, []).append(latest)
     
-    # เพิ่มข้อมูลเซ็นเซอร์ล่าสุดให้แต่ละ device
     for device in devices:
-        device.latest_sensor_data = SensorData.objects.filter(
-            device=device
-        ).select_related('sensor_type').order_by('-timestamp')[:3]
+        device.latest_sensor_data = latest_by_device.get(device.id, [])
     
     context = {
         'devices': devices,
@@ -29,15 +36,13 @@ def device_detail(request, device_id):
     """หน้ารายละเอียดอุปกรณ์"""
     device = get_object_or_404(Device, id=device_id, owner=request.user)
     
-    # ข้อมูลล่าสุด 3 รายการ
-    latest_data = SensorData.objects.filter(
+    # ข้อมูลล่าสุดของแต่ละเซ็นเซอร์
+    latest_data = DeviceLatestReading.objects.filter(
         device=device
-    ).select_related('sensor_type').order_by('-timestamp')[:3]
+    ).select_related('sensor_type')
     
     # ข้อมูลย้อนหลัง 20 รายการล่าสุด
-    all_data = SensorData.objects.filter(
-        device=device
-    ).select_related('sensor_type').order_by('-timestamp')[:20]
+    all_data = recent_readings(device.id, 20)
     
     context = {
         'device': device,
@@ -52,26 +57,19 @@ def api_stats(request, device_id):
     """API สำหรับข้อมูลสถิติ"""
     device = get_object_or_404(Device, id=device_id, owner=request.user)
     
-    # ข้อมูล 24 ชั่วโมงล่าสุด
-    yesterday = datetime.now() - timedelta(days=1)
-    data_24h = SensorData.objects.filter(
-        device=device,
-        timestamp__gte=yesterday
-    ).values('sensor_type__name', 'sensor_type__unit').annotate(
-        max_value=Max('value'),
-        min_value=Min('value'),
-        avg_value=Avg('value'),
-        count=Max('id')  # ใช้เป็น count แทน
-    )
+    # ข้อมูล 24 ชั่วโมงล่าสุด อ่านจากตาราง rollup แทนข้อมูลดิบ
+    now = timezone.now()
+    data_24h = range_stats(device, now - timedelta(days=1), now)
     
     stats = {}
     for item in data_24h:
-        sensor_name = item['sensor_type__name']
+        sensor_name = item['sensor_type']
         stats[sensor_name] = {
-            'max': round(item['max_value'], 2),
-            'min': round(item['min_value'], 2),
-            'avg': round(item['avg_value'], 2),
-            'unit': item['sensor_type__unit']
+            'max': round(item['max'], 2),
+            'min': round(item['min'], 2),
+            'avg': round(item['avg'], 2),
+            'count': item['count'],
+            'unit': item['unit']
         }
     
-    return JsonResponse(stats)
\ No newline at end of file
+    return JsonResponse(stats)